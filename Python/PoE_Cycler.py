@@ -19,21 +19,32 @@ from typing import Optional
 import csv
 import getpass
 import logging
+import math
 import re
 import sys
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
 from datetime import datetime
 from threading import Lock
 
 import netmiko
 from netmiko import ConnectHandler
 
+from ssh_preflight import AUTH_CHECK_LIMIT, UNREACHABLE, AuthFailed, preflight, sweep
+
 logging.getLogger("paramiko").setLevel(logging.CRITICAL)
 logging.getLogger("netmiko").setLevel(logging.CRITICAL)
 
 print_lock = Lock()
 DEFAULT_POE_DELAY = 30  # seconds between power inline never → power inline auto
+MAX_WORKERS = 10        # concurrent SSH sessions per phase
+DEFAULT_VERIFY_DEADLINE = 120  # seconds after restore to wait for devices to draw power again
+VERIFY_INTERVAL_MIN = 2.0      # poll quickly while ports are still coming up…
+VERIFY_INTERVAL_MAX = 15.0     # …and back off while nothing changes
+WAVE_BUDGET_SHARE = 0.5        # each restore wave may claim this share of a member's free PoE budget
+WAVE_GAP = 5.0                 # seconds between waves on the same stack member (class negotiation)
+PORT_DEFAULT_W = 15.4          # assumed draw for a port that wasn't drawing power before the cycle
 
 # Physical interface prefixes to act on
 PHYSICAL_PREFIXES = (
@@ -86,70 +97,250 @@ def get_hostname(conn) -> str:
         return "unknown"
 
 
-def parse_mac_table(output: str, vlans: list[str]) -> dict[str, list[str]]:
+# Lines like:  261    f8dc.7a82.cba4    DYNAMIC     Gi1/0/3
+MAC_ENTRY = re.compile(
+    r'^\s*(\d+)\s+([0-9a-f]{4}\.[0-9a-f]{4}\.[0-9a-f]{4})\s+(DYNAMIC|STATIC)\s+(\S+)',
+    re.IGNORECASE | re.MULTILINE,
+)
+# Footer IOS-XE prints after the last entry — missing means the output was cut short
+MAC_TABLE_FOOTER = re.compile(r'^\s*Total Mac Addresses', re.IGNORECASE | re.MULTILINE)
+MAC_FILTER_MAX_VLANS = 40  # beyond this the | include pattern gets unwieldy; pull the whole table
+
+
+def parse_mac_table(output: str, vlans: list[str]) -> dict[str, dict[str, list[str]]]:
     """
-    Parse 'show mac address-table vlan <N>' output.
-    Returns {interface: [mac, ...]} for locally-learned (DYNAMIC/STATIC) entries
-    on physical interfaces only.
+    Parse 'show mac address-table' output in one pass.
+    Returns {vlan: {interface: [mac, ...]}} for locally-learned (DYNAMIC/STATIC)
+    entries on physical interfaces only, for the requested VLANs.
     """
-    iface_macs: dict[str, list[str]] = {}
+    wanted = set(vlans)
+    index: dict[str, dict[str, list[str]]] = {}
 
-    for line in output.splitlines():
-        # Match lines like:  261    f8dc.7a82.cba4    DYNAMIC     Gi1/0/3
-        m = re.match(
-            r'^\s*(\d+)\s+([0-9a-f]{4}\.[0-9a-f]{4}\.[0-9a-f]{4})\s+'
-            r'(DYNAMIC|STATIC)\s+(\S+)',
-            line, re.IGNORECASE
-        )
-        if not m:
+    for m in MAC_ENTRY.finditer(output):
+        vlan_id, mac, _type, port = m.groups()
+        if vlan_id not in wanted or not is_physical(port):
             continue
-        vlan_id, mac, _type, port = m.group(1), m.group(2), m.group(3), m.group(4)
+        index.setdefault(vlan_id, {}).setdefault(port, []).append(mac)
 
-        if vlan_id not in vlans:
-            continue
-        if not is_physical(port):
-            continue
+    return index
 
-        iface_macs.setdefault(port, []).append(mac)
 
-    return iface_macs
+def get_mac_index(conn, vlans: list[str]) -> dict[str, dict[str, list[str]]]:
+    """
+    Pull the MAC table once for all target VLANs (filtered with | include so
+    only matching rows cross the wire) and index it per VLAN / interface.
+    If the footer is missing the platform truncated the output, so fall back
+    to one 'show mac address-table vlan N' per VLAN.
+    """
+    if len(vlans) == 1:
+        output = conn.send_command(f"show mac address-table vlan {vlans[0]}", read_timeout=30)
+        return parse_mac_table(output, vlans)
 
+    if len(vlans) <= MAC_FILTER_MAX_VLANS:
+        command = f"show mac address-table | include ^ *({'|'.join(vlans)}) |Total Mac"
+    else:
+        command = "show mac address-table"
+    output = conn.send_command(command, read_timeout=60)
+    if MAC_TABLE_FOOTER.search(output):
+        return parse_mac_table(output, vlans)
+
+    index: dict[str, dict[str, list[str]]] = {}
+    for vlan in vlans:
+        output = conn.send_command(f"show mac address-table vlan {vlan}", read_timeout=30)
+        index.update(parse_mac_table(output, [vlan]))
+    return index
+
+
+# Lines like:  Gi1/0/3   auto   on    15.4    IP Phone 8845     4     30.0
+POWER_INLINE_ROW = re.compile(
+    r'^(\S+)\s+(\S+)\s+(on|off|faulty|power-deny|err-disable)\s+([\d.]+)\s+(.*?)\s+(\S+)\s+([\d.]+)\s*$',
+    re.IGNORECASE | re.MULTILINE,
+)
+POWER_FILTER_MAX_PORTS = 48  # one switch's worth of ports in the | include alternation; past that, read it all
 
-def cycle_poe(conn, interfaces: list[str], delay: int) -> list[dict]:
+
+def parse_power_inline(output: str) -> dict[str, tuple[str, str]]:
     """
-    Power down all interfaces at once, wait delay seconds once, then power all back up.
-    Returns a list of result dicts per interface.
+    Parse 'show power inline' output.
+    Returns {interface: (oper, class)} — a port is back when oper is 'on'
+    and a class has been detected (not 'n/a').
     """
-    # Down all ports in one config block
+    return {m.group(1): (m.group(3).lower(), m.group(6)) for m in POWER_INLINE_ROW.finditer(output)}
+
+
+# Module summary lines like:  1   1170.0   120.0   1050.0
+POWER_INLINE_MODULE = re.compile(
+    r'^\s*(\d+)\s+([\d.]+)\s+([\d.]+)\s+([\d.]+)\s*$',
+    re.MULTILINE,
+)
+MEMBER = re.compile(r'^[A-Za-z]+(\d+)/')
+
+
+def plan_waves(output: str, interfaces: list[str]) -> list[list[str]]:
+    """
+    Split interfaces into restore waves from a pre-cycle 'show power inline'.
+    Per stack member, a wave holds ports whose pre-cycle draw (PORT_DEFAULT_W
+    if idle) fits in WAVE_BUDGET_SHARE of the member's free budget once our
+    ports are off. Wave N of every member goes out together, so members
+    restore in parallel while each one only takes on a budget-sized step at
+    a time. No module summary (non-PoE or unparsed) means a single wave.
+    """
+    remaining = {m.group(1): float(m.group(4)) for m in POWER_INLINE_MODULE.finditer(output)}
+    if not remaining:
+        return [interfaces]
+    draw = {m.group(1): float(m.group(4)) for m in POWER_INLINE_ROW.finditer(output)}
+
+    by_member: dict[str, list[str]] = {}
+    for iface in interfaces:
+        m = MEMBER.match(iface)
+        by_member.setdefault(m.group(1) if m else "", []).append(iface)
+
+    member_waves: list[list[list[str]]] = []
+    for member, ports in by_member.items():
+        watts = {iface: draw.get(iface) or PORT_DEFAULT_W for iface in ports}
+        free  = remaining.get(member, 0.0) + sum(draw.get(iface, 0.0) for iface in ports)
+        cap   = max(WAVE_BUDGET_SHARE * free, max(watts.values()))
+        waves: list[list[str]] = [[]]
+        used = 0.0
+        for iface in ports:
+            if waves[-1] and used + watts[iface] > cap:
+                waves.append([])
+                used = 0.0
+            waves[-1].append(iface)
+            used += watts[iface]
+        member_waves.append(waves)
+
+    depth = max(len(w) for w in member_waves)
+    return [[iface for waves in member_waves if n < len(waves) for iface in waves[n]]
+            for n in range(depth)]
+
+
+def get_power_inline(conn, interfaces: list[str]) -> dict[str, tuple[str, str]]:
+    """One 'show power inline' per switch, filtered to the cycled ports when the list is short."""
+    if len(interfaces) <= POWER_FILTER_MAX_PORTS:
+        # IOS '_' matches the space after the name (Gi1/0/1 must not pull in
+        # Gi1/0/10-19); a literal trailing space would be stripped by Netmiko
+        output = conn.send_command(f"show power inline | include ^({'|'.join(interfaces)})_", read_timeout=30)
+    else:
+        output = conn.send_command("show power inline", read_timeout=30)
+    return parse_power_inline(output)
+
+
+def power_down(conn, interfaces: list[str]) -> Optional[str]:
+    """Power down all interfaces in one config block. Returns an error string or None."""
     down_cmds = []
     for iface in interfaces:
         down_cmds += [f"interface {expand_interface(iface)}", "power inline never"]
     try:
         conn.send_config_set(down_cmds)
+        return None
     except Exception as e:
-        return [{"interface": iface, "status": "ERROR", "detail": str(e)} for iface in interfaces]
+        return str(e)
 
-    # Single wait for all devices to power down
-    time.sleep(delay)
 
-    # Bring all ports back up
-    results = []
+def power_up(conn, interfaces: list[str]) -> list[dict]:
+    """
+    Bring the interfaces back to 'power inline auto' in one config block
+    (one restore wave). Returns a result dict per interface — all ERROR if
+    the block fails, since it can't tell which stanzas were applied.
+    """
+    up_cmds = []
     for iface in interfaces:
-        full_iface = expand_interface(iface)
-        try:
-            conn.send_config_set([
-                f"interface {full_iface}",
-                "power inline auto",
-            ])
-            results.append({"interface": iface, "status": "CYCLED"})
-        except Exception as e:
-            results.append({"interface": iface, "status": "ERROR", "detail": str(e)})
+        up_cmds += [f"interface {expand_interface(iface)}", "power inline auto"]
+    try:
+        conn.send_config_set(up_cmds)
+    except Exception as e:
+        return [{"interface": iface, "status": "ERROR", "detail": str(e)} for iface in interfaces]
+    return [{"interface": iface, "status": "CYCLED"} for iface in interfaces]
+
 
-    return results
+# ─────────────────────────────────────────────────────────────────────────────
+# Fleet scheduler
+# ─────────────────────────────────────────────────────────────────────────────
+
+@dataclass
+class RestoreJob:
+    """A switch whose interfaces are powered down and waiting for their restore time."""
+    host: str
+    hostname: str
+    interfaces: list[str]
+    conn: object                 # retained Netmiko session, reused for the restore if still alive
+    due: float = 0.0             # time.monotonic() when the next step (restore wave or poll) runs
+    waves: list[list[str]] = field(default_factory=list)  # restore waves still to send
+    results: list[dict] = field(default_factory=list)
+    wave_at: dict[str, float] = field(default_factory=dict)  # interface → when its wave was restored
+    restored_at: float = 0.0     # set once the last wave is accepted; later wheel hits are polls
+    deadline: float = 0.0
+    interval: float = VERIFY_INTERVAL_MIN
+    power_on: dict[str, float] = field(default_factory=dict)  # interface → seconds from restore to powered
+    state: dict[str, str] = field(default_factory=dict)       # interface → last oper/class seen
+
+    def pending(self) -> list[str]:
+        """Cycled interfaces not yet seen drawing power."""
+        return [r["interface"] for r in self.results
+                if r["status"] == "CYCLED" and r["interface"] not in self.power_on]
+
+
+class TimerWheel:
+    """
+    Hashed timer wheel with fixed ticks: scheduling is O(1) and the scheduler
+    only wakes once per tick to collect what expired, however many switches
+    are waiting.
+    """
+
+    def __init__(self, tick: float = 1.0, slots: int = 64):
+        self.tick   = tick
+        self.slots: list[list[tuple[int, RestoreJob]]] = [[] for _ in range(slots)]
+        self.origin = time.monotonic()
+        self.cursor = 0          # next tick to collect
+        self.count  = 0
+
+    def __len__(self) -> int:
+        return self.count
+
+    def schedule(self, job: RestoreJob) -> None:
+        tick = max(self.cursor, math.ceil((job.due - self.origin) / self.tick))
+        self.slots[tick % len(self.slots)].append((tick, job))
+        self.count += 1
+
+    def expired(self, now: float) -> list[RestoreJob]:
+        """Jobs whose tick has passed — each slot is visited once per tick."""
+        due_jobs = []
+        last = math.floor((now - self.origin) / self.tick)
+        while self.cursor <= last:
+            slot  = self.slots[self.cursor % len(self.slots)]
+            ready = [job for tick, job in slot if tick <= self.cursor]
+            slot[:] = [(tick, job) for tick, job in slot if tick > self.cursor]
+            due_jobs.extend(ready)
+            self.cursor += 1
+        self.count -= len(due_jobs)
+        return due_jobs
+
+    def until_next_tick(self, now: float) -> float:
+        return max(0.0, self.origin + self.cursor * self.tick - now)
+
+
+def connect_switch(host: str, username: str, password: str):
+    device = {
+        "device_type": "cisco_ios",
+        "host": host,
+        "username": username,
+        "password": password,
+        "timeout": 30,
+        "session_log": None,
+    }
+    return ConnectHandler(**device)
+
+
+def disconnect_quietly(conn) -> None:
+    try:
+        conn.disconnect()
+    except Exception:
+        pass
 
 
 # ─────────────────────────────────────────────────────────────────────────────
-# Per-device worker
+# Per-device workers
 # ─────────────────────────────────────────────────────────────────────────────
 
 def get_trunk_interfaces(conn) -> set:
@@ -167,88 +358,227 @@ def get_trunk_interfaces(conn) -> set:
     return trunks
 
 
-def process_device(host: str, username: str, password: str,
-                   vlans: list[str], delay: int) -> tuple:
+def discover_and_power_down(host: str, username: str, password: str,
+                            vlans: list[str], delay: int, conn=None) -> tuple:
     """
-    SSH into one switch, find locally-learned physical interfaces for the
-    target VLANs, exclude trunk ports, and cycle PoE.
-    Returns (host, hostname, results, error).
+    Phase 1 — SSH into one switch, find locally-learned physical interfaces
+    for the target VLANs, exclude trunk ports, and power them down.
+    Returns (host, hostname, job, results, error): job is the RestoreJob to
+    schedule (session kept open), results are per-interface errors if the
+    power-down itself failed. conn is an already-open session to reuse (the
+    credential preflight's); it is replaced if it has dropped since.
     """
-    device = {
-        "device_type": "cisco_ios",
-        "host": host,
-        "username": username,
-        "password": password,
-        "timeout": 30,
-        "session_log": None,
-    }
-
+    if conn is not None:
+        try:
+            conn.find_prompt()
+        except Exception:
+            disconnect_quietly(conn)
+            conn = None
     try:
-        with ConnectHandler(**device) as conn:
-            hostname = get_hostname(conn)
+        conn = conn or connect_switch(host, username, password)
+        hostname = get_hostname(conn)
+
+        # Pull trunk interfaces first — never touch these
+        trunk_ifaces = get_trunk_interfaces(conn)
 
-            # Pull trunk interfaces first — never touch these
-            trunk_ifaces = get_trunk_interfaces(conn)
+        all_iface_macs: dict[str, list[str]] = {}
 
-            all_iface_macs: dict[str, list[str]] = {}
+        for vlan_ifaces in get_mac_index(conn, vlans).values():
+            for iface, macs in vlan_ifaces.items():
+                if iface in trunk_ifaces:
+                    continue  # skip trunks/uplinks
+                all_iface_macs.setdefault(iface, []).extend(macs)
 
-            for vlan in vlans:
-                output = conn.send_command(
-                    f"show mac address-table vlan {vlan}",
-                    read_timeout=30,
-                )
-                parsed = parse_mac_table(output, vlans)
-                for iface, macs in parsed.items():
-                    if iface in trunk_ifaces:
-                        continue  # skip trunks/uplinks
-                    all_iface_macs.setdefault(iface, []).extend(macs)
+        if not all_iface_macs:
+            disconnect_quietly(conn)
+            return host, hostname, None, [], None  # nothing to cycle
 
-            if not all_iface_macs:
-                return host, hostname, [], None  # nothing to cycle
+        interfaces = sorted(all_iface_macs.keys())
+        # Budget/draw snapshot before the cycle, used to size the restore waves
+        waves = plan_waves(conn.send_command("show power inline", read_timeout=30), interfaces)
+        error = power_down(conn, interfaces)
+        if error:
+            disconnect_quietly(conn)
+            return host, hostname, None, [
+                {"interface": iface, "status": "ERROR", "detail": error} for iface in interfaces
+            ], None
 
-            interfaces = sorted(all_iface_macs.keys())
-            results = cycle_poe(conn, interfaces, delay)
-            return host, hostname, results, None
+        job = RestoreJob(host, hostname, interfaces, conn, due=time.monotonic() + delay, waves=waves)
+        return host, hostname, job, [], None
 
     except netmiko.exceptions.AuthenticationException:
-        return host, "unknown", [], "Authentication failed"
+        error = "Authentication failed"
     except netmiko.exceptions.NetmikoTimeoutException:
-        return host, "unknown", [], "Timeout / unreachable"
+        error = "Timeout / unreachable"
     except Exception as e:
-        return host, "unknown", [], str(e)
+        error = str(e)
+    if conn:
+        disconnect_quietly(conn)
+    return host, "unknown", None, [], error
+
+
+def restore_power(job: RestoreJob, username: str, password: str, keep_open: bool = False) -> bool:
+    """
+    Phase 2 — 'power inline auto' on the job's next wave over the retained
+    session, or a fresh one if it has dropped during the delay.
+    Returns True once the last wave is done; otherwise job.due is set for the
+    next wave WAVE_GAP from now. With keep_open the session stays on the job
+    for the verification polls.
+    """
+    conn = job.conn
+    try:
+        conn.find_prompt()
+    except Exception:
+        disconnect_quietly(conn)
+        try:
+            conn = connect_switch(job.host, username, password)
+        except Exception as e:
+            detail = f"Reconnect for restore failed ({e}) — port left at 'power inline never'"
+            job.results += [{"interface": iface, "status": "ERROR", "detail": detail}
+                            for wave in job.waves for iface in wave]
+            job.waves = []
+            job.restored_at = time.monotonic()
+            return True
+    job.conn = conn
+
+    wave = job.waves.pop(0)
+    job.results += power_up(conn, wave)
+    now = time.monotonic()
+    job.wave_at.update(dict.fromkeys(wave, now))
+    if job.waves:
+        job.due = now + WAVE_GAP
+        return False
+
+    job.restored_at = now
+    if not (keep_open and job.pending()):
+        disconnect_quietly(conn)
+    return True
+
+
+def poll_power(job: RestoreJob) -> bool:
+    """
+    Phase 3 (optional) — one batched 'show power inline' for the switch.
+    Records time-to-power-on for ports that came back and adapts the poll
+    interval: reset to the minimum on progress, doubled while nothing moves.
+    Returns True when the job is finished (all ports up, deadline passed,
+    or the poll failed) and its session has been closed.
+    """
+    pending = job.pending()
+    try:
+        states = get_power_inline(job.conn, pending)
+    except Exception as e:
+        for iface in pending:
+            job.state[iface] = f"unverified ({e})"
+        disconnect_quietly(job.conn)
+        return True
+
+    now = time.monotonic()
+    progressed = False
+    for iface in pending:
+        oper, cls = states.get(iface, ("missing", "n/a"))
+        job.state[iface] = oper if cls.lower() == "n/a" else f"{oper} class {cls}"
+        if oper == "on" and cls.lower() != "n/a":
+            job.power_on[iface] = round(now - job.wave_at[iface], 1)
+            progressed = True
+
+    if not job.pending() or now >= job.deadline:
+        disconnect_quietly(job.conn)
+        return True
+    job.interval = VERIFY_INTERVAL_MIN if progressed else min(job.interval * 2, VERIFY_INTERVAL_MAX)
+    job.due = min(now + job.interval, job.deadline)
+    return False
+
+
+def run_fleet(hosts: list[str], username: str, password: str, vlans: list[str], delay: int,
+              on_discovered, on_restored, verify: Optional[int] = None, on_verified=None,
+              sessions: Optional[dict] = None) -> None:
+    """
+    Two-phase scheduler. Discovery + power-down runs for every switch on one
+    pool; each powered-down switch goes on a timer wheel and is restored on a
+    second pool as soon as its delay expires, one budget-sized wave per
+    WAVE_GAP (see plan_waves). No worker ever sleeps, so total runtime is
+    roughly discovery time plus one delay plus the deepest wave schedule.
+    With verify (seconds), restored switches go back on the wheel and are
+    polled with 'show power inline' until their ports draw power or the
+    deadline passes.
+    on_discovered(host, hostname, job, results, error), on_restored(job, results)
+    and on_verified(job) are called on this thread. sessions maps host → an
+    open session to use for its discovery instead of connecting again.
+    """
+    sessions = dict(sessions or {})
+    wheel = TimerWheel()
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as discover_pool, \
+            ThreadPoolExecutor(max_workers=MAX_WORKERS) as restore_pool:
+        discovering = {discover_pool.submit(discover_and_power_down, h, username, password, vlans, delay,
+                                            sessions.pop(h, None))
+                       for h in hosts}
+        restoring: dict = {}
+
+        while discovering or restoring or len(wheel):
+            now     = time.monotonic()
+            timeout = wheel.until_next_tick(now) if len(wheel) else None
+            pending = discovering | set(restoring)
+            if pending:
+                done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            else:
+                time.sleep(timeout)  # only timers left — the scheduler waits, not a worker
+                done = set()
+
+            for f in done:
+                if f in discovering:
+                    discovering.discard(f)
+                    host, hostname, job, results, error = f.result()
+                    if job:
+                        wheel.schedule(job)
+                    on_discovered(host, hostname, job, results, error)
+                else:
+                    step, job = restoring.pop(f)
+                    if step == "restore" and not f.result():
+                        wheel.schedule(job)  # next wave
+                    elif step == "restore":
+                        # last wave restored — start polling if anything was cycled
+                        on_restored(job, job.results)
+                        if verify and job.pending():
+                            job.deadline = job.restored_at + verify
+                            job.due = time.monotonic() + job.interval
+                            wheel.schedule(job)
+                        elif verify:
+                            on_verified(job)
+                    elif f.result():
+                        on_verified(job)
+                    else:
+                        wheel.schedule(job)
+
+            for job in wheel.expired(time.monotonic()):
+                if job.restored_at:
+                    restoring[restore_pool.submit(poll_power, job)] = ("poll", job)
+                else:
+                    restoring[restore_pool.submit(restore_power, job, username, password, bool(verify))] = ("restore", job)
 
 
 # ─────────────────────────────────────────────────────────────────────────────
 # Credential preflight
 # ─────────────────────────────────────────────────────────────────────────────
 
-def validate_credentials(hosts: list[str], username: str, password: str) -> bool:
-    """Test credentials against up to 5 reachable switches. Exit on auth failure."""
-    print("  Verifying credentials (checking up to 5 switches)...")
-    tested = 0
-    for host in hosts[:5]:
-        device = {
-            "device_type": "cisco_ios",
-            "host": host,
-            "username": username,
-            "password": password,
-            "timeout": 15,
-        }
-        try:
-            with ConnectHandler(**device) as conn:
-                conn.find_prompt()
-            print(f"  [✓] Credentials OK (verified against {host})\n")
-            return True
-        except netmiko.exceptions.AuthenticationException:
-            print(f"\n  ERROR: Authentication failed on {host}.")
-            print("  Please re-run with the correct credentials.\n")
-            sys.exit(1)
-        except Exception:
-            tested += 1
-            continue
+def validate_credentials(hosts: list[str], username: str, password: str) -> tuple[Optional[str], object]:
+    """
+    Probe up to AUTH_CHECK_LIMIT switches concurrently and test credentials on
+    the first one that answers. Exit on auth failure.
+    Returns (host, session) so discovery can reuse the session for that host.
+    """
+    print(f"  Verifying credentials (probing up to {AUTH_CHECK_LIMIT} switches)...")
+    try:
+        host, conn = preflight(hosts, lambda h: connect_switch(h, username, password))
+    except AuthFailed as e:
+        print(f"\n  ERROR: Authentication failed on {e.host}.")
+        print("  Please re-run with the correct credentials.\n")
+        sys.exit(1)
 
-    print("  WARNING: All preflight targets unreachable — proceeding anyway.\n")
-    return True
+    if host:
+        print(f"  [✓] Credentials OK (verified against {host})\n")
+    else:
+        print("  WARNING: All preflight targets unreachable — proceeding anyway.\n")
+    return host, conn
 
 
 # ─────────────────────────────────────────────────────────────────────────────
@@ -268,6 +598,11 @@ def main() -> None:
         "-s", metavar="HOST[,HOST,...]",
         help="One or more switch IPs, comma-separated"
     )
+    parser.add_argument(
+        "--verify", metavar="SECONDS", type=int, nargs="?", const=DEFAULT_VERIFY_DEADLINE,
+        help=f"After restore, poll 'show power inline' until cycled ports draw power again "
+             f"(deadline, default {DEFAULT_VERIFY_DEADLINE}s)"
+    )
     args = parser.parse_args()
 
     print()
@@ -289,6 +624,15 @@ def main() -> None:
         print("\n  ERROR: No targets found.\n")
         sys.exit(1)
 
+    # ── Reachability pre-sweep ────────────────────────────────────────────────
+    # Dead switches are dropped here, in one probe window, instead of each
+    # costing a worker a full SSH timeout later.
+    print(f"  Probing TCP/22 on {len(hosts)} switch(es)...")
+    hosts, unreachable = sweep(hosts)
+    for h in unreachable:
+        print(f"  [✗] {h}  →  {UNREACHABLE}")
+    print()
+
     # ── VLAN prompt ───────────────────────────────────────────────────────────
     vlan_input = input("  VLANs to cycle (comma-separated, e.g. 10,20): ").strip()
     vlans = [v.strip() for v in vlan_input.split(",") if v.strip()]
@@ -303,8 +647,6 @@ def main() -> None:
     password = getpass.getpass("  Password: ")
     print()
 
-    validate_credentials(hosts, username, password)
-
     # ── PoE delay ─────────────────────────────────────────────────────────────
     delay_input = input(
         f"  PoE cycle delay (seconds between 'never' → 'auto') [{DEFAULT_POE_DELAY}s default]: "
@@ -317,12 +659,19 @@ def main() -> None:
             delay = DEFAULT_POE_DELAY
     else:
         delay = DEFAULT_POE_DELAY
-
     print()
-    print(f"  Targets  : {len(hosts)} switch(es)")
+
+    # Log in only once every prompt is answered, so the preflight session
+    # handed to discovery hasn't sat idle behind the operator
+    preflight_host, preflight_conn = validate_credentials(hosts, username, password)
+    sessions = {preflight_host: preflight_conn} if preflight_host else {}
+
+    print(f"  Targets  : {len(hosts)} switch(es)" + (f" ({len(unreachable)} unreachable)" if unreachable else ""))
     print(f"  VLANs    : {', '.join(vlans)}")
     print(f"  PoE delay: {delay}s")
-    print(f"  Threads  : 10")
+    print(f"  Threads  : {MAX_WORKERS} discovery + {MAX_WORKERS} restore")
+    if args.verify:
+        print(f"  Verify   : up to {args.verify}s after restore")
     print()
 
     # ── Run ───────────────────────────────────────────────────────────────────
@@ -330,51 +679,72 @@ def main() -> None:
     csv_path = f"poe_cycler_{timestamp}.csv"
 
     all_rows: list[dict] = []
-    errors: list[tuple[str, str]] = []
-    completed = 0
+    errors: list[tuple[str, str]] = [(h, UNREACHABLE) for h in unreachable]
+    discovered = 0
+    restored = 0
+    waiting = 0
     total = len(hosts)
 
-    def run_and_report(host: str):
-        nonlocal completed
-        h, hostname, results, error = process_device(
-            host, username, password, vlans, delay
-        )
-        completed += 1
-
+    def add_rows(h: str, hostname: str, results: list[dict], job: Optional[RestoreJob] = None) -> None:
+        all_rows.extend([
+            {"host": h, "hostname": hostname, "interface": r["interface"],
+             "status": r["status"], "detail": r.get("detail", ""),
+             "power_on_secs": job.power_on.get(r["interface"], "") if job else "",
+             "final_state": job.state.get(r["interface"], "") if job else ""}
+            for r in results
+        ])
+
+    def report_discovered(h, hostname, job, results, error) -> None:
+        nonlocal discovered, waiting
+        discovered += 1
         with print_lock:
             if error:
-                print(f"  [{completed}/{total}] {h}  →  ERROR: {error}")
+                print(f"  [{discovered}/{total}] {h}  →  ERROR: {error}")
                 errors.append((h, error))
-            elif not results:
-                print(f"  [{completed}/{total}] {hostname} ({h})  →  No local PoE interfaces found for VLAN(s) {', '.join(vlans)}")
-            else:
-                cycled = [r for r in results if r["status"] == "CYCLED"]
-                erred  = [r for r in results if r["status"] == "ERROR"]
-                print(f"  [{completed}/{total}] {hostname} ({h})")
+            elif job:
+                waiting += 1
+                print(f"  [{discovered}/{total}] {hostname} ({h})  →  {len(job.interfaces)} interface(s) "
+                      f"powered down, restoring in {delay}s"
+                      + (f" over {len(job.waves)} wave(s)" if len(job.waves) > 1 else ""))
+            elif results:
+                print(f"  [{discovered}/{total}] {hostname} ({h})  →  Power-down failed")
                 for r in results:
-                    mark = "✓" if r["status"] == "CYCLED" else "✗"
-                    print(f"    [{mark}] {r['interface']}")
-                all_rows.extend([
-                    {"host": h, "hostname": hostname, "interface": r["interface"],
-                     "status": r["status"], "detail": r.get("detail", "")}
-                    for r in results
-                ])
-
-    with ThreadPoolExecutor(max_workers=10) as executor:
-        futures = {executor.submit(run_and_report, h): h for h in hosts}
-        for f in as_completed(futures):
-            try:
-                f.result()
-            except Exception as e:
-                with print_lock:
-                    print(f"  Thread error: {e}")
+                    print(f"    [✗] {r['interface']}")
+                add_rows(h, hostname, results)
+            else:
+                print(f"  [{discovered}/{total}] {hostname} ({h})  →  No local PoE interfaces found for VLAN(s) {', '.join(vlans)}")
+
+    def report_restored(job: RestoreJob, results: list[dict]) -> None:
+        nonlocal restored
+        restored += 1
+        with print_lock:
+            print(f"  [restored {restored}/{waiting}] {job.hostname} ({job.host})")
+            for r in results:
+                mark = "✓" if r["status"] == "CYCLED" else "✗"
+                print(f"    [{mark}] {r['interface']}")
+            if not args.verify:
+                add_rows(job.host, job.hostname, results)
+
+    def report_verified(job: RestoreJob) -> None:
+        with print_lock:
+            cycled = [r for r in job.results if r["status"] == "CYCLED"]
+            if cycled:
+                print(f"  [verified] {job.hostname} ({job.host})  →  "
+                      f"{len(job.power_on)}/{len(cycled)} interface(s) drawing power")
+            for iface in job.pending():
+                print(f"    [✗] {iface}  {job.state.get(iface, 'unverified')}")
+            add_rows(job.host, job.hostname, job.results, job)
+
+    run_fleet(hosts, username, password, vlans, delay, report_discovered, report_restored,
+              args.verify, report_verified, sessions)
 
     # ── CSV ───────────────────────────────────────────────────────────────────
     print()
     print("  " + "─" * 50)
 
     with open(csv_path, "w", newline="") as cf:
-        writer = csv.DictWriter(cf, fieldnames=["host", "hostname", "interface", "status", "detail"])
+        writer = csv.DictWriter(cf, fieldnames=["host", "hostname", "interface", "status", "detail",
+                                                "power_on_secs", "final_state"])
         writer.writeheader()
         writer.writerows(all_rows)
 
@@ -388,6 +758,9 @@ def main() -> None:
     error_count  = sum(1 for r in all_rows if r["status"] == "ERROR") + len(errors)
 
     print(f"  Interfaces cycled : {cycled_count}")
+    if args.verify:
+        powered = sum(1 for r in all_rows if r["power_on_secs"] != "")
+        print(f"  Powered back on   : {powered}")
     print(f"  Errors            : {error_count}")
     print(f"  Report saved to   : {csv_path}")
     print()
@@ -19,8 +19,11 @@ import sys
 import getpass
 import logging
 import re
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from datetime import datetime
 from pathlib import Path
+from typing import Optional
 from collections import defaultdict
 
 try:
@@ -29,6 +32,16 @@ except ImportError:
     print("[ERROR] Netmiko is not installed. Run:  pip install netmiko")
     sys.exit(1)
 
+# ssh_preflight.py is shared with the other Netmiko tools one directory up
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from ssh_preflight import UNREACHABLE, sweep
+
+PHASE1_WORKERS = 10     # concurrent SSH sessions while collecting MAC tables
+PHASE3_WORKERS = 10     # concurrent config pushes when the operator opts in
+CONFIG_CHUNK   = 16     # interfaces per send_config_set transaction
+KEEPALIVE_SECS = 60     # prompt poke interval for sessions retained across the menu
+AUTH_ATTEMPTS  = 3      # credential prompts per switch before it is skipped
+
 
 # ---------------------------------------------------------------------------
 # Logging setup
@@ -48,10 +61,12 @@ def setup_logging() -> logging.Logger:
     fh.setFormatter(logging.Formatter("%(asctime)s  %(levelname)-8s  %(message)s",
                                        datefmt="%Y-%m-%d %H:%M:%S"))
 
-    # Console handler – info and above only
+    # Console handler – info and above only; Phase 1 workers' records are
+    # file-only here (see ReportLogger) so they can't interleave with a prompt
     ch = logging.StreamHandler(sys.stdout)
     ch.setLevel(logging.INFO)
     ch.setFormatter(logging.Formatter("%(message)s"))
+    ch.addFilter(lambda record: not getattr(record, "file_only", False))
 
     logger.addHandler(fh)
     logger.addHandler(ch)
@@ -60,6 +75,36 @@ def setup_logging() -> logging.Logger:
     return logger
 
 
+class ReportLogger:
+    """
+    Logger stand-in for a Phase 1 worker. Everything still reaches the audit
+    file at its real level, but INFO and above is held in .lines instead of
+    going to the console, so the main thread can print it with the switch's
+    report — never while it is waiting on input().
+    """
+
+    def __init__(self, logger: logging.Logger):
+        self.logger = logger
+        self.lines: list[str] = []
+
+    def _log(self, level: int, msg: str):
+        self.logger.log(level, msg, extra={"file_only": True})
+        if level >= logging.INFO:
+            self.lines.append(msg)
+
+    def debug(self, msg: str):
+        self._log(logging.DEBUG, msg)
+
+    def info(self, msg: str):
+        self._log(logging.INFO, msg)
+
+    def warning(self, msg: str):
+        self._log(logging.WARNING, msg)
+
+    def error(self, msg: str):
+        self._log(logging.ERROR, msg)
+
+
 # ---------------------------------------------------------------------------
 # Inventory loader
 # ---------------------------------------------------------------------------
@@ -140,8 +185,14 @@ def get_vlans_from_switch(conn, logger: logging.Logger) -> list[str]:
 # SSH helpers
 # ---------------------------------------------------------------------------
 
-def connect(ip: str, username: str, password: str, logger: logging.Logger):
-    """Return a Netmiko SSH session or None on failure."""
+def connect(ip: str, username: str, password: str, logger: logging.Logger,
+            raise_auth: bool = False, keepalive: int = 0):
+    """
+    Return a Netmiko SSH session or None on failure.
+    With raise_auth, an authentication failure is re-raised (after logging)
+    so the caller can tell it apart from a timeout. keepalive (seconds)
+    turns on SSH transport keepalives for sessions that will sit idle.
+    """
     logger.debug(f"Connecting to {ip}")
     try:
         conn = ConnectHandler(
@@ -150,6 +201,7 @@ def connect(ip: str, username: str, password: str, logger: logging.Logger):
             username=username,
             password=password,
             timeout=20,
+            keepalive=keepalive,
             session_log=None,       # We handle logging ourselves
         )
         conn.enable()
@@ -157,6 +209,8 @@ def connect(ip: str, username: str, password: str, logger: logging.Logger):
         return conn
     except NetmikoAuthenticationException:
         logger.error(f"Authentication failed for {ip}")
+        if raise_auth:
+            raise
     except NetmikoTimeoutException:
         logger.error(f"Timeout connecting to {ip}")
     except Exception as exc:
@@ -164,6 +218,60 @@ def connect(ip: str, username: str, password: str, logger: logging.Logger):
     return None
 
 
+def disconnect_all(sessions: dict[str, object], logger: logging.Logger):
+    """Close every retained session."""
+    for ip, conn in sessions.items():
+        try:
+            conn.disconnect()
+        except Exception:
+            pass
+        logger.debug(f"Disconnected from {ip}")
+    sessions.clear()
+
+
+class SessionKeeper:
+    """
+    Keeps retained Phase 1 sessions alive while the action menu waits on the
+    operator. Every KEEPALIVE_SECS each session gets a find_prompt() — real
+    input on the vty, so exec-timeout doesn't fire (SSH-level keepalives
+    alone don't reset it). Sessions that fail are closed and dropped, and
+    Phase 3 reconnects those switches. Used as a context manager around the
+    menu prompt; the thread is stopped before any config is pushed, so a
+    session is never driven from two threads at once.
+    """
+
+    def __init__(self, sessions: dict[str, object], logger: logging.Logger):
+        self.sessions = sessions
+        self.logger = logger
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self):
+        if self.sessions:
+            self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop.set()
+        if self.thread.is_alive():
+            self.thread.join()
+
+    def _run(self):
+        while not self.stop.wait(KEEPALIVE_SECS):
+            for ip, conn in list(self.sessions.items()):
+                if self.stop.is_set():
+                    return
+                try:
+                    conn.find_prompt()
+                except Exception as exc:
+                    self.logger.debug(f"Retained session to {ip} dropped ({exc})")
+                    try:
+                        conn.disconnect()
+                    except Exception:
+                        pass
+                    self.sessions.pop(ip, None)
+
+
 def send_command(conn, command: str, logger: logging.Logger) -> str:
     """Send a show command and return output, logging the command."""
     logger.debug(f"[CMD] {conn.host}  >>  {command}")
@@ -183,91 +291,121 @@ def send_config(conn, commands: list[str], logger: logging.Logger) -> str:
 
 
 # ---------------------------------------------------------------------------
-# MAC table parsing
+# MAC table / interface status parsing
 # ---------------------------------------------------------------------------
 
+# Only physical access port types.
+# Explicitly excludes: Po (Port-Channel), Tu (Tunnel), Vl (SVI),
+# Lo (Loopback), Ap (AppGigE), CPU, and anything else non-physical.
+PHYSICAL_PORT = re.compile(
+    r"(GigabitEthernet|Gi|FastEthernet|Fa|TenGigabitEthernet|Te|"
+    r"TwentyFiveGigE|Tw|HundredGigE|Hu|FiveGigabitEthernet|Fi)\d",
+    re.IGNORECASE,
+)
+
+
 def get_mac_table(conn, vlans: list[str], logger: logging.Logger) -> dict[str, dict[str, list[str]]]:
     """
     Returns: { vlan_id: { interface: [mac1, mac2, ...] } }
-    Queries each VLAN separately so we capture all entries.
+    One 'show mac address-table' per switch, parsed once into an index for
+    every requested VLAN (VLANs with no entries map to {}).
     """
-    result: dict[str, dict[str, list[str]]] = {}
-
-    for vlan in vlans:
-        output = send_command(conn, f"show mac address-table vlan {vlan}", logger)
-        iface_macs: dict[str, list[str]] = defaultdict(list)
-
-        for line in output.splitlines():
-            # Typical format:
-            #   10    aabb.cc00.0101    DYNAMIC     Gi1/0/1
-            parts = line.split()
-            if len(parts) < 4:
-                continue
-            # First column should match the VLAN number
-            if not parts[0].isdigit() or parts[0] != vlan:
-                continue
-            mac = parts[1]
-            iface = parts[-1]
-            # Only include physical access port types.
-            # Explicitly excludes: Po (Port-Channel), Tu (Tunnel), Vl (SVI),
-            # Lo (Loopback), Ap (AppGigE), CPU, and anything else non-physical.
-            if re.match(r"(GigabitEthernet|Gi|FastEthernet|Fa|TenGigabitEthernet|Te|"
-                        r"TwentyFiveGigE|Tw|HundredGigE|Hu|FiveGigabitEthernet|Fi)\d",
-                        iface, re.IGNORECASE):
-                iface_macs[iface].append(mac)
-
-        result[vlan] = dict(iface_macs)
+    output = send_command(conn, "show mac address-table", logger)
+    wanted = set(vlans)
+    result: dict[str, dict[str, list[str]]] = {vlan: defaultdict(list) for vlan in vlans}
 
-    return result
+    for line in output.splitlines():
+        # Typical format:
+        #   10    aabb.cc00.0101    DYNAMIC     Gi1/0/1
+        parts = line.split()
+        if len(parts) < 4:
+            continue
+        # First column is the VLAN number
+        if parts[0] not in wanted:
+            continue
+        iface = parts[-1]
+        if PHYSICAL_PORT.match(iface):
+            result[parts[0]][iface].append(parts[1])
 
+    return {vlan: dict(ifaces) for vlan, ifaces in result.items()}
 
-# ---------------------------------------------------------------------------
-# Interface discovery
-# ---------------------------------------------------------------------------
 
-def get_access_ports_for_vlan(conn, vlan: str, logger: logging.Logger) -> list[str]:
+def get_ports_by_vlan(conn, logger: logging.Logger) -> dict[str, list[str]]:
     """
-    Returns all physical access ports assigned to a given VLAN by parsing
+    Returns: { vlan_id: [interface, ...] } for all physical ports, from one
     'show interfaces status'. This catches ports with zero MAC addresses
     that would be invisible to the MAC table alone.
     """
     output = send_command(conn, "show interfaces status", logger)
-    ports = []
+    ports: dict[str, list[str]] = defaultdict(list)
     for line in output.splitlines():
         parts = line.split()
         if len(parts) < 4:
             continue
         iface = parts[0]
         # Must be a physical port type
-        if not re.match(r"(GigabitEthernet|Gi|FastEthernet|Fa|TenGigabitEthernet|Te|"
-                        r"TwentyFiveGigE|Tw|HundredGigE|Hu|FiveGigabitEthernet|Fi)\d",
-                        iface, re.IGNORECASE):
+        if not PHYSICAL_PORT.match(iface):
             continue
         # show interfaces status columns:
         #   Port      Name    Status      Vlan  Duplex Speed Type
         # VLAN column is index 3 when no name, or further right with a name.
-        # Most reliable: find the field that matches our VLAN number.
-        # It will appear as a plain integer in the 'Vlan' column.
-        # We look for the vlan id somewhere in cols 2-5 to handle name spacing.
-        fields = parts[1:]  # everything after the interface name
-        for i, field in enumerate(fields[:5]):
-            if field == vlan:
-                ports.append(iface)
-                break
-    logger.debug(f"  Access ports for VLAN {vlan} on {conn.host}: {ports}")
-    return ports
+        # Most reliable: index the port under every plain integer in cols 2-5
+        # to handle name spacing — lookups by VLAN id then find it wherever
+        # the 'Vlan' column landed.
+        for field in dict.fromkeys(parts[1:6]):
+            if field.isdigit():
+                ports[field].append(iface)
+    logger.debug(f"  Ports by VLAN on {conn.host}: {dict(ports)}")
+    return dict(ports)
 
 
 # ---------------------------------------------------------------------------
 # Port-security application
 # ---------------------------------------------------------------------------
 
-def is_access_port(conn, interface: str, logger: logging.Logger) -> bool:
+def get_switchport_modes(conn, logger: logging.Logger) -> dict[str, str]:
     """
-    Check show run for the interface and confirm it is explicitly configured
-    as an access port. Trunks, routed ports, and anything without
+    Returns: { interface: access|trunk|routed|dynamic } from one
+    'show interfaces switchport'. 'Administrative Mode: static access' is
+    what 'switchport mode access' in the config produces; ports without
+    switchport are routed, and auto/desirable ports are 'dynamic'.
+    Names are the short form, matching the MAC table.
+    """
+    output = send_command(conn, "show interfaces switchport", logger)
+    modes: dict[str, str] = {}
+    iface = None
+    for line in output.splitlines():
+        key, _, value = line.strip().partition(":")
+        value = value.strip().lower()
+        if key == "Name":
+            iface = line.split(":", 1)[1].strip()
+            modes[iface] = "dynamic"
+        elif iface and key == "Switchport" and value == "disabled":
+            modes[iface] = "routed"
+        elif iface and key == "Administrative Mode":
+            if value == "static access":
+                modes[iface] = "access"
+            elif value == "trunk":
+                modes[iface] = "trunk"
+    logger.debug(f"  Switchport modes on {conn.host}: {modes}")
+    return modes
+
+
+def is_access_port(conn, interface: str, logger: logging.Logger,
+                   modes: Optional[dict[str, str]] = None) -> bool:
+    """
+    Confirm the interface is explicitly configured as an access port, using
+    the per-switch modes map when given (falls back to show run for ports
+    the map doesn't know). Trunks, routed ports, and anything without
     'switchport mode access' are skipped.
     """
+    if modes and interface in modes:
+        if modes[interface] == "access":
+            return True
+        logger.warning(f"  [SKIP] {conn.host} / {interface} — switchport mode is "
+                       f"'{modes[interface]}', not access, skipping")
+        return False
+
     output = send_command(conn, f"show run interface {interface}", logger)
     if "switchport mode access" in output.lower():
         return True
@@ -276,113 +414,183 @@ def is_access_port(conn, interface: str, logger: logging.Logger) -> bool:
     return False
 
 
-def apply_port_security(conn, interface: str, logger: logging.Logger):
-    """
-    Apply port-security max 1 (non-sticky, violation restrict) to a single interface.
-    Verifies the port is explicitly configured as an access port first.
-    """
-    if not is_access_port(conn, interface, logger):
-        return
-
-    cmds = [
+def port_security_commands(interface: str) -> list[str]:
+    """Port-security max 1 (non-sticky, violation restrict) stanza for one interface."""
+    return [
         f"interface {interface}",
         "switchport mode access",
         "switchport port-security",
         "switchport port-security maximum 1",
         "switchport port-security violation restrict",
-        "end",
     ]
-    send_config(conn, cmds, logger)
+
+
+def apply_port_security(conn, interfaces: list[str], logger: logging.Logger,
+                        modes: Optional[dict[str, str]] = None) -> int:
+    """
+    Apply port-security to every interface that is explicitly configured as
+    an access port, CONFIG_CHUNK interfaces per config transaction instead
+    of one config-mode round trip each. Every command is still logged per
+    interface by send_config(). Returns the number of interfaces configured.
+    """
+    ports = [iface for iface in interfaces if is_access_port(conn, iface, logger, modes)]
+    for i in range(0, len(ports), CONFIG_CHUNK):
+        cmds = [cmd for iface in ports[i:i + CONFIG_CHUNK] for cmd in port_security_commands(iface)]
+        send_config(conn, cmds, logger)
+    return len(ports)
+
+
+def push_switch(ip: str, vlan_results: dict, choice: str, username: str, password: str,
+                logger: logging.Logger, conn=None):
+    """
+    Phase 3 for one switch: lock the chosen ports, then a single write memory.
+    conn is the session retained from Phase 1, if any; it is reused when it
+    still answers and replaced by a fresh connection when it has dropped.
+    """
+    if conn is not None:
+        try:
+            conn.find_prompt()
+        except Exception:
+            logger.info(f"[{ip}] Retained session dropped — reconnecting")
+            conn = None
+    conn = conn or connect(ip, username, password, logger)
+    if conn is None:
+        logger.error(f"Could not reconnect to {ip} for config push – skipping.")
+        return
+
+    targets: list[str] = []
+    for vlan, data in vlan_results.items():
+        if choice == "b":
+            vlan_targets = data["single"] + data["zero"]
+            logger.info(f"[{ip}] VLAN {vlan}: locking {len(vlan_targets)} port(s) "
+                        f"({len(data['single'])} single-MAC + {len(data['zero'])} zero-MAC)")
+        else:
+            vlan_targets = list(data["multi"].keys()) + data["single"] + data["zero"]
+            logger.info(f"[{ip}] VLAN {vlan}: locking {len(vlan_targets)} total port(s) "
+                        f"({len(data['multi'])} multi-MAC + {len(data['single'])} single-MAC "
+                        f"+ {len(data['zero'])} zero-MAC)")
+        for iface in vlan_targets:
+            logger.info(f"  -> Applying port-security to {ip} / {iface}")
+        targets += vlan_targets
+
+    try:
+        # One switchport-mode pull per switch gates every target port
+        modes = get_switchport_modes(conn, logger)
+        applied = apply_port_security(conn, list(dict.fromkeys(targets)), logger, modes)
+
+        # Save config — once per switch
+        logger.info(f"[{ip}] Saving configuration (write memory) — {applied} port(s) configured")
+        send_command(conn, "write memory", logger)
+    except Exception as exc:
+        logger.error(f"Config push to {ip} failed: {exc}")
+    finally:
+        conn.disconnect()
+        logger.debug(f"Disconnected from {ip}")
 
 
 # ---------------------------------------------------------------------------
 # Report helpers
 # ---------------------------------------------------------------------------
 
-def print_report(switch_ip: str, vlan: str, multi_mac_ports: dict[str, list[str]],
-                 single_mac_ports: list[str], zero_mac_ports: list[str]):
-    """Pretty-print the findings for one switch / VLAN."""
-    print(f"\n{'─'*60}")
-    print(f"  Switch : {switch_ip}")
-    print(f"  VLAN   : {vlan}")
-    print(f"{'─'*60}")
+def format_report(switch_ip: str, vlan: str, multi_mac_ports: dict[str, list[str]],
+                  single_mac_ports: list[str], zero_mac_ports: list[str]) -> str:
+    """Pretty-format the findings for one switch / VLAN (buffered so reports don't interleave)."""
+    lines = [
+        f"\n{'─'*60}",
+        f"  Switch : {switch_ip}",
+        f"  VLAN   : {vlan}",
+        f"{'─'*60}",
+    ]
 
     if multi_mac_ports:
-        print(f"  Ports with MULTIPLE MAC addresses ({len(multi_mac_ports)}):")
+        lines.append(f"  Ports with MULTIPLE MAC addresses ({len(multi_mac_ports)}):")
         for iface, macs in sorted(multi_mac_ports.items()):
-            print(f"    {iface:<20}  {len(macs)} MACs: {', '.join(macs)}")
+            lines.append(f"    {iface:<20}  {len(macs)} MACs: {', '.join(macs)}")
     else:
-        print("  No ports with multiple MAC addresses found.")
+        lines.append("  No ports with multiple MAC addresses found.")
 
-    print(f"  Ports with single MAC address : {len(single_mac_ports)}")
-    print(f"  Ports with zero MAC addresses  : {len(zero_mac_ports)}")
+    lines.append(f"  Ports with single MAC address : {len(single_mac_ports)}")
+    lines.append(f"  Ports with zero MAC addresses  : {len(zero_mac_ports)}")
+    return "\n".join(lines)
 
 
 # ---------------------------------------------------------------------------
-# Main workflow
+# Phase 1: collection
 # ---------------------------------------------------------------------------
 
-def main():
-    logger = setup_logging()
-
-    vlans = prompt_vlans()
-    switches = load_inventory()
-
-    print(f"\n[*] VLANs   : {', '.join(vlans)}")
-    print(f"[*] Switches: {len(switches)} loaded from inventory.txt")
-
-    # Prompt credentials – password uses getpass so it never echoes.
-    # Re-prompts on auth failure (up to 3 attempts per switch).
-    print()
-    username = input("SSH Username: ").strip()
-    password = getpass.getpass("SSH Password: ")
-
-    # -----------------------------------------------------------------------
-    # Phase 1: Collect data from all switches
-    # -----------------------------------------------------------------------
-    # Structure: { switch_ip: { vlan: { multi: {iface:[macs]}, single: [iface] } } }
-    all_data: dict[str, dict] = {}
+class SharedCreds:
+    """
+    Phase 1 credentials, read by the workers and replaced by the main thread
+    only while the pool is paused. Until a login has succeeded with the
+    current pair, logins go one at a time, so a wrong password costs one
+    failed attempt rather than one per worker.
+    """
 
-    logger.info("\n[*] Connecting to switches and collecting MAC tables...")
+    def __init__(self, username: str, password: str):
+        self.current = (username, password)
+        self.proven = False
+        self.gate = threading.Lock()
 
-    for ip in switches:
-        conn = None
-        current_user = username
-        current_pass = password
-        for attempt in range(1, 4):
-            conn = connect(ip, current_user, current_pass, logger)
-            if conn is not None:
-                # Sync back in case the user entered different creds
-                username = current_user
-                password = current_pass
-                break
-            # Only re-prompt on auth failure (connect() logs the reason)
-            # Check the log — if it was a timeout/other error, don't loop
-            print(f"\n[!] Authentication failed for {ip} (attempt {attempt}/3)")
-            if attempt < 3:
-                retry = input("    Re-enter credentials? [y/n]: ").strip().lower()
-                if retry != "y":
-                    break
-                current_user = input("    SSH Username: ").strip()
-                current_pass = getpass.getpass("    SSH Password: ")
-            else:
-                print(f"[!] Max attempts reached for {ip}, skipping.")
-                logger.warning(f"Max credential attempts reached for {ip}, skipping.")
-        if conn is None:
-            continue
+    def replace(self, username: str, password: str):
+        self.current = (username, password)
+        self.proven = False
 
-        all_data[ip] = {}
 
+def collect_switch(ip: str, creds: SharedCreds, vlans: list[str],
+                   logger: logging.Logger, running: threading.Event,
+                   retain: bool = False) -> dict:
+    """
+    Phase 1 worker for one switch. Waits while the pool is paused for a
+    credential prompt, then reads creds.current — so switches still queued
+    when the operator re-enters credentials log in with the new ones — and
+    collects every VLAN's MAC/port data.
+    Returns {"ip", "status": ok|auth|error, "creds", "data", "report", "conn"} —
+    "creds" are the ones actually tried, and the report text (including this
+    switch's log lines) is printed by the main thread in one piece. With
+    retain, a successful switch's session is left open in "conn" for Phase 3.
+    """
+    logger = ReportLogger(logger)
+    result = {"ip": ip, "status": "error", "creds": None,
+              "data": {}, "report": "", "conn": None}
+    running.wait()
+    serial = not creds.proven
+    if serial:
+        creds.gate.acquire()
+        if creds.proven:  # proven while this worker queued on the gate
+            creds.gate.release()
+            serial = False
+    try:
+        running.wait()
+        username, password = result["creds"] = creds.current
+        conn = connect(ip, username, password, logger, raise_auth=True,
+                       keepalive=KEEPALIVE_SECS if retain else 0)
+        if conn is not None and creds.current == (username, password):
+            creds.proven = True
+    except NetmikoAuthenticationException:
+        running.clear()  # pause the pool until the main thread has re-prompted
+        result["status"] = "auth"
+        return result
+    finally:
+        if serial:
+            creds.gate.release()
+    if conn is None:
+        result["report"] = "\n".join(logger.lines)
+        return result
+
+    reports = []
+    try:
         # Resolve VLAN list — either use what the user specified, or
         # query the switch directly if they chose 'all'
         switch_vlans = get_vlans_from_switch(conn, logger) if vlans == ["ALL"] else vlans
         if not switch_vlans:
             logger.warning(f"  [!] No active VLANs found on {ip}, skipping.")
-            conn.disconnect()
-            continue
+            return result
+
+        # One fetch of each table per switch; every VLAN report reads the indexes
+        mac_table = get_mac_table(conn, switch_vlans, logger)
+        ports_by_vlan = get_ports_by_vlan(conn, logger)
 
         for vlan in switch_vlans:
-            mac_table = get_mac_table(conn, [vlan], logger)
             vlan_data = mac_table.get(vlan, {})
 
             multi = {iface: macs for iface, macs in vlan_data.items() if len(macs) > 1}
@@ -390,15 +598,126 @@ def main():
 
             # Find ports assigned to this VLAN that had zero MACs in the table
             # (empty ports, recently cleared, devices powered off, etc.)
-            all_vlan_ports = get_access_ports_for_vlan(conn, vlan, logger)
+            all_vlan_ports = ports_by_vlan.get(vlan, [])
             seen_ports = set(multi.keys()) | set(single)
             zero_mac = [p for p in all_vlan_ports if p not in seen_ports]
 
-            all_data[ip][vlan] = {"multi": multi, "single": single, "zero": zero_mac}
-            print_report(ip, vlan, multi, single, zero_mac)
+            result["data"][vlan] = {"multi": multi, "single": single, "zero": zero_mac}
+            reports.append(format_report(ip, vlan, multi, single, zero_mac))
 
-        conn.disconnect()
-        logger.debug(f"Disconnected from {ip}")
+        result["status"] = "ok"
+    except Exception as exc:
+        logger.error(f"Error collecting from {ip}: {exc}")
+    finally:
+        if retain and result["status"] == "ok":
+            result["conn"] = conn
+        else:
+            conn.disconnect()
+            logger.debug(f"Disconnected from {ip}")
+        result["report"] = "\n".join(logger.lines + reports)
+    return result
+
+
+def collect_all(switches: list[str], username: str, password: str, vlans: list[str],
+                logger: logging.Logger, retain: bool = False
+                ) -> tuple[dict[str, dict], dict[str, object], str, str]:
+    """
+    Run Phase 1 across a bounded worker pool. Workers never prompt: an auth
+    failure pauses the pool and comes back here, where the operator is
+    re-prompted on the main thread (up to AUTH_ATTEMPTS per switch) and the
+    switch is resubmitted. Workers read the credentials from SharedCreds only
+    once the pool resumes, and log in one at a time until a pair is proven,
+    so a wrong password costs a single failed login per prompt. A result that
+    failed on credentials already replaced is simply retried.
+    Returns (all_data in inventory order, retained sessions, username, password).
+    """
+    all_data: dict[str, dict] = {}
+    sessions: dict[str, object] = {}
+    attempts: dict[str, int] = defaultdict(int)
+    creds = SharedCreds(username, password)
+    running = threading.Event()
+    running.set()
+
+    with ThreadPoolExecutor(max_workers=PHASE1_WORKERS) as pool:
+        def submit(ip: str):
+            return pool.submit(collect_switch, ip, creds, vlans, logger, running, retain)
+
+        pending = {submit(ip) for ip in switches}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                ip = result["ip"]
+
+                if result["report"]:
+                    print(result["report"])
+                if result["status"] == "ok":
+                    all_data[ip] = result["data"]
+                    if result["conn"] is not None:
+                        sessions[ip] = result["conn"]
+                    continue
+                if result["status"] != "auth":
+                    continue  # the report above says why
+
+                if result["creds"] != creds.current:
+                    pending.add(submit(ip))  # failed on credentials already replaced
+                    running.set()
+                    continue
+
+                attempts[ip] += 1
+                print(f"\n[!] Authentication failed for {ip} (attempt {attempts[ip]}/{AUTH_ATTEMPTS})")
+                if attempts[ip] >= AUTH_ATTEMPTS:
+                    print(f"[!] Max attempts reached for {ip}, skipping.")
+                    logger.warning(f"Max credential attempts reached for {ip}, skipping.")
+                elif input("    Re-enter credentials? [y/n]: ").strip().lower() == "y":
+                    creds.replace(input("    SSH Username: ").strip(),
+                                  getpass.getpass("    SSH Password: "))
+                    pending.add(submit(ip))
+                running.set()
+
+    username, password = creds.current
+    return {ip: all_data[ip] for ip in switches if ip in all_data}, sessions, username, password
+
+
+# ---------------------------------------------------------------------------
+# Main workflow
+# ---------------------------------------------------------------------------
+
+def main():
+    logger = setup_logging()
+
+    vlans = prompt_vlans()
+    switches = load_inventory()
+
+    print(f"\n[*] VLANs   : {', '.join(vlans)}")
+    print(f"[*] Switches: {len(switches)} loaded from inventory.txt")
+
+    # Reachability pre-sweep — dead switches are recorded in the audit log
+    # now rather than each stalling Phase 1 for a 20s SSH timeout.
+    switches, unreachable = sweep(switches)
+    for ip in unreachable:
+        logger.warning(f"[!] {ip}: {UNREACHABLE}, skipping.")
+    if unreachable:
+        print(f"[*] Reachable: {len(switches)} ({len(unreachable)} unreachable)")
+
+    # Prompt credentials – password uses getpass so it never echoes.
+    # Re-prompts on auth failure (up to 3 attempts per switch), always from
+    # this thread — the Phase 1 pool pauses while it waits.
+    print()
+    username = input("SSH Username: ").strip()
+    password = getpass.getpass("SSH Password: ")
+
+    # Session retention: keep Phase 1 connections open (with keepalives)
+    # through the action menu so Phase 3 doesn't re-auth the whole fleet.
+    retain = input("Keep sessions open for the config phase? [y/N]: ").strip().lower() == "y"
+
+    # -----------------------------------------------------------------------
+    # Phase 1: Collect data from all switches (PHASE1_WORKERS at a time)
+    # -----------------------------------------------------------------------
+    # Structure: { switch_ip: { vlan: { multi: {iface:[macs]}, single: [iface] } } }
+    logger.info("\n[*] Connecting to switches and collecting MAC tables...")
+    all_data, sessions, username, password = collect_all(switches, username, password, vlans,
+                                                          logger, retain)
 
     # -----------------------------------------------------------------------
     # Phase 2: Action menu
@@ -412,9 +731,11 @@ def main():
     print("                                  INCLUDING ports with multiple MACs)")
     print()
 
-    choice = input("Choose [a/b/c]: ").strip().lower()
+    with SessionKeeper(sessions, logger):
+        choice = input("Choose [a/b/c]: ").strip().lower()
 
     if choice == "a" or choice not in ("b", "c"):
+        disconnect_all(sessions, logger)
         logger.info("[*] User selected EXIT. No changes made.")
         print("\n[*] Exiting. No changes applied.")
         return
@@ -424,34 +745,18 @@ def main():
     # -----------------------------------------------------------------------
     logger.info(f"[*] User selected option '{choice}'. Beginning configuration...")
 
-    for ip, vlan_results in all_data.items():
-        conn = connect(ip, username, password, logger)
-        if conn is None:
-            logger.error(f"Could not reconnect to {ip} for config push – skipping.")
-            continue
-
-        for vlan, data in vlan_results.items():
-            targets: list[str] = []
-
-            if choice == "b":
-                targets = data["single"] + data["zero"]
-                logger.info(f"[{ip}] VLAN {vlan}: locking {len(targets)} port(s) "
-                             f"({len(data['single'])} single-MAC + {len(data['zero'])} zero-MAC)")
-            elif choice == "c":
-                targets = list(data["multi"].keys()) + data["single"] + data["zero"]
-                logger.info(f"[{ip}] VLAN {vlan}: locking {len(targets)} total port(s) "
-                             f"({len(data['multi'])} multi-MAC + {len(data['single'])} single-MAC "
-                             f"+ {len(data['zero'])} zero-MAC)")
-
-            for iface in targets:
-                logger.info(f"  -> Applying port-security to {ip} / {iface}")
-                apply_port_security(conn, iface, logger)
-
-        # Save config
-        logger.info(f"[{ip}] Saving configuration (write memory)")
-        send_command(conn, "write memory", logger)
-        conn.disconnect()
-        logger.debug(f"Disconnected from {ip}")
+    parallel = len(all_data) > 1 and input(
+        f"Push to switches in parallel ({PHASE3_WORKERS} at a time)? [y/N]: ").strip().lower() == "y"
+    if parallel:
+        with ThreadPoolExecutor(max_workers=PHASE3_WORKERS) as pool:
+            for future in [pool.submit(push_switch, ip, vlan_results, choice, username, password,
+                                       logger, sessions.pop(ip, None))
+                           for ip, vlan_results in all_data.items()]:
+                future.result()
+    else:
+        for ip, vlan_results in all_data.items():
+            push_switch(ip, vlan_results, choice, username, password, logger, sessions.pop(ip, None))
+    disconnect_all(sessions, logger)
 
     logger.info("\n[*] All done. Review the audit log for a full record of changes.")
     print("\n[*] Complete. Check the audit_*.log file for a full timestamped record.")
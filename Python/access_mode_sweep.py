@@ -25,7 +25,6 @@ import os
 import re
 import sys
 import time
-import socket
 from getpass import getpass
 from typing import List, Dict, Any
 
@@ -44,6 +43,8 @@ except ImportError:
         from netmiko import NetMikoAuthenticationException as NetmikoAuthenticationException
 # ----------------------------------------------------------------------
 
+from ssh_preflight import sweep
+
 SECTION_SPLIT_RE = re.compile(r"(?m)^\s*interface\s+(\S+)\s*$")
 
 def parse_args():
@@ -117,15 +118,6 @@ def analyze_interface_block(intf_block: str):
 
     return has_access_vlan, access_vlan, has_mode_access, is_trunk
 
-# --- Fast TCP/22 pre-check to skip unreachable hosts ---
-def tcp_port_open(host: str, port: int = 22, timeout: float = 1.0) -> bool:
-    try:
-        with socket.create_connection((host, port), timeout=timeout):
-            return True
-    except Exception:
-        return False
-# -------------------------------------------------------
-
 def main():
     args = parse_args()
     ensure_dirs(args.outdir)
@@ -142,13 +134,17 @@ def main():
 
     results: List[Dict[str, Any]] = []
 
+    # --- Fast TCP pre-sweep: probe every host at once, skip the dead ones ---
+    devices, unreachable = sweep(devices, args.ssh_port, timeout=1.0)
+    for host in unreachable:
+        app_log(args.outdir, f"{host}: TCP/{args.ssh_port} not reachable; skipping.")
+        results.append({"device": host, "hostname": "", "interface": "", "access_vlan": "",
+                        "has_mode_access": "", "is_trunk": "",
+                        "error": f"TCP/{args.ssh_port} unreachable (pre-sweep)"})
+
     for host in devices:
         session_log = os.path.join(args.outdir, "logs", f"{host}_session.log")
 
-        if not tcp_port_open(host, args.ssh_port, timeout=1.0):
-            app_log(args.outdir, f"{host}: TCP/{args.ssh_port} not reachable; skipping.")
-            continue
-
         app_log(args.outdir, f"Connecting to {host} ...")
         try:
             conn = ConnectHandler(
@@ -186,6 +182,7 @@ def main():
                             "access_vlan": access_vlan,
                             "has_mode_access": has_mode_access,
                             "is_trunk": is_trunk,
+                            "error": "",
                         }
                     )
 
@@ -208,7 +205,7 @@ def main():
     csv_path = os.path.join(args.outdir, "results.csv")
     json_path = os.path.join(args.outdir, "results.json")
 
-    fieldnames = ["device", "hostname", "interface", "access_vlan", "has_mode_access", "is_trunk"]
+    fieldnames = ["device", "hostname", "interface", "access_vlan", "has_mode_access", "is_trunk", "error"]
     with open(csv_path, "w", newline="", encoding="utf-8") as f:
         writer = csv.DictWriter(f, fieldnames=fieldnames)
         writer.writeheader()
@@ -220,8 +217,8 @@ def main():
 
     app_log(
         args.outdir,
-        f"Done. Summary: {len(results)} interface(s) with 'switchport access vlan' but missing 'switchport mode access' "
-        f"(trunk ports excluded). See {csv_path} and {json_path} for details.",
+        f"Done. Summary: {sum(1 for r in results if not r['error'])} interface(s) with 'switchport access vlan' but missing 'switchport mode access' "
+        f"(trunk ports excluded), {len(unreachable)} unreachable device(s). See {csv_path} and {json_path} for details.",
     )
 
 
@@ -5,16 +5,30 @@ Menu-driven hardening and configuration for APC NMC2 devices.
 
 Usage:
     python3 nmc2.py [-f targets.txt] [-s 192.168.1.1] [--dry-run]
+    python3 nmc2.py -f targets.txt --profile desired.yaml
+    python3 nmc2.py -f targets.txt --plan plan.json      (read state, save diff)
+    python3 nmc2.py --apply-plan plan.json               (apply exactly that diff)
+    python3 nmc2.py -f targets.txt --resume nmc2_<action>_<ts>.jsonl
+    python3 nmc2.py -f targets.txt --inventory inventory.json   (snapshot full state)
+    python3 nmc2.py --inventory inventory.json --query 'ftp.ftp=enabled'
 """
 
 import argparse
+import asyncio
+import contextlib
 import csv
+import functools
 import getpass
+import hashlib
+import json
 import os
+import random
 import re
+import select
 import sys
+import threading
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 import logging
@@ -29,8 +43,15 @@ except ImportError:
     print("ERROR: paramiko not installed. Run: pip install paramiko")
     sys.exit(1)
 
-THREADS  = 20
-SSH_PORT = 22
+try:
+    import yaml
+except ImportError:
+    yaml = None  # only needed for --profile with a .yaml file
+
+CONCURRENCY = 20     # max devices in flight at once
+SSH_PORT    = 22
+PASTE_CHUNK = 60     # bytes the NMC paste buffer reliably takes in one send
+PIPELINE    = False  # --pipeline: batch short commands into one transmission
 
 
 # ── Helpers ───────────────────────────────────────────────────────────────────
@@ -62,10 +83,236 @@ def preview_cmds(cmds):
     print()
 
 
+E_CODES = ("E000", "E001", "E100", "E101", "E102")
+
+
+def _prompt_seen(output):
+    """True once the apc> prompt has been returned on its own line."""
+    return "\napc>" in output or output.rstrip().endswith("apc>")
+
+
+def _read_until(shell, done, timeout):
+    """
+    Read from the channel until done(output) is true, the channel closes,
+    or timeout expires. Blocks on channel readability instead of sleeping,
+    so fast commands return as soon as their output arrives.
+    Returns (output, elapsed_seconds).
+    """
+    output   = ""
+    start    = time.monotonic()
+    deadline = start + timeout
+    while True:
+        while shell.recv_ready():
+            output += shell.recv(4096).decode("utf-8", errors="replace")
+        if done(output):
+            break
+        remaining = deadline - time.monotonic()
+        if remaining <= 0 or shell.closed or shell.eof_received:
+            break
+        select.select([shell], [], [], min(remaining, 0.25))
+    return output, time.monotonic() - start
+
+
+def _drain(shell):
+    """Discard anything already buffered on the channel."""
+    while shell.recv_ready():
+        shell.recv(4096)
+
+
+# ── Command latency ───────────────────────────────────────────────────────────
+_latency      = {}
+_latency_lock = threading.Lock()
+
+
+def _cmd_key(cmd):
+    """Group commands by verb + first flag (e.g. 'web -h') for latency stats."""
+    return " ".join(sanitize(cmd).split()[:2]) or cmd
+
+
+def record_latency(cmd, elapsed):
+    with _latency_lock:
+        _latency.setdefault(_cmd_key(cmd), []).append(elapsed)
+
+
+def reset_latency():
+    with _latency_lock:
+        _latency.clear()
+
+
+def _pct(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def print_latency_summary():
+    """Print per-command latency (count, p50, p95, max, total) for this run."""
+    with _latency_lock:
+        stats = {k: list(v) for k, v in _latency.items()}
+    if not stats:
+        return
+    total = sum(sum(v) for v in stats.values())
+    print(f"\n  Command latency ({sum(len(v) for v in stats.values())} commands, {total:.1f}s total):")
+    print(f"    {'command':20s} {'n':>5s} {'p50':>7s} {'p95':>7s} {'max':>7s} {'total':>8s}")
+    for key, vals in sorted(stats.items(), key=lambda kv_: -sum(kv_[1])):
+        print(f"    {key:20s} {len(vals):5d} {_pct(vals, 50):6.2f}s {_pct(vals, 95):6.2f}s "
+              f"{max(vals):6.2f}s {sum(vals):7.1f}s")
+
+
+# ── Phase timing ──────────────────────────────────────────────────────────────
+# Per-device phases, in CSV column order. 'other' is pool checks and anything
+# not inside a named phase; reboot / verify are whole post-reboot passes.
+PHASES        = ("tcp", "kex", "auth", "shell", "about", "filters", "sentinels", "sends", "other")
+PHASE_FIELDS  = ["firmware"] + [f"t_{p}" for p in PHASES] + ["t_total", "t_reboot", "t_verify"]
+_phase_runs   = []
+_phase_last   = {}
+_firmware     = {}
+_phase_lock   = threading.Lock()
+_phase_local  = threading.local()
+
+
+class PhaseTimer:
+    """
+    Exclusive monotonic timings for one device run. Entering a nested phase
+    pauses the outer one, so phases add up to the run's total.
+    """
+
+    def __init__(self):
+        self.phases = {}
+        self._stack = []   # [name, started]
+
+    def _add(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        now = time.monotonic()
+        if self._stack:
+            self._add(self._stack[-1][0], now - self._stack[-1][1])
+        self._stack.append([name, now])
+        try:
+            yield
+        finally:
+            now            = time.monotonic()
+            current, start = self._stack.pop()   # may have been renamed by switch()
+            self._add(current, now - start)
+            if self._stack:
+                self._stack[-1][1] = now
+
+    def switch(self, name):
+        """End the current innermost phase and continue timing as name."""
+        if self._stack:
+            now = time.monotonic()
+            self._add(self._stack[-1][0], now - self._stack[-1][1])
+            self._stack[-1] = [name, now]
+
+    @contextlib.contextmanager
+    def active(self, outer):
+        """Make this the calling thread's timer, with outer as the base phase."""
+        _phase_local.timer = self
+        try:
+            with self.phase(outer):
+                yield
+        finally:
+            _phase_local.timer = None
+
+    def total(self):
+        return sum(self.phases.values())
+
+
+def phase(name):
+    """Time a block under name on this thread's active timer (no-op without one)."""
+    timer = getattr(_phase_local, "timer", None)
+    return timer.phase(name) if timer else contextlib.nullcontext()
+
+
+def switch_phase(name):
+    timer = getattr(_phase_local, "timer", None)
+    if timer:
+        timer.switch(name)
+
+
+def record_phases(ip, kind, timer):
+    """Log a finished run for the summary. Returns its firmware string."""
+    firmware = get_snapshot(ip).firmware()
+    with _phase_lock:
+        firmware = _firmware.setdefault(ip, firmware) if not firmware else firmware
+        _firmware[ip] = firmware
+        _phase_runs.append({"kind": kind, "firmware": firmware or "unknown", "phases": dict(timer.phases)})
+        _phase_last[(ip, kind)] = timer.total()
+    return firmware
+
+
+def last_phase_total(ip, kind):
+    with _phase_lock:
+        return round(_phase_last.get((ip, kind), 0.0), 3)
+
+
+def timed_phases(kind, outer):
+    """
+    Decorator for per-device workers fn(ip, ...): times the run by phase and
+    logs it under kind. Dict results also get the PHASE_FIELDS columns.
+    """
+    def wrap(fn):
+        @functools.wraps(fn)
+        def timed(ip, *args, **kwargs):
+            timer = PhaseTimer()
+            with timer.active(outer):
+                res = fn(ip, *args, **kwargs)
+            firmware = record_phases(ip, kind, timer)
+            if isinstance(res, dict):
+                res["firmware"] = firmware
+                res.update({f"t_{p}": round(timer.phases.get(p, 0.0), 3) for p in PHASES})
+                res["t_total"] = round(timer.total(), 3)
+            return res
+        return timed
+    return wrap
+
+
+def reset_phases():
+    with _phase_lock:
+        _phase_runs.clear()
+        _phase_last.clear()
+
+
+def print_phase_summary(action_label):
+    """Histogram of device-seconds per phase, then run time by category and firmware."""
+    with _phase_lock:
+        runs = list(_phase_runs)
+    if not runs:
+        return
+    per_phase = {}
+    for run in runs:
+        for name, secs in run["phases"].items():
+            per_phase.setdefault(name, []).append(secs)
+    grand = sum(sum(v) for v in per_phase.values()) or 1.0
+    print(f"\n  Phase timing ({len(runs)} device runs, {grand:.1f} device-seconds):")
+    print(f"    {'phase':10s} {'total':>8s} {'share':>6s} {'p50':>7s} {'p95':>7s}")
+    for name, vals in sorted(per_phase.items(), key=lambda kv_: -sum(kv_[1])):
+        share = sum(vals) / grand
+        print(f"    {name:10s} {sum(vals):7.1f}s {share:6.0%} {_pct(vals, 50):6.2f}s {_pct(vals, 95):6.2f}s  "
+              f"{'█' * max(1, round(share * 40)) if share >= 0.005 else ''}")
+
+    groups = {}
+    for run in runs:
+        category = action_label if run["kind"] == "apply" else run["kind"]
+        groups.setdefault((category, run["firmware"]), []).append(run["phases"])
+    print(f"\n    {'category':28s} {'firmware':16s} {'n':>5s} {'mean':>7s} {'p95':>7s}  top phase")
+    for (category, firmware), group in sorted(groups.items(),
+                                              key=lambda kv_: -sum(sum(p.values()) for p in kv_[1])):
+        totals = [sum(p.values()) for p in group]
+        spent  = {}
+        for p in group:
+            for name, secs in p.items():
+                spent[name] = spent.get(name, 0.0) + secs
+        top = max(spent, key=spent.get)
+        print(f"    {category[:28]:28s} {firmware[:16]:16s} {len(group):5d} {sum(totals) / len(group):6.2f}s "
+              f"{_pct(totals, 95):6.2f}s  {top} ({spent[top] / (sum(totals) or 1.0):.0%})")
+
+
 def send_cmd(shell, cmd, wait=3.0):
     # Only chunk user commands — they're long and hit the paste buffer limit
     # Other commands send as-is to avoid special character issues
-    CHUNK = 60
+    CHUNK = PASTE_CHUNK
     if cmd.startswith("user ") and len(cmd) > CHUNK:
         for i in range(0, len(cmd), CHUNK):
             shell.send(cmd[i:i+CHUNK])
@@ -74,29 +321,49 @@ def send_cmd(shell, cmd, wait=3.0):
     else:
         shell.send(cmd + "\n")
 
-    output = ""
-    deadline = time.time() + wait + 6
-    while time.time() < deadline:
-        time.sleep(0.5)
-        while shell.recv_ready():
-            output += shell.recv(4096).decode("utf-8", errors="replace")
-        # Look for E-codes only on their own line (not inside echoed command text)
-        for line in output.splitlines():
-            line = line.strip()
-            if line.startswith(("E000", "E001", "E100", "E101", "E102")):
-                return output
-        # apc> on its own line = prompt returned = command completed
-        if "\napc>" in output or "\r\napc>" in output:
-            break
+    # Done when the prompt returns. E-codes only count on their own line (not
+    # inside echoed command text) and get a short grace period for the prompt.
+    ecode_at = []
+
+    def done(output):
+        if _prompt_seen(output):
+            return True
+        if not ecode_at and any(line.strip().startswith(E_CODES) for line in output.splitlines()):
+            ecode_at.append(time.monotonic())
+        return bool(ecode_at) and time.monotonic() - ecode_at[0] >= 0.3
+
+    output, elapsed = _read_until(shell, done, wait + 6)
+    record_latency(cmd, elapsed)
     return output
 
 
-def make_transport(ip):
-    transport = paramiko.Transport((ip, SSH_PORT))
+def send_batch(shell, cmds, wait):
+    """
+    Pipelined send: write cmds in one transmission (caller keeps it within
+    PASTE_CHUNK) and split the reply on apc> prompts, one segment per command.
+    Returns the outputs of the commands whose prompt came back, in order —
+    shorter than cmds if the card stopped answering part way. A short reply
+    has already waited out the full timeout; whatever straggles in after
+    that is drained so it can't be read as the next command's output.
+    """
+    _drain(shell)
+    shell.send("".join(cmd + "\n" for cmd in cmds))
+    output, elapsed = _read_until(shell, lambda out: out.count("apc>") >= len(cmds), wait + 6)
+    record_latency(f"[pipeline x{len(cmds)}]", elapsed)
+    if output.count("apc>") < len(cmds):
+        _drain(shell)
+    # Keep each segment's prompt so outputs classify exactly like send_cmd's
+    return [seg + "apc>" for seg in output.split("apc>")[:-1][:len(cmds)]]
+
+
+def make_transport(target):
+    """Transport with NMC-compatible algorithms. target is an IP or a connected socket."""
+    transport = paramiko.Transport((target, SSH_PORT) if isinstance(target, str) else target)
     transport.banner_timeout = 20
     transport.handshake_timeout = 10
     transport._preferred_keys    = ["ecdsa-sha2-nistp256", "ssh-rsa"]
-    transport._verify_key        = lambda host_key, sig: None
+    # Host keys aren't verified, but the raw key is kept for the identity cache
+    transport._verify_key        = lambda host_key, sig: setattr(transport, "nmc_host_key", host_key)
     transport._preferred_ciphers = ["aes256-ctr", "aes128-ctr", "aes256-cbc", "3des-cbc"]
     transport._preferred_kex     = [
         "ecdh-sha2-nistp256",
@@ -114,31 +381,22 @@ def make_transport(ip):
 
 def connect(ip, username, password):
     import socket
-    sock = socket.create_connection((ip, SSH_PORT), timeout=15)
-    transport = paramiko.Transport(sock)
-    transport.banner_timeout = 20
-    transport.handshake_timeout = 10
-    transport._preferred_keys    = ["ecdsa-sha2-nistp256", "ssh-rsa"]
-    transport._verify_key        = lambda host_key, sig: None
-    transport._preferred_ciphers = ["aes256-ctr", "aes128-ctr", "aes256-cbc", "3des-cbc"]
-    transport._preferred_kex     = [
-        "ecdh-sha2-nistp256",
-        "diffie-hellman-group-exchange-sha256",
-        "diffie-hellman-group-exchange-sha1",
-        "diffie-hellman-group14-sha1",
-    ]
-    transport._preferred_macs    = [
-        "hmac-sha2-256",
-        "hmac-sha1",
-        "hmac-md5",
-    ]
-    transport.connect(hostkey=None, username=username, password=password)
-    client = paramiko.SSHClient()
-    client._transport = transport
-    shell = client.invoke_shell()
-    time.sleep(2)
-    while shell.recv_ready():
-        shell.recv(4096)
+    with phase("tcp"):
+        sock = socket.create_connection((ip, SSH_PORT), timeout=15)
+    transport = make_transport(sock)
+    # start_client + auth_password is what transport.connect() does, split
+    # so key exchange and authentication are timed separately
+    with phase("kex"):
+        transport.start_client()
+    with phase("auth"):
+        transport.auth_password(username, password)
+    with phase("shell"):
+        client = paramiko.SSHClient()
+        client._transport = transport
+        shell = client.invoke_shell()
+        # Wait for the login banner + first prompt, capped at the old fixed 2s
+        _read_until(shell, lambda out: out.rstrip().endswith("apc>"), 2)
+        _drain(shell)
     return client, shell
 
 
@@ -158,6 +416,187 @@ def preflight(ip, username, password):
         return False
 
 
+# ── Session pool ──────────────────────────────────────────────────────────────
+SESSION_IDLE_TIMEOUT = 240   # seconds — stay under the NMC's own session timeout
+SESSION_KEEPALIVE    = 30    # seconds between SSH keepalives on pooled transports
+SESSION_PROBE_AFTER  = 20    # seconds idle before a shell is probed before reuse
+
+
+def _close_quietly(client):
+    try:
+        client.close()
+    except Exception:
+        pass
+
+
+def _shell_alive(shell, idle):
+    """Cheap liveness check — transport up, and a prompt comes back if idle a while."""
+    transport = shell.get_transport()
+    if shell.closed or transport is None or not transport.is_active():
+        return False
+    if idle < SESSION_PROBE_AFTER:
+        return True
+    try:
+        _drain(shell)
+        shell.send("\n")
+        out, _ = _read_until(shell, lambda o: o.rstrip().endswith("apc>"), 3)
+        return out.rstrip().endswith("apc>")
+    except Exception:
+        return False
+
+
+class SessionPool:
+    """
+    Live NMC shells keyed by IP, reused across menu actions in one tool
+    session so each card is only logged into once. A shell is checked out
+    by one worker at a time; entries are evicted on idle timeout, dead
+    transport, or reboot.
+    """
+
+    def __init__(self, idle_timeout=SESSION_IDLE_TIMEOUT):
+        self.idle_timeout = idle_timeout
+        self._sessions    = {}   # ip -> (client, shell, username, last_used)
+        self._lock        = threading.Lock()
+
+    def acquire(self, ip, username, password):
+        """Return (client, shell) — pooled if still alive, else a fresh login."""
+        with self._lock:
+            entry = self._sessions.pop(ip, None)
+        if entry:
+            client, shell, user, last_used = entry
+            idle = time.monotonic() - last_used
+            if user == username and idle < self.idle_timeout and _shell_alive(shell, idle):
+                _drain(shell)
+                return client, shell
+            _close_quietly(client)
+        client, shell = connect(ip, username, password)
+        client.get_transport().set_keepalive(SESSION_KEEPALIVE)
+        return client, shell
+
+    def release(self, ip, client, shell, username):
+        """Return a shell to the pool for later actions."""
+        with self._lock:
+            old = self._sessions.pop(ip, None)
+            self._sessions[ip] = (client, shell, username, time.monotonic())
+        if old and old[0] is not client:
+            _close_quietly(old[0])
+
+    def discard(self, ip, client=None):
+        """Close and forget a session (after reboot or a failed command)."""
+        with self._lock:
+            entry = self._sessions.pop(ip, None)
+        if entry:
+            _close_quietly(entry[0])
+        if client is not None:
+            _close_quietly(client)
+
+    def evict_idle(self):
+        now = time.monotonic()
+        with self._lock:
+            stale = [ip for ip, e in self._sessions.items() if now - e[3] >= self.idle_timeout]
+            entries = [self._sessions.pop(ip) for ip in stale]
+        for entry in entries:
+            _close_quietly(entry[0])
+
+    def close_all(self):
+        with self._lock:
+            entries = list(self._sessions.values())
+            self._sessions.clear()
+        for entry in entries:
+            _close_quietly(entry[0])
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+SESSIONS = SessionPool()
+
+
+# ── Identity cache ────────────────────────────────────────────────────────────
+IDENTITY_TTL  = 7 * 24 * 3600   # seconds a cached identity is trusted
+IDENTITY_FILE = "nmc2_identity.json"
+
+
+def _host_key(shell):
+    """SHA-256 of the card's SSH host key blob — known after kex, no round trip."""
+    blob = getattr(shell.get_transport(), "nmc_host_key", None)
+    return hashlib.sha256(blob).hexdigest() if blob else None
+
+
+class IdentityCache:
+    """
+    NMC identity (generation, app module, AOS version, serial, hostname) by
+    IP, kept on disk between runs so the first action on a card can skip the
+    'about' and 'system' reads. An entry is used only within IDENTITY_TTL and
+    while the card presents the same SSH host key — a replaced or reset card
+    comes back with a new key and is read again.
+    """
+
+    def __init__(self, path):
+        self.path     = path
+        self.refresh  = False   # --refresh-identity: ignore entries, re-read and re-store
+        self._lock    = threading.Lock()
+        self._dirty   = False
+        try:
+            with open(path) as f:
+                self._entries = json.load(f)
+        except (OSError, ValueError):
+            self._entries = {}
+
+    def get(self, ip, host_key):
+        """The cached identity for ip, or None if missing, stale or another card."""
+        if self.refresh or not host_key:
+            return None
+        with self._lock:
+            entry = self._entries.get(ip)
+            if (not entry or entry.get("host_key") != host_key
+                    or time.time() - entry.get("cached", 0) > IDENTITY_TTL):
+                return None
+            return dict(entry)
+
+    def update(self, ip, host_key, **fields):
+        if not host_key:
+            return
+        with self._lock:
+            entry = self._entries.get(ip, {})
+            if entry.get("host_key") != host_key or time.time() - entry.get("cached", 0) > IDENTITY_TTL:
+                entry = {"host_key": host_key, "cached": int(time.time())}
+            entry.update(fields)
+            self._entries[ip] = entry
+            self._dirty       = True
+
+    def forget(self, ip, *fields):
+        with self._lock:
+            entry = self._entries.get(ip, {})
+            for field in fields:
+                self._dirty |= entry.pop(field, None) is not None
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            tmp = self.path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump(self._entries, f, indent=1, sort_keys=True)
+            os.replace(tmp, self.path)
+            self._dirty = False
+
+
+IDENTITY = IdentityCache(os.path.join(os.path.dirname(os.path.abspath(__file__)), IDENTITY_FILE))
+
+
+def _about_identity(about):
+    """Identity fields from lowercase 'about' text."""
+    data = parse_state(about)
+    aos  = re.search(r"name:\s*aos\s.*?version:\s*(\S+)", about, re.S)
+    return {
+        "app":         data.get("name"),
+        "app_version": data.get("version"),
+        "aos_version": aos.group(1) if aos else None,
+        "serial":      data.get("serial number"),
+    }
+
+
 # ── State reader ──────────────────────────────────────────────────────────────
 def read_state(shell, cmd, wait=12):
     """
@@ -165,236 +604,427 @@ def read_state(shell, cmd, wait=12):
     Waits for apc> prompt AFTER E000 to ensure full output is captured.
     """
     # Drain any stale buffer first
-    time.sleep(0.2)
-    while shell.recv_ready():
-        shell.recv(4096)
+    _drain(shell)
 
     shell.send(cmd + "\n")
-    output = ""
-    deadline = time.time() + wait
-    while time.time() < deadline:
-        time.sleep(0.3)
-        while shell.recv_ready():
-            output += shell.recv(4096).decode("utf-8", errors="replace")
+
+    def done(output):
         # Wait for apc> prompt to appear AFTER the E000 line
         # This ensures the full response body has been received
         if "E000" in output and output.rstrip().endswith("apc>"):
-            break
-        if "E001" in output or "E102" in output:
-            break
+            return True
+        return "E001" in output or "E102" in output
 
-    # Drain again after
-    time.sleep(0.3)
-    while shell.recv_ready():
-        shell.recv(4096)
+    output, elapsed = _read_until(shell, done, wait)
+    record_latency(cmd, elapsed)
+    _drain(shell)
 
     return output.lower()
 
 
-def kv(output, key):
-    """Extract value for a key from NMC read output. Returns lowercase string or None."""
-    for line in output.splitlines():
-        if key.lower() in line.lower():
-            parts = line.split(":", 1)
-            if len(parts) == 2:
-                # strip whitespace including tabs
-                return parts[1].strip().strip("\t").strip().lower()
-    return None
+# ── Device state snapshot ─────────────────────────────────────────────────────
+# Snapshot section -> NMC read command
+SNAPSHOT_SECTIONS = {
+    "about":   "about",
+    "web":     "web",
+    "cipher":  "cipher",
+    "console": "console",
+    "ftp":     "ftp",
+    "snmp":    "snmp",
+    "snmpv3":  "snmpv3",
+    "radius":  "radius",
+    "tcpip6":  "tcpip6",
+    "ntp":     "ntp",
+    "smtp":    "smtp",
+    "users":   "user -l",
+    "dns":     "dns",
+}
+
+# Command verb -> snapshot sections a write with that verb can change.
+# Verbs not listed invalidate everything except 'about'.
+WRITE_SECTIONS = {
+    "web":      ("web",),
+    "cipher":   ("cipher",),
+    "console":  ("console",),
+    "ftp":      ("ftp",),
+    "snmp":     ("snmp",),
+    "snmpv3":   ("snmpv3",),
+    "radius":   ("radius",),
+    "tcpip6":   ("tcpip6",),
+    "ntp":      ("ntp",),
+    "smtp":     ("smtp",),
+    "user":     ("users",),
+    "userdflt": ("users",),
+    "dns":      ("dns",),
+    "ups":      (),
+}
+
+_ECODE_LINE = re.compile(r"^e\d{3}:")
+_TABLE_ROW  = re.compile(r"\s{2,}")
+
+
+def parse_state(text):
+    """
+    Parse NMC read output into a dict in a single pass.
+    Handles 'Key: value' lines and column tables ('DH       disabled', as in
+    cipher). Keys/values are lowercase with whitespace collapsed in keys; the
+    first occurrence of a key wins. snmpv3 profile blocks ('Index: N' followed
+    by that profile's fields) are nested under data['profiles'][N].
+    """
+    data     = {}
+    profiles = {}
+    current  = data
+    for line in text.replace("\t", "    ").lower().splitlines():
+        line = line.strip()
+        if not line or line.startswith("apc>") or _ECODE_LINE.match(line):
+            continue
+        if ":" in line:
+            key, val = line.split(":", 1)
+        else:
+            parts = _TABLE_ROW.split(line, 1)
+            if len(parts) != 2:
+                continue
+            key, val = parts
+        key = " ".join(key.split())
+        val = val.strip()
+        if key == "index":
+            current = profiles.setdefault(val, {})
+            continue
+        current.setdefault(key, val)
+    if profiles:
+        data["profiles"] = profiles
+    return data
+
+
+class DeviceSnapshot:
+    """
+    Parsed state of one NMC. Each section is read at most once and served to
+    every filter and verify check until a write invalidates it.
+    """
+
+    def __init__(self, ip):
+        self.ip       = ip
+        self.shell    = None
+        self.host_key = None
+        self._raw     = {}
+        self._parsed  = {}
+
+    def attach(self, shell):
+        """Bind the live shell used to read sections not yet loaded."""
+        self.shell    = shell
+        self.host_key = _host_key(shell)
+        return self
+
+    def identity(self):
+        """On-disk identity for this card, if still valid for the attached session's host key."""
+        return IDENTITY.get(self.ip, self.host_key)
+
+    def load(self, section, wait=12):
+        """Read and parse a section if not cached. Returns the raw (lowercase) text."""
+        if section not in self._raw:
+            text = read_state(self.shell, SNAPSHOT_SECTIONS[section], wait=wait)
+            if not text.strip():
+                return ""  # no response — don't cache, retry next time
+            self._raw[section]    = text
+            self._parsed[section] = parse_state(text)
+        return self._raw[section]
+
+    def load_all(self):
+        for section in SNAPSHOT_SECTIONS:
+            self.load(section, wait=15 if section == "about" else 12)
+        return self
+
+    def section(self, section):
+        self.load(section)
+        return self._parsed.get(section, {})
+
+    def value(self, section, key):
+        """
+        Value for key in section, or None. Falls back to the first key ending
+        with the requested one (e.g. 'server' matches 'smtp server').
+        """
+        data = self.section(section)
+        key  = key.lower().rstrip(":")
+        if key in data:
+            return data[key]
+        for k, v in data.items():
+            if isinstance(v, str) and k.endswith(key):
+                return v
+        return None
+
+    def contains(self, section, text):
+        """Substring check against the section's raw text (tabs as spaces)."""
+        return text in self.load(section).replace("\t", " ")
+
+    def snmpv3_profile(self, n):
+        return self.section("snmpv3").get("profiles", {}).get(str(n), {})
+
+    def user_status(self, username):
+        """Return 'enabled' / 'disabled' for an account, or None if it doesn't exist."""
+        name = username.lower()
+        for line in self.load("users").splitlines():
+            if name in line:
+                return "enabled" if "enabled" in line else "disabled"
+        return None
+
+    def generation(self):
+        """
+        'nmc2' (app module sumx / sy), 'nmc3' (su), or 'nmc1' for anything else.
+        Returns None if the device gave no 'about' output. Served from the
+        identity cache when possible, skipping the 'about' round trip.
+        """
+        if "about" not in self._raw:
+            cached = self.identity()
+            if cached and cached.get("generation"):
+                return cached["generation"]
+        about = self.load("about", wait=15)
+        if not about:
+            return None
+        if "aos" not in about:
+            generation = "nmc1"
+        elif "\tsu\n" in about or "\tsu\r" in about:
+            generation = "nmc3"
+        elif "sumx" in about or "\tsy\n" in about or "\tsy\r" in about:
+            generation = "nmc2"
+        else:
+            generation = "nmc1"
+        IDENTITY.update(self.ip, self.host_key, generation=generation, **_about_identity(about))
+        return generation
+
+    def hostname(self):
+        """System name — from the identity cache, else a 'system' read (then cached)."""
+        cached = self.identity()
+        if cached and cached.get("hostname"):
+            return cached["hostname"]
+        hostname = None
+        for line in send_cmd(self.shell, "system", wait=3).splitlines():
+            if "name" in line.lower() and ":" in line:
+                hostname = line.split(":", 1)[1].strip()
+                break
+        if hostname:
+            IDENTITY.update(self.ip, self.host_key, hostname=hostname)
+        return hostname
+
+    def firmware(self):
+        """'<app module> <version>' from 'about' or the identity cache (no device I/O), or ''."""
+        about = self._parsed.get("about") or IDENTITY.get(self.ip, self.host_key) or {}
+        name, version = about.get("name", about.get("app")), about.get("version", about.get("app_version"))
+        return " ".join(v for v in (name, version) if v)
+
+    def invalidate(self, *sections):
+        """Drop the given sections, or every section when called with none."""
+        for section in sections or list(self._raw):
+            self._raw.pop(section, None)
+            self._parsed.pop(section, None)
+
+    def invalidate_for(self, cmd):
+        """Drop whatever sections a write command may have changed."""
+        verb = cmd.split()[0] if cmd.strip() else ""
+        if verb == "system":
+            IDENTITY.forget(self.ip, "hostname")
+        if verb in WRITE_SECTIONS:
+            sections = WRITE_SECTIONS[verb]
+        else:
+            sections = [s for s in self._raw if s != "about"]
+        if sections:
+            self.invalidate(*sections)
+
+
+_snapshots      = {}
+_snapshots_lock = threading.Lock()
+
+
+def get_snapshot(ip):
+    """Session-wide snapshot for ip, shared across menu actions."""
+    with _snapshots_lock:
+        if ip not in _snapshots:
+            _snapshots[ip] = DeviceSnapshot(ip)
+        return _snapshots[ip]
 
 
 # ── Idempotent command filtering ──────────────────────────────────────────────
-def filter_web(shell, desired_cmds):
+def _split_skipped(desired_cmds, skip):
+    filtered = [(c, d) for c, d in desired_cmds if (c, d) not in skip]
+    skipped  = [(c, d) for c, d in desired_cmds if (c, d) in skip]
+    return filtered, skipped
+
+
+def filter_web(snap, desired_cmds):
     """Skip web/cipher commands already matching desired state."""
-    state     = read_state(shell, "web")
-    cipher_st = read_state(shell, "cipher")
     skip = []
 
     for cmd, desc in desired_cmds:
         already_set = False
-        if   cmd == "web -h disable"   and kv(state, "http:")     == "disabled": already_set = True
-        elif cmd == "web -h enable"    and kv(state, "http:")      == "enabled":  already_set = True
-        elif cmd == "web -s disable"   and kv(state, "https:")     == "disabled": already_set = True
-        elif cmd == "web -s enable"    and kv(state, "https:")     == "enabled":  already_set = True
-        elif cmd == "web -hs enable"   and kv(state, "hsts:")      == "enabled":  already_set = True
-        elif cmd == "web -hs disable"  and kv(state, "hsts:")      == "disabled": already_set = True
+        if   cmd == "web -h disable"   and snap.value("web", "http")  == "disabled": already_set = True
+        elif cmd == "web -h enable"    and snap.value("web", "http")  == "enabled":  already_set = True
+        elif cmd == "web -s disable"   and snap.value("web", "https") == "disabled": already_set = True
+        elif cmd == "web -s enable"    and snap.value("web", "https") == "enabled":  already_set = True
+        elif cmd == "web -hs enable"   and snap.value("web", "hsts")  == "enabled":  already_set = True
+        elif cmd == "web -hs disable"  and snap.value("web", "hsts")  == "disabled": already_set = True
         elif "web -mp" in cmd:
-            cur = kv(state, "minimum protocol:")
+            cur = snap.value("web", "minimum protocol")
             desired = cmd.split()[-1].lower()
             if cur and cur == desired: already_set = True
-        elif cmd == "cipher -dh disable"    and "dh                   disabled" in cipher_st: already_set = True
-        elif cmd == "cipher -rsaau disable" and "rsa authentication   disabled" in cipher_st: already_set = True
-        elif cmd == "cipher -aes enable"    and "aes                  enabled" in cipher_st:  already_set = True
-        elif cmd == "cipher -ecdhe enable"  and "ecdhe                enabled" in cipher_st:  already_set = True
-        elif cmd == "cipher -sha1 enable"   and "sha                  enabled" in cipher_st:  already_set = True
-        elif cmd == "cipher -sha2 enable"   and "sha256               enabled" in cipher_st:  already_set = True
+        elif cmd == "cipher -dh disable"    and snap.value("cipher", "dh")                 == "disabled": already_set = True
+        elif cmd == "cipher -rsaau disable" and snap.value("cipher", "rsa authentication") == "disabled": already_set = True
+        elif cmd == "cipher -aes enable"    and snap.value("cipher", "aes")                == "enabled":  already_set = True
+        elif cmd == "cipher -ecdhe enable"  and snap.value("cipher", "ecdhe")              == "enabled":  already_set = True
+        elif cmd == "cipher -sha1 enable"   and snap.value("cipher", "sha")                == "enabled":  already_set = True
+        elif cmd == "cipher -sha2 enable"   and snap.value("cipher", "sha256")             == "enabled":  already_set = True
 
         if already_set:
             skip.append((cmd, desc))
 
-    filtered = [(c, d) for c, d in desired_cmds if (c, d) not in skip]
-    skipped  = [(c, d) for c, d in desired_cmds if (c, d) in skip]
-    return filtered, skipped
+    return _split_skipped(desired_cmds, skip)
 
 
-def filter_console(shell, desired_cmds):
-    state = read_state(shell, "console").replace("	", " ")
+def filter_console(snap, desired_cmds):
     skip = []
     for cmd, desc in desired_cmds:
         already_set = False
-        if   cmd == "console -t disable" and kv(state, "telnet:") == "disabled": already_set = True
-        elif cmd == "console -t enable"  and kv(state, "telnet:") == "enabled":  already_set = True
-        elif cmd == "console -s disable" and kv(state, "ssh:")    == "disabled": already_set = True
-        elif cmd == "console -s enable"  and kv(state, "ssh:")    == "enabled":  already_set = True
+        if   cmd == "console -t disable" and snap.value("console", "telnet") == "disabled": already_set = True
+        elif cmd == "console -t enable"  and snap.value("console", "telnet") == "enabled":  already_set = True
+        elif cmd == "console -s disable" and snap.value("console", "ssh")    == "disabled": already_set = True
+        elif cmd == "console -s enable"  and snap.value("console", "ssh")    == "enabled":  already_set = True
         if already_set:
             skip.append((cmd, desc))
-    filtered = [(c, d) for c, d in desired_cmds if (c, d) not in skip]
-    skipped  = [(c, d) for c, d in desired_cmds if (c, d) in skip]
-    return filtered, skipped
+    return _split_skipped(desired_cmds, skip)
 
 
-def filter_ftp(shell, desired_cmds):
-    state = read_state(shell, "ftp").replace("	", " ")
+def filter_ftp(snap, desired_cmds):
     skip = []
     for cmd, desc in desired_cmds:
         already_set = False
-        if   cmd == "ftp -S disable" and kv(state, "service:") == "disabled": already_set = True
-        elif cmd == "ftp -S enable"  and kv(state, "service:") == "enabled":  already_set = True
+        if   cmd == "ftp -S disable" and snap.value("ftp", "service") == "disabled": already_set = True
+        elif cmd == "ftp -S enable"  and snap.value("ftp", "service") == "enabled":  already_set = True
         if already_set:
             skip.append((cmd, desc))
-    filtered = [(c, d) for c, d in desired_cmds if (c, d) not in skip]
-    skipped  = [(c, d) for c, d in desired_cmds if (c, d) in skip]
-    return filtered, skipped
+    return _split_skipped(desired_cmds, skip)
 
 
-def filter_snmpv1(shell, desired_cmds):
-    state = read_state(shell, "snmp").replace("	", " ")
+def filter_snmpv1(snap, desired_cmds):
     skip = []
     for cmd, desc in desired_cmds:
         already_set = False
-        if   cmd == "snmp -S disable" and "snmpv1:     disabled" in state: already_set = True
-        elif cmd == "snmp -S enable"  and "snmpv1:     enabled"  in state: already_set = True
+        if   cmd == "snmp -S disable" and snap.value("snmp", "snmpv1") == "disabled": already_set = True
+        elif cmd == "snmp -S enable"  and snap.value("snmp", "snmpv1") == "enabled":  already_set = True
         if already_set:
             skip.append((cmd, desc))
-    filtered = [(c, d) for c, d in desired_cmds if (c, d) not in skip]
-    skipped  = [(c, d) for c, d in desired_cmds if (c, d) in skip]
-    return filtered, skipped
+    return _split_skipped(desired_cmds, skip)
 
 
-def filter_snmpv3(shell, desired_cmds):
-    state = read_state(shell, "snmpv3").replace("	", " ")
+def filter_snmpv3(snap, desired_cmds):
     skip = []
+    snmpv3_val = snap.value("snmpv3", "snmpv3")
     for cmd, desc in desired_cmds:
         already_set = False
-        import re as _re2
-        snmpv3_status = _re2.search(r"snmpv3:\s+(enabled|disabled)", state)
-        snmpv3_val = snmpv3_status.group(1) if snmpv3_status else ""
+        m = re.fullmatch(r"snmpv3 -ac([1-4]) disable", cmd)
         if   cmd == "snmpv3 -S disable" and snmpv3_val == "disabled": already_set = True
         elif cmd == "snmpv3 -S enable"  and snmpv3_val == "enabled":  already_set = True
-        elif cmd == "snmpv3 -ac2 disable" and "index:                2" in state:
-            # Check if profile 2 access is already disabled
-            idx = state.find("index:                2")
-            chunk = state[idx:idx+200]
-            if "access:               disabled" in chunk: already_set = True
-        elif cmd == "snmpv3 -ac3 disable" and "index:                3" in state:
-            idx = state.find("index:                3")
-            chunk = state[idx:idx+200]
-            if "access:               disabled" in chunk: already_set = True
-        elif cmd == "snmpv3 -ac4 disable" and "index:                4" in state:
-            idx = state.find("index:                4")
-            chunk = state[idx:idx+200]
-            if "access:               disabled" in chunk: already_set = True
+        elif m and snap.snmpv3_profile(m.group(1)).get("access") == "disabled":
+            already_set = True
         if already_set:
             skip.append((cmd, desc))
-    filtered = [(c, d) for c, d in desired_cmds if (c, d) not in skip]
-    skipped  = [(c, d) for c, d in desired_cmds if (c, d) in skip]
-    return filtered, skipped
+    return _split_skipped(desired_cmds, skip)
 
 
-def filter_radius(shell, desired_cmds):
-    state = read_state(shell, "radius").replace("	", " ")
+def filter_radius(snap, desired_cmds):
     skip = []
     for cmd, desc in desired_cmds:
         already_set = False
-        if   cmd == "radius -a local"       and "local only"          in state: already_set = True
-        elif cmd == "radius -a radiusLocal" and "radius, local"       in state: already_set = True
-        elif cmd == "radius -a radius"      and "radius only"         in state: already_set = True
+        if   cmd == "radius -a local"       and snap.contains("radius", "local only"):    already_set = True
+        elif cmd == "radius -a radiusLocal" and snap.contains("radius", "radius, local"): already_set = True
+        elif cmd == "radius -a radius"      and snap.contains("radius", "radius only"):   already_set = True
         if already_set:
             skip.append((cmd, desc))
-    filtered = [(c, d) for c, d in desired_cmds if (c, d) not in skip]
-    skipped  = [(c, d) for c, d in desired_cmds if (c, d) in skip]
-    return filtered, skipped
+    return _split_skipped(desired_cmds, skip)
 
 
-def filter_ipv6(shell, desired_cmds):
-    state = read_state(shell, "tcpip6").replace("	", " ")
+def filter_ipv6(snap, desired_cmds):
     skip = []
     for cmd, desc in desired_cmds:
         already_set = False
-        if   cmd == "tcpip6 -S disable" and kv(state, "ipv6:") == "disabled": already_set = True
-        elif cmd == "tcpip6 -S enable"  and kv(state, "ipv6:") == "enabled":  already_set = True
+        if   cmd == "tcpip6 -S disable" and snap.value("tcpip6", "ipv6") == "disabled": already_set = True
+        elif cmd == "tcpip6 -S enable"  and snap.value("tcpip6", "ipv6") == "enabled":  already_set = True
         if already_set:
             skip.append((cmd, desc))
-    filtered = [(c, d) for c, d in desired_cmds if (c, d) not in skip]
-    skipped  = [(c, d) for c, d in desired_cmds if (c, d) in skip]
-    return filtered, skipped
+    return _split_skipped(desired_cmds, skip)
 
 
-def filter_ntp(shell, desired_cmds):
-    state = read_state(shell, "ntp").replace("	", " ")
+def filter_ntp(snap, desired_cmds):
     skip = []
     for cmd, desc in desired_cmds:
         already_set = False
-        if   cmd == "ntp -e enable"  and "ntp status: enabled"  in state: already_set = True
-        elif cmd == "ntp -e disable" and "ntp status: disabled" in state: already_set = True
+        if   cmd == "ntp -e enable"  and snap.value("ntp", "ntp status") == "enabled":  already_set = True
+        elif cmd == "ntp -e disable" and snap.value("ntp", "ntp status") == "disabled": already_set = True
         elif cmd.startswith("ntp -p"):
             desired_ip = cmd.split()[-1]
-            cur = kv(state, "primary ntp server:")
+            cur = snap.value("ntp", "primary ntp server")
             if cur and cur == desired_ip.lower(): already_set = True
         elif cmd.startswith("ntp -s"):
             desired_ip = cmd.split()[-1]
-            cur = kv(state, "secondary ntp server:")
+            cur = snap.value("ntp", "secondary ntp server")
             if cur and cur == desired_ip.lower(): already_set = True
         if already_set:
             skip.append((cmd, desc))
-    filtered = [(c, d) for c, d in desired_cmds if (c, d) not in skip]
-    skipped  = [(c, d) for c, d in desired_cmds if (c, d) in skip]
-    return filtered, skipped
+    return _split_skipped(desired_cmds, skip)
 
 
-def filter_smtp(shell, desired_cmds):
-    state = read_state(shell, "smtp").replace("	", " ")
+def filter_smtp(snap, desired_cmds):
     skip = []
     for cmd, desc in desired_cmds:
         already_set = False
         if cmd == "smtp -s 0.0.0.0":
-            cur = kv(state, "server:")
-            if cur and cur.strip() == "0.0.0.0": already_set = True
+            cur = snap.value("smtp", "server")
+            if cur and cur == "0.0.0.0": already_set = True
         elif cmd.startswith("smtp -s"):
             desired = cmd.split()[-1].strip().lower()
-            cur = kv(state, "server:")
-            if cur and cur.strip().lower() == desired: already_set = True
+            cur = snap.value("smtp", "server")
+            if cur and cur == desired: already_set = True
         elif cmd.startswith("smtp -p"):
             desired = cmd.split()[-1]
-            cur = kv(state, "port:")
-            if cur and cur.strip() == desired: already_set = True
+            cur = snap.value("smtp", "port")
+            if cur and cur == desired: already_set = True
         elif cmd.startswith("smtp -f"):
             desired = cmd.split(None, 2)[-1].lower()
-            cur = kv(state, "from:")
-            if cur and cur.strip().lower() == desired: already_set = True
+            cur = snap.value("smtp", "from")
+            if cur and cur == desired: already_set = True
         elif cmd.startswith("__hostname_from__"):
             # Can't pre-check hostname-based from — always let it through
             pass
         elif cmd.startswith("smtp -e"):
             desired = cmd.split()[-1].lower()
-            cur = kv(state, "encryption:")
-            if cur and cur.strip().lower() == desired: already_set = True
-        elif cmd == "smtp -a enable"  and kv(state, "auth:") == "enabled":  already_set = True
-        elif cmd == "smtp -a disable" and kv(state, "auth:") == "disabled": already_set = True
+            cur = snap.value("smtp", "encryption")
+            if cur and cur == desired: already_set = True
+        elif cmd == "smtp -a enable"  and snap.value("smtp", "auth") == "enabled":  already_set = True
+        elif cmd == "smtp -a disable" and snap.value("smtp", "auth") == "disabled": already_set = True
         if already_set:
             skip.append((cmd, desc))
-    filtered = [(c, d) for c, d in desired_cmds if (c, d) not in skip]
-    skipped  = [(c, d) for c, d in desired_cmds if (c, d) in skip]
-    return filtered, skipped
+    return _split_skipped(desired_cmds, skip)
+
+
+def filter_dns(snap, desired_cmds):
+    skip = []
+    for cmd, desc in desired_cmds:
+        already_set = False
+        parts = cmd.split(None, 2)
+        desired = parts[-1].lower() if len(parts) == 3 else None
+        if   cmd.startswith("dns -p") and snap.value("dns", "primary dns server")   == desired: already_set = True
+        elif cmd.startswith("dns -s") and snap.value("dns", "secondary dns server") == desired: already_set = True
+        elif cmd.startswith("dns -d") and snap.value("dns", "domain name")          == desired: already_set = True
+        if already_set:
+            skip.append((cmd, desc))
+    return _split_skipped(desired_cmds, skip)
+
+
+def filter_user(snap, desired_cmds):
+    """Only account enable/disable can be checked from 'user -l'."""
+    skip = []
+    for cmd, desc in desired_cmds:
+        m = re.fullmatch(r"user -n (\S+) -e (enable|disable)", cmd)
+        if m and snap.user_status(m.group(1)) == m.group(2) + "d":
+            skip.append((cmd, desc))
+    return _split_skipped(desired_cmds, skip)
 
 
 # Maps action label prefix to filter function
@@ -408,9 +1038,52 @@ STATE_FILTERS = {
     "ipv6":     filter_ipv6,
     "ntp":      filter_ntp,
     "smtp":     filter_smtp,
+    "dns":      filter_dns,
+    "user":     filter_user,
+}
+
+# Maps command verb to the STATE_FILTERS key that can check it
+CMD_FILTER_KEYS = {
+    "web":               "web",
+    "cipher":            "web",
+    "console":           "console",
+    "ftp":               "ftp",
+    "snmp":              "snmpv1",
+    "snmpv3":            "snmpv3",
+    "radius":            "radius",
+    "tcpip6":            "ipv6",
+    "ntp":               "ntp",
+    "smtp":              "smtp",
+    "__hostname_from__": "smtp",
+    "dns":               "dns",
+    "user":              "user",
 }
 
 
+def _filter_key(cmd):
+    verb = cmd.split()[0] if cmd.strip() else ""
+    if verb.startswith("__hostname_from__"):
+        verb = "__hostname_from__"
+    return CMD_FILTER_KEYS.get(verb)
+
+
+def filter_pending(snap, cmds):
+    """
+    Run every command through the filter for its own area, so one command
+    list can mix areas (web + ftp + ntp ...). Order is preserved.
+    Returns (pending, skipped).
+    """
+    groups = {}
+    for cmd, desc in cmds:
+        groups.setdefault(_filter_key(cmd), []).append((cmd, desc))
+    skip = set()
+    for key, group in groups.items():
+        if key in STATE_FILTERS:
+            _, skipped = STATE_FILTERS[key](snap, group)
+            skip.update(skipped)
+    return _split_skipped(cmds, skip)
+
+
 # ── Command builders ──────────────────────────────────────────────────────────
 def build_snmpv3_configure(cfg):
     """Configure a specific SNMPv3 profile (1-4)."""
@@ -494,7 +1167,104 @@ def build_dns(cfg):
 
 
 # ── Execution engine ──────────────────────────────────────────────────────────
-def run_commands(ip, username, password, cmds, action_label, dry_run):
+def _error_status(e):
+    """Map a connection/session exception to (status, detail)."""
+    if isinstance(e, paramiko.AuthenticationException):
+        return "AUTH_FAILED", "SSH authentication failed"
+    if isinstance(e, paramiko.ssh_exception.NoValidConnectionsError):
+        return "CONN_REFUSED", "SSH connection refused"
+    if isinstance(e, paramiko.ssh_exception.IncompatiblePeer):
+        return "SSH_INCOMPATIBLE", f"SSH algorithm mismatch: {e}"
+    if isinstance(e, TimeoutError):
+        return "TIMEOUT", "SSH connection timed out"
+    return "ERROR", str(e)[:150]
+
+
+def _prepare_cmds(snap, cmds):
+    """
+    NMC generation check, idempotency filter and NMC3 cipher swap.
+    Returns (status, detail, pending, skipped) — status is None when there
+    is something to send.
+    """
+    # NMC version check — NMC2 app module is sumx (Smart-UPS) or sy
+    # (Symmetra), NMC3 is su; all appear alongside aos in the about output
+    with phase("about"):
+        generation = snap.generation()
+    if generation is None:
+        return "NO_RESPONSE", "Device connected but returned no output — may be mid-reboot", [], []
+    if generation == "nmc1":
+        return "SKIPPED_NMC1", "Device identified as NMC1 — not supported", [], []
+
+    # Idempotency — filter commands already matching desired state
+    with phase("filters"):
+        cmds, skipped = filter_pending(snap, cmds)
+    if not cmds:
+        return "ALREADY_SET", "All settings already match desired state — no changes made", [], skipped
+
+    # For NMC3 devices, replace cipher commands with web -cs equivalent
+    if generation == "nmc3":
+        swapped = []
+        has_cipher_cmds = any(c.startswith("cipher") for c, d in cmds)
+        for cmd, desc in cmds:
+            if cmd.startswith("cipher"):
+                continue
+            swapped.append((cmd, desc))
+        if has_cipher_cmds:
+            swapped.append(("web -cs 4", "Set cipher suite to maximum security level (NMC3)"))
+        cmds = swapped
+
+    return None, "", cmds, skipped
+
+
+def _cmd_wait(cmd):
+    if cmd.startswith("user"):
+        return 15
+    if cmd.startswith("smtp"):
+        return 10
+    return 3
+
+
+def _pipeline_batch(queue):
+    """
+    Leading commands of queue that can share one transmission: plain
+    commands (no sentinels, no reboot) whose combined length fits PASTE_CHUNK.
+    """
+    batch, size = [], 0
+    for cmd, description in queue:
+        if cmd.startswith("__") or cmd.startswith("reboot") or size + len(cmd) + 1 > PASTE_CHUNK:
+            break
+        batch.append((cmd, description))
+        size += len(cmd) + 1
+    return batch
+
+
+def _record_send(result, failures, reboot_cmds, description, out):
+    """Classify one command's output by E-code into the result counters."""
+    if "E000" in out or ("apc>" in out and "E0" not in out):
+        result["actions_ok"] += 1
+    elif "E002" in out:
+        result["actions_ok"] += 1
+        reboot_cmds.append(description)
+    elif "E101" in out:
+        pass  # Command not found — firmware variation, skip
+    else:
+        result["actions_fail"] += 1
+        # Extract error code from output if present
+        err_code = ""
+        for token in out.split():
+            if token.startswith("E") and token[1:].isdigit():
+                err_code = f" ({token})"
+                break
+        failures.append(f"{description}{err_code}: {sanitize(out.strip()[:120])}")
+
+
+@timed_phases("apply", "other")
+def run_commands(ip, username, password, cmds, action_label, dry_run, planned=False):
+    """
+    Apply cmds to one device over a pooled session. planned=True means cmds
+    come from a saved plan (already filtered and NMC3-adjusted), so state is
+    not read again.
+    """
     result = {
         "ip":           ip,
         "status":       "UNKNOWN",
@@ -511,60 +1281,29 @@ def run_commands(ip, username, password, cmds, action_label, dry_run):
         result["actions_ok"] = len(cmds)
         return result
 
+    client = None
     try:
-        client, shell = connect(ip, username, password)
+        client, shell = SESSIONS.acquire(ip, username, password)
+        snap = get_snapshot(ip).attach(shell)
 
-        # NMC version check
-        about_out = read_state(shell, "about", wait=15)
-        if not about_out:
-            client.close()
-            result["status"] = "NO_RESPONSE"
-            result["detail"] = "Device connected but returned no output — may be mid-reboot"
-            return result
-        # NMC2 runs sumx (Smart-UPS) or Symmetra APP as the application module
-        about_lower = about_out.lower()
-        # NMC2 app module is sumx (Smart-UPS) or sy (Symmetra)
-        # Both always appear alongside aos in the about output
-        is_nmc2 = ("sumx" in about_lower or "\tsy\n" in about_lower or "\tsy\r" in about_lower or "\tsu\n" in about_lower or "\tsu\r" in about_lower) and "aos" in about_lower
-        if not is_nmc2:
-            client.close()
-            result["status"] = "SKIPPED_NMC1"
-            result["detail"] = "Device identified as NMC1 — not supported"
-            return result
-        is_nmc3 = ("\tsu\n" in about_lower or "\tsu\r" in about_lower)
-
-        # Idempotency — filter commands already matching desired state
-        filter_key = action_label.split("_")[0]
-        if filter_key in STATE_FILTERS:
-            cmds, skipped = STATE_FILTERS[filter_key](shell, cmds)
+        if not planned:
+            status, detail, cmds, skipped = _prepare_cmds(snap, cmds)
             result["skipped"] = len(skipped)
-            if skipped:
-                skipped_names = ", ".join(d for _, d in skipped)
-        else:
-            skipped = []
-
-        if not cmds:
-            client.close()
-            result["status"] = "ALREADY_SET"
-            result["detail"] = "All settings already match desired state — no changes made"
-            return result
+            if status:
+                if status == "ALREADY_SET":
+                    SESSIONS.release(ip, client, shell, username)
+                else:
+                    SESSIONS.discard(ip, client)
+                result["status"] = status
+                result["detail"] = detail
+                return result
 
         failures     = []
         reboot_cmds  = []
-
-        # For NMC3 devices, replace cipher commands with web -cs equivalent
-        if is_nmc3:
-            swapped = []
-            has_cipher_cmds = any(c.startswith("cipher") for c, d in cmds)
-            for cmd, desc in cmds:
-                if cmd.startswith("cipher"):
-                    continue
-                swapped.append((cmd, desc))
-            if has_cipher_cmds:
-                swapped.append(("web -cs 4", "Set cipher suite to maximum security level (NMC3)"))
-            cmds = swapped
+        keep_session = True
 
         # Resolve special sentinel commands before executing
+        switch_phase("sentinels")
         resolved_cmds = []
         for cmd, description in cmds:
             if cmd.startswith("__user_create__"):
@@ -574,16 +1313,10 @@ def run_commands(ip, username, password, cmds, action_label, dry_run):
                 new_pass     = parts[1]
                 enable_mode  = parts[2] if len(parts) > 2 else "1"
 
-                # Read current user list
-                user_out = read_state(shell, "user -l")
-                user_exists  = new_user.lower() in user_out
-                user_enabled = False
-                if user_exists:
-                    # Find the line with this username and check status
-                    for line in user_out.splitlines():
-                        if new_user.lower() in line.lower():
-                            user_enabled = "enabled" in line.lower()
-                            break
+                # Current user list comes from the snapshot
+                user_status  = snap.user_status(new_user)
+                user_exists  = user_status is not None
+                user_enabled = user_status == "enabled"
 
                 if user_exists and user_enabled:
                     # Already exists and enabled — skip
@@ -603,13 +1336,8 @@ def run_commands(ip, username, password, cmds, action_label, dry_run):
                     ))
 
             elif cmd.startswith("__hostname_from__"):
-                domain = cmd.replace("__hostname_from__", "")
-                sys_out = send_cmd(shell, "system", wait=3)
-                hostname = None
-                for line in sys_out.splitlines():
-                    if "name" in line.lower() and ":" in line:
-                        hostname = line.split(":", 1)[1].strip()
-                        break
+                domain   = cmd.replace("__hostname_from__", "")
+                hostname = snap.hostname()
                 if hostname:
                     from_addr = f"{hostname}@{domain}"
                     resolved_cmds.append((f"smtp -f {from_addr}", f"Set from address to {from_addr}"))
@@ -620,9 +1348,15 @@ def run_commands(ip, username, password, cmds, action_label, dry_run):
                 resolved_cmds.append((cmd, description))
         cmds = resolved_cmds
 
-        for cmd, description in cmds:
+        switch_phase("sends")
+        queue = list(cmds)
+        while queue:
+            cmd, description = queue[0]
             if cmd == "reboot__confirm":
                 # Send reboot + YES as single transmission before connection drops
+                queue.pop(0)
+                snap.invalidate()
+                keep_session = False
                 try:
                     shell.send("reboot\n")
                     time.sleep(1)
@@ -632,31 +1366,38 @@ def run_commands(ip, username, password, cmds, action_label, dry_run):
                 except Exception:
                     result["actions_ok"] += 1  # Connection drop is expected
                 continue
-            if cmd.startswith("user"):
-                wait = 15
-            elif cmd.startswith("smtp"):
-                wait = 10
-            else:
-                wait = 3
-            out = send_cmd(shell, cmd, wait=wait)
-            if "E000" in out or ("apc>" in out and "E0" not in out):
-                result["actions_ok"] += 1
-            elif "E002" in out:
-                result["actions_ok"] += 1
-                reboot_cmds.append(description)
-            elif "E101" in out:
-                pass  # Command not found — firmware variation, skip
+
+            batch = _pipeline_batch(queue) if PIPELINE else []
+            if len(batch) > 1:
+                outs  = send_batch(shell, [c for c, d in batch], sum(_cmd_wait(c) for c, d in batch))
+                queue = queue[len(batch):]
             else:
-                result["actions_fail"] += 1
-                # Extract error code from output if present
-                err_code = ""
-                for token in out.split():
-                    if token.startswith("E") and token[1:].isdigit():
-                        err_code = f" ({token})"
-                        break
-                failures.append(f"{description}{err_code}: {sanitize(out.strip()[:120])}")
+                outs  = [send_cmd(shell, cmd, wait=_cmd_wait(cmd))]
+                batch = [queue.pop(0)]
+
+            for (cmd, description), out in zip(batch, outs):
+                snap.invalidate_for(cmd)
+                if cmd.startswith("user -del ") and cmd.split()[-1].lower() == username.lower():
+                    keep_session = False  # logged-in account no longer exists
+                _record_send(result, failures, reboot_cmds, description, out)
+
+            if len(outs) < len(batch):
+                # The card may still act on these, so they are never re-sent;
+                # the session's state is unknown from here on.
+                for cmd, description in batch[len(outs):]:
+                    result["actions_fail"] += 1
+                    failures.append(f"{description}: NO_RESPONSE (sent, no reply — not retried)")
+                for cmd, description in queue:
+                    result["actions_fail"] += 1
+                    failures.append(f"{description}: not sent (card stopped answering)")
+                snap.invalidate()
+                keep_session = False
+                break
 
-        client.close()
+        if keep_session:
+            SESSIONS.release(ip, client, shell, username)
+        else:
+            SESSIONS.discard(ip, client)
 
         reboot_note = f" | REBOOT REQUIRED for: {', '.join(reboot_cmds)}" if reboot_cmds else ""
         total_cmds  = result['actions_ok'] + result['actions_fail'] + result['skipped']
@@ -684,25 +1425,16 @@ def run_commands(ip, username, password, cmds, action_label, dry_run):
                     f"{'; '.join(failures[:2])}{reboot_note}"
                 )
 
-    except paramiko.AuthenticationException:
-        result["status"] = "AUTH_FAILED"
-        result["detail"] = "SSH authentication failed"
-    except paramiko.ssh_exception.NoValidConnectionsError:
-        result["status"] = "CONN_REFUSED"
-        result["detail"] = "SSH connection refused"
-    except paramiko.ssh_exception.IncompatiblePeer as e:
-        result["status"] = "SSH_INCOMPATIBLE"
-        result["detail"] = f"SSH algorithm mismatch: {e}"
-    except TimeoutError:
-        result["status"] = "TIMEOUT"
-        result["detail"] = "SSH connection timed out"
     except Exception as e:
-        result["status"] = "ERROR"
-        result["detail"] = str(e)[:150]
+        result["status"], result["detail"] = _error_status(e)
+
+    if result["status"] in ("AUTH_FAILED", "CONN_REFUSED", "SSH_INCOMPATIBLE", "TIMEOUT", "ERROR"):
+        SESSIONS.discard(ip, client)
 
     return result
 
 
+@timed_phases("reboot", "reboot")
 def _reboot_nmc(ip, username, password, retries=3, retry_delay=10):
     """
     Send reboot + YES to a single device with retry logic.
@@ -711,10 +1443,13 @@ def _reboot_nmc(ip, username, password, retries=3, retry_delay=10):
     last_error = ""
     for attempt in range(1, retries + 1):
         try:
-            client, shell = connect(ip, username, password)
-            send_cmd(shell, "reboot", wait=3)
-            send_cmd(shell, "YES", wait=5)
-            client.close()
+            client, shell = SESSIONS.acquire(ip, username, password)
+            get_snapshot(ip).invalidate()
+            try:
+                send_cmd(shell, "reboot", wait=3)
+                send_cmd(shell, "YES", wait=5)
+            finally:
+                SESSIONS.discard(ip, client)
             return True, f"Reboot sent (attempt {attempt})"
         except paramiko.AuthenticationException:
             return False, "AUTH_FAILED — wrong credentials"
@@ -736,63 +1471,121 @@ def _reboot_nmc(ip, username, password, retries=3, retry_delay=10):
     return False, f"FAILED after {retries} attempts — {last_error}"
 
 
-def _wait_for_device(ip, username, password, timeout=180):
+PROBE_CONNECT_TIMEOUT = 3    # seconds for the non-blocking TCP connect
+PROBE_BANNER_TIMEOUT  = 5    # seconds to wait for the SSH banner once connected
+PROBE_BACKOFF_MIN     = 2    # seconds — first retry delay
+PROBE_BACKOFF_MAX     = 15   # seconds — retry delay cap
+
+
+async def _ssh_banner_seen(ip):
+    """Stages 1+2: TCP connect, then read only the SSH identification banner."""
+    try:
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(ip, SSH_PORT), timeout=PROBE_CONNECT_TIMEOUT)
+    except (OSError, asyncio.TimeoutError):
+        return False
+    try:
+        # RFC 4253 allows other lines before the SSH- identification string
+        for _ in range(5):
+            line = await asyncio.wait_for(reader.readline(), timeout=PROBE_BANNER_TIMEOUT)
+            if not line:
+                return False
+            if line.startswith(b"SSH-"):
+                return True
+        return False
+    except (OSError, asyncio.TimeoutError):
+        return False
+    finally:
+        writer.close()
+
+
+def _auth_probe(ip, username, password):
     """
-    Poll device via SSH until it responds or timeout expires.
-    SSH_INCOMPATIBLE = device is up but uses legacy kex — treat as online.
-    Returns (True, elapsed_seconds) on success, (False, timeout) on failure.
+    Stage 3: one key exchange + password auth. True if the SSH stack is up.
+    AUTH_FAILED / SSH_INCOMPATIBLE also mean the device is up.
     """
     import socket as _socket
-    start = time.time()
-    while time.time() - start < timeout:
-        try:
-            # Step 1: quick TCP check with short timeout
-            sock = _socket.create_connection((ip, SSH_PORT), timeout=5)
-            # Step 2: reuse socket for paramiko with short banner timeout
-            transport = paramiko.Transport(sock)
-            transport.banner_timeout  = 8
-            transport.handshake_timeout = 8
-            transport._preferred_keys    = ["ecdsa-sha2-nistp256", "ssh-rsa"]
-            transport._verify_key        = lambda host_key, sig: None
-            transport._preferred_ciphers = ["aes256-ctr", "aes128-ctr", "aes256-cbc", "3des-cbc"]
-            transport._preferred_kex     = [
-                "ecdh-sha2-nistp256",
-                "diffie-hellman-group-exchange-sha256",
-                "diffie-hellman-group-exchange-sha1",
-                "diffie-hellman-group14-sha1",
-            ]
-            transport._preferred_macs = ["hmac-sha2-256", "hmac-sha1", "hmac-md5"]
-            transport.connect(hostkey=None, username=username, password=password)
-            transport.close()
-            return True, int(time.time() - start)
-        except paramiko.AuthenticationException:
-            return True, int(time.time() - start)
-        except paramiko.ssh_exception.IncompatiblePeer:
-            return True, int(time.time() - start)
-        except _socket.timeout:
-            time.sleep(3)
-        except ConnectionRefusedError:
-            time.sleep(3)
-        except Exception:
-            time.sleep(3)
+    try:
+        sock = _socket.create_connection((ip, SSH_PORT), timeout=5)
+        transport = make_transport(sock)
+        transport.banner_timeout    = 8
+        transport.handshake_timeout = 8
+        transport.connect(hostkey=None, username=username, password=password)
+        transport.close()
+        return True
+    except paramiko.AuthenticationException:
+        return True
+    except paramiko.ssh_exception.IncompatiblePeer:
+        return True
+    except Exception:
+        return False
+
+
+async def _wait_for_device(ip, username, password, timeout=180, executor=None):
+    """
+    Staged probe until the device's SSH stack is up or timeout expires:
+    non-blocking TCP connect, then the SSH banner, and only once the banner
+    is seen a single auth attempt (in the executor). Retries use jittered
+    exponential backoff so booting cards aren't hammered.
+    Returns (True, elapsed_seconds) on success, (False, timeout) on failure.
+    """
+    loop  = asyncio.get_running_loop()
+    start = loop.time()
+    delay = PROBE_BACKOFF_MIN
+    while loop.time() - start < timeout:
+        if await _ssh_banner_seen(ip):
+            if await loop.run_in_executor(executor, _auth_probe, ip, username, password):
+                return True, int(loop.time() - start)
+        remaining = timeout - (loop.time() - start)
+        await asyncio.sleep(max(0, min(remaining, delay * random.uniform(0.5, 1.5))))
+        delay = min(delay * 2, PROBE_BACKOFF_MAX)
     return False, timeout
 
 
-def _verify_config(ip, username, password, action_label):
+# Settings a state filter can confirm as applied (one-shot actions like
+# 'ntp -u' or password/timeout changes can't be read back)
+_CHECKABLE = re.compile(
+    r"^(web|cipher|console|ftp|snmp|snmpv3|radius|tcpip6|dns|smtp) -\w+ \S+$"
+    r"|^ntp -[eps] \S+$"
+    r"|^user -n \S+ -e (enable|disable)$"
+)
+
+
+def _verify_desired(snap, cmds):
+    """Re-diff a desired-state command list against fresh state. Returns (verified, detail)."""
+    checkable = [(c, d) for c, d in cmds if _CHECKABLE.match(c)]
+    if snap.generation() == "nmc3":
+        checkable = [(c, d) for c, d in checkable if not c.startswith("cipher")]
+    pending, _ = filter_pending(snap, checkable)
+    confirmed  = f"{len(checkable) - len(pending)}/{len(checkable)} settings confirmed"
+    if pending:
+        return False, f"{confirmed}, still pending: {', '.join(d for _, d in pending[:3])}"
+    return True, confirmed
+
+
+@timed_phases("verify", "verify")
+def _verify_config(ip, username, password, action_label, cmds=None):
     """
     Re-read relevant config after reboot and verify key settings.
+    Desired-state runs pass their command list and are verified by re-diffing it.
     Returns (verified: bool, detail: str)
     """
+    client = None
     try:
-        client, shell = connect(ip, username, password)
+        client, shell = SESSIONS.acquire(ip, username, password)
+        snap     = get_snapshot(ip).attach(shell)
         verified = False
         detail   = "No verification rule for this action"
 
         label = action_label.lower()
 
+        if label == DESIRED_LABEL and cmds is not None:
+            verified, detail = _verify_desired(snap, cmds)
+            SESSIONS.release(ip, client, shell, username)
+            return verified, detail
+
         if "ftp" in label:
-            out = read_state(shell, "ftp")
-            svc = kv(out, "service:")
+            svc = snap.value("ftp", "service")
             if "enable" in label and svc == "enabled":
                 verified, detail = True, "FTP confirmed enabled"
             elif "disable" in label and svc == "disabled":
@@ -801,10 +1594,9 @@ def _verify_config(ip, username, password, action_label):
                 verified, detail = False, f"FTP service={svc} (unexpected)"
 
         elif "web" in label:
-            out  = read_state(shell, "web")
-            http = kv(out, "http:")
-            https = kv(out, "https:")
-            tls   = kv(out, "minimum protocol:")
+            http  = snap.value("web", "http")
+            https = snap.value("web", "https")
+            tls   = snap.value("web", "minimum protocol")
             if "harden" in label:
                 if http == "disabled" and https == "enabled" and tls == "tls1.2":
                     verified, detail = True, f"HTTP={http}, HTTPS={https}, TLS={tls}"
@@ -814,9 +1606,8 @@ def _verify_config(ip, username, password, action_label):
                 verified, detail = True, f"HTTP={http}, HTTPS={https}, TLS={tls}"
 
         elif "console" in label:
-            out     = read_state(shell, "console")
-            telnet  = kv(out, "telnet:")
-            ssh     = kv(out, "ssh:")
+            telnet = snap.value("console", "telnet")
+            ssh    = snap.value("console", "ssh")
             if "harden" in label:
                 if telnet == "disabled" and ssh == "enabled":
                     verified, detail = True, f"Telnet={telnet}, SSH={ssh}"
@@ -826,18 +1617,15 @@ def _verify_config(ip, username, password, action_label):
                 verified, detail = True, f"Telnet={telnet}, SSH={ssh}"
 
         elif "radius" in label:
-            out    = read_state(shell, "radius")
-            access = kv(out, "access:")
+            access = snap.value("radius", "access")
             verified, detail = True, f"RADIUS access={access}"
 
         elif "snmpv1" in label:
-            out  = read_state(shell, "snmp")
-            v1   = "enabled" if "snmpv1:     enabled" in out else "disabled"
+            v1 = "enabled" if snap.value("snmp", "snmpv1") == "enabled" else "disabled"
             verified, detail = True, f"SNMPv1={v1}"
 
         elif "ipv6" in label:
-            out  = read_state(shell, "tcpip6")
-            ipv6 = kv(out, "ipv6:")
+            ipv6 = snap.value("tcpip6", "ipv6")
             if "disable" in label and ipv6 == "disabled":
                 verified, detail = True, "IPv6 confirmed disabled"
             elif "enable" in label and ipv6 == "enabled":
@@ -846,130 +1634,431 @@ def _verify_config(ip, username, password, action_label):
                 verified, detail = False, f"IPv6={ipv6} (unexpected)"
 
         elif "ntp" in label:
-            out    = read_state(shell, "ntp")
-            status = "enabled" if "ntp status: enabled" in out else "disabled"
+            status = "enabled" if snap.value("ntp", "ntp status") == "enabled" else "disabled"
             verified, detail = True, f"NTP={status}"
 
         elif "snmpv3" in label:
-            out = read_state(shell, "snmpv3")
-            if "snmpv3:       enabled" in out:
+            snmpv3 = snap.value("snmpv3", "snmpv3")
+            if snmpv3 == "enabled":
                 verified, detail = True, "SNMPv3 enabled"
-            elif "snmpv3:       disabled" in out:
+            elif snmpv3 == "disabled":
                 verified, detail = False, "SNMPv3 still disabled"
             else:
                 verified, detail = True, "SNMPv3 state read"
 
-        elif "snmpv1" in label:
-            out = read_state(shell, "snmp")
-            v1  = "enabled" if "snmpv1:     enabled" in out else "disabled"
-            verified, detail = True, f"SNMPv1={v1}"
-
-        client.close()
+        SESSIONS.release(ip, client, shell, username)
         return verified, detail
 
     except Exception as e:
+        SESSIONS.discard(ip, client)
         return False, f"Verify connect failed: {str(e)[:80]}"
 
 
-def _reboot_and_verify_fleet(reboot_ips, username, password, action_label, results):
+# ── Adaptive concurrency ──────────────────────────────────────────────────────
+ADAPTIVE          = True       # --fixed-concurrency turns this off
+CONCURRENCY_FLOOR = 2
+CONCURRENCY_CEIL  = 64
+LABEL_CONCURRENCY = {"smtp": 8}   # starting limit by action label substring (--concurrency-for)
+CONGESTION        = ("TIMEOUT", "CONN_REFUSED", "NO_RESPONSE")
+CONGESTION_RATE   = 0.2        # share of the recent window that triggers a halving
+LATENCY_DRIFT     = 1.5        # success latency above baseline x this stops increases
+
+
+def _congested(res):
+    """TIMEOUT/refused/silent devices and SSH banner failures mean we're pushing too hard."""
+    if not isinstance(res, dict):
+        return False
+    return res.get("status") in CONGESTION or "banner" in str(res.get("detail", "")).lower()
+
+
+class AdaptiveLimit:
+    """
+    AIMD limit on devices in flight. Every clean result adds 1/limit (about
+    +1 per window of results) while success latency stays within
+    LATENCY_DRIFT of the baseline; a window with CONGESTION_RATE or more
+    congestion results halves the limit. Results from devices started before
+    the last halving are ignored so one overload isn't punished twice.
+    Changes are kept in `history`.
+    """
+
+    def __init__(self, label, start, ceiling=CONCURRENCY_CEIL):
+        self.label    = label
+        self.ceiling  = max(start, ceiling)
+        self.limit    = float(start)
+        self.baseline = None
+        self.ewma     = None
+        self.window   = []
+        self.last_cut = 0.0
+        self.t0       = time.monotonic()
+        self.history  = [(0.0, start, "start")]
+
+    @property
+    def current(self):
+        return int(self.limit)
+
+    def _set(self, limit, reason):
+        before     = self.current
+        self.limit = limit
+        if self.current != before:
+            self.history.append((time.monotonic() - self.t0, self.current, reason))
+
+    def observe(self, res, elapsed):
+        if time.monotonic() - elapsed < self.last_cut:
+            return
+        congested = _congested(res)
+        self.window.append(congested)
+        if len(self.window) < max(self.current, 5):
+            if not congested:
+                self._clean(elapsed)
+            return
+        bad, n      = sum(self.window), len(self.window)
+        self.window = []
+        if bad / n >= CONGESTION_RATE:
+            self._set(max(CONCURRENCY_FLOOR, self.limit / 2), f"{bad}/{n} congested")
+            self.last_cut = time.monotonic()
+        elif not congested:
+            self._clean(elapsed)
+
+    def _clean(self, elapsed):
+        self.ewma = elapsed if self.ewma is None else 0.8 * self.ewma + 0.2 * elapsed
+        if self.baseline is None:
+            self.baseline = elapsed
+        self.baseline = min(self.baseline, self.ewma)
+        if self.ewma <= self.baseline * LATENCY_DRIFT:
+            self._set(min(self.ceiling, self.limit + 1 / self.limit), "latency flat")
+
+    def summary(self):
+        """Start, each peak before a halving, each halving and the final limit."""
+        h     = self.history
+        keep  = [i for i in range(len(h))
+                 if i in (0, len(h) - 1) or h[i + 1][1] < h[i][1] or h[i][1] < h[i - 1][1]]
+        steps = " → ".join(f"{h[i][1]} @{h[i][0]:.0f}s" + (f" ({h[i][2]})" if "congested" in h[i][2] else "")
+                           for i in keep)
+        return f"{self.label}: {steps}"
+
+
+_limiters = {}
+
+
+def get_limiter(action_label):
+    """One limiter per action label, kept across menu actions in this session."""
+    if action_label not in _limiters:
+        start = CONCURRENCY
+        for key, limit in LABEL_CONCURRENCY.items():
+            if key in action_label:
+                start = limit
+        _limiters[action_label] = AdaptiveLimit(action_label, start)
+    limiter    = _limiters[action_label]
+    limiter.t0 = time.monotonic()
+    limiter.history = [(0.0, limiter.current, "start")]
+    return limiter
+
+
+def print_concurrency_summary(limiter):
+    if limiter is not None and len(limiter.history) > 1:
+        print(f"\n  Concurrency over time — {limiter.summary()}")
+
+
+# ── Fleet engine ──────────────────────────────────────────────────────────────
+async def _fleet_async(fn, ips, args, on_result, limit, limiter):
+    loop     = asyncio.get_running_loop()
+    slots    = asyncio.Condition()
+    running  = [0]
+    executor = ThreadPoolExecutor(max_workers=limiter.ceiling if limiter else limit)
+
+    def cap():
+        return limiter.current if limiter else limit
+
+    async def one(ip):
+        if asyncio.iscoroutinefunction(fn):
+            # Async workers multiplex their own waits and only use the
+            # executor for blocking steps
+            return ip, await fn(ip, *args, executor=executor)
+        async with slots:
+            await slots.wait_for(lambda: running[0] < cap())
+            running[0] += 1
+        start = time.monotonic()
+        try:
+            res = await loop.run_in_executor(executor, fn, ip, *args)
+        finally:
+            async with slots:
+                running[0] -= 1
+                slots.notify_all()
+        if limiter:
+            limiter.observe(res, time.monotonic() - start)
+        return ip, res
+
+    try:
+        for next_done in asyncio.as_completed([one(ip) for ip in ips]):
+            ip, res = await next_done
+            on_result(ip, res)
+    finally:
+        executor.shutdown(wait=True)
+
+
+def fleet_map(fn, ips, *args, on_result, limit=None, limiter=None):
+    """
+    Run fn(ip, *args) for every ip with at most `limit` (default CONCURRENCY)
+    in flight — or, with an AdaptiveLimit, however many it currently allows.
+    One asyncio loop schedules the whole fleet; the blocking paramiko work
+    runs in an executor. Coroutine functions are started for every ip at
+    once and get the executor as a keyword argument for their blocking steps.
+    on_result(ip, result) is called on the calling thread as each device finishes.
+    """
+    asyncio.run(_fleet_async(fn, list(ips), args, on_result, limit or CONCURRENCY, limiter))
+
+
+# ── Result journal ────────────────────────────────────────────────────────────
+JOURNAL_FSYNC_EVERY = 20    # records between fsyncs
+JOURNAL_FSYNC_SECS  = 2.0   # max seconds between fsyncs
+RESUME_PATH         = None  # set by --resume: next fleet run skips devices already done
+CSV_FIELDS          = ["ip", "status", "actions_ok", "actions_fail", "skipped", "detail", "timestamp"] + PHASE_FIELDS
+
+
+class ResultJournal:
+    """
+    Append-only JSONL log of device results, written as each device
+    completes so an interrupted run still records what was changed. Later
+    records for the same IP (retry, reboot verify) supersede earlier ones.
+    Each record is flushed immediately; fsync is batched.
+    """
+
+    def __init__(self, path, action_label):
+        self.path         = path
+        self.action_label = action_label
+        self._f           = open(path, "a")
+        self._unsynced    = 0
+        self._last_sync   = time.monotonic()
+
+    def append(self, result):
+        record = dict(result, detail=sanitize(result.get("detail", "")), action=self.action_label)
+        self._f.write(json.dumps(record) + "\n")
+        self._f.flush()
+        self._unsynced += 1
+        if (self._unsynced >= JOURNAL_FSYNC_EVERY
+                or time.monotonic() - self._last_sync >= JOURNAL_FSYNC_SECS):
+            self.sync()
+
+    def sync(self):
+        if self._unsynced:
+            os.fsync(self._f.fileno())
+        self._unsynced  = 0
+        self._last_sync = time.monotonic()
+
+    def close(self):
+        if not self._f.closed:
+            self.sync()
+            self._f.close()
+
+    @staticmethod
+    def load(path):
+        """Latest record per IP. A torn final line from a crash is ignored."""
+        latest = {}
+        with open(path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                latest[record["ip"]] = record
+        return latest
+
+
+def write_csv_from_journal(journal_path, csv_path):
+    """Render the CSV report from the journal. Returns the rows written."""
+    rows = sorted(ResultJournal.load(journal_path).values(), key=lambda x: x["ip"])
+    with open(csv_path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=CSV_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(rows)
+    return rows
+
+
+def _reboot_and_verify_fleet(reboot_ips, username, password, action_label, results, cmds=None,
+                             journal=None):
     """
     Reboot all devices in reboot_ips, wait for them to come back,
-    verify config, and update results in place.
+    verify config, and update results in place (and in the journal).
     """
     print(f"\n  Rebooting {len(reboot_ips)} device(s)...")
 
     # Send reboot to all in parallel
-    with ThreadPoolExecutor(max_workers=THREADS) as executor:
-        futures = {executor.submit(_reboot_nmc, ip, username, password): ip for ip in reboot_ips}
-        for future in as_completed(futures):
-            ip      = futures[future]
-            ok, msg = future.result()
-            tag     = "[REBOOT]  " if ok else "[REBOOT!] "
-            print(f"  {tag}{ip:20s}  {msg}")
+    def report_reboot(ip, outcome):
+        ok, msg = outcome
+        tag     = "[REBOOT]  " if ok else "[REBOOT!] "
+        print(f"  {tag}{ip:20s}  {msg}")
+
+    fleet_map(_reboot_nmc, reboot_ips, username, password, on_result=report_reboot)
 
     # Poll until responsive + verify config — no flat wait, poll handles timing
     print("\n  Polling devices and verifying configuration...\n")
     result_map = {r["ip"]: r for r in results}
 
-    verified_count = timeout_count = failed_count = 0
-
-    with ThreadPoolExecutor(max_workers=THREADS) as executor:
-        futures = {
-            executor.submit(_wait_and_verify, ip, username, password, action_label, 120): ip
-            for ip in reboot_ips
-        }
-        for future in as_completed(futures):
-            ip              = futures[future]
-            came_back, elapsed, verified, detail = future.result()
-            r               = result_map[ip]
-
-            if not came_back:
-                r["status"] = "REBOOT_TIMEOUT"
-                r["detail"] += " | REBOOT TIMEOUT — device did not respond"
-                print(f"  [TIMEOUT] {ip:20s}  Did not respond within timeout")
-                timeout_count += 1
-            elif verified:
-                r["status"] = "SUCCESS"
-                r["detail"] += f" | Reboot verified: {detail}"
-                print(f"  [VERIFIED]{ip:20s}  {detail}")
-                verified_count += 1
-            else:
-                r["status"] = "VERIFY_FAILED"
-                r["detail"] += f" | Reboot verify failed: {detail}"
-                print(f"  [VERIFY!] {ip:20s}  Verify failed: {detail}")
-                failed_count += 1
+    counts = {"verified": 0, "timeout": 0, "failed": 0}
+
+    def report_verify(ip, outcome):
+        came_back, elapsed, verified, detail = outcome
+        r = result_map[ip]
+
+        if not came_back:
+            r["status"] = "REBOOT_TIMEOUT"
+            r["detail"] += " | REBOOT TIMEOUT — device did not respond"
+            print(f"  [TIMEOUT] {ip:20s}  Did not respond within timeout")
+            counts["timeout"] += 1
+        elif verified:
+            r["status"] = "SUCCESS"
+            r["detail"] += f" | Reboot verified: {detail}"
+            print(f"  [VERIFIED]{ip:20s}  {detail}")
+            counts["verified"] += 1
+        else:
+            r["status"] = "VERIFY_FAILED"
+            r["detail"] += f" | Reboot verify failed: {detail}"
+            print(f"  [VERIFY!] {ip:20s}  Verify failed: {detail}")
+            counts["failed"] += 1
+        r["t_reboot"] = last_phase_total(ip, "reboot")
+        r["t_verify"] = last_phase_total(ip, "verify")
+        if journal:
+            journal.append(r)
 
-    print(f"\n  Verification complete — {verified_count} verified, {failed_count} failed, {timeout_count} timed out")
+    fleet_map(_wait_and_verify, reboot_ips, username, password, action_label, 120, cmds,
+              on_result=report_verify)
 
+    print(f"\n  Verification complete — {counts['verified']} verified, {counts['failed']} failed, "
+          f"{counts['timeout']} timed out")
 
-def _wait_and_verify(ip, username, password, action_label, timeout=60):
-    """Wait for device to come back then verify config. Returns (came_back, elapsed, verified, detail)."""
-    came_back, elapsed = _wait_for_device(ip, username, password, timeout=timeout)
+
+async def _wait_and_verify(ip, username, password, action_label, timeout=60, cmds=None, executor=None):
+    """
+    Wait for device to come back then verify config. cmds may be a per-device
+    dict (plan runs). Returns (came_back, elapsed, verified, detail).
+    """
+    if isinstance(cmds, dict):
+        cmds = cmds.get(ip)
+    came_back, elapsed = await _wait_for_device(ip, username, password, timeout=timeout, executor=executor)
     if not came_back:
         return False, elapsed, False, ""
-    verified, detail = _verify_config(ip, username, password, action_label)
+    loop = asyncio.get_running_loop()
+    verified, detail = await loop.run_in_executor(
+        executor, _verify_config, ip, username, password, action_label, cmds)
     return True, elapsed, verified, detail
 
 
-def execute_fleet(targets, username, password, cmds, action_label, dry_run):
-    ts         = datetime.now().strftime("%Y%m%d_%H%M%S")
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    csv_path   = os.path.join(script_dir, f"nmc2_{action_label}_{ts}.csv")
-
-    results          = []
-    success = partial = fail = 0
+def execute_fleet(targets, username, password, cmds, action_label, dry_run, auto_reboot=None,
+                  cmds_by_ip=None):
+    """
+    Run cmds against every target and write the CSV report.
+    auto_reboot: None prompts before rebooting cards that need it,
+    True reboots + verifies without asking, False never reboots.
+    cmds_by_ip: per-device commands from a saved plan (applied without
+    re-reading state). With --plan set, writes a plan instead of applying.
+    """
+    global RESUME_PATH
+    if PLAN_PATH and cmds_by_ip is None:
+        return plan_fleet(targets, username, password, cmds, action_label,
+                          _plan_path_for(action_label), auto_reboot)
+
+    ts           = datetime.now().strftime("%Y%m%d_%H%M%S")
+    script_dir   = os.path.dirname(os.path.abspath(__file__))
+    csv_path     = os.path.join(script_dir, f"nmc2_{action_label}_{ts}.csv")
+    journal_path = os.path.join(script_dir, f"nmc2_{action_label}_{ts}.jsonl")
+
+    results = []
+    reset_latency()
+    reset_phases()
+
+    # Resume — skip devices an earlier (interrupted) run already completed
+    resumed = 0
+    if RESUME_PATH:
+        prior = ResultJournal.load(RESUME_PATH)
+        actions = {r.get("action") for r in prior.values()}
+        if actions and actions != {action_label}:
+            print(f"[WARN] {RESUME_PATH} is for {', '.join(sorted(map(str, actions)))}, "
+                  f"not {action_label} — not resuming")
+        else:
+            journal_path = RESUME_PATH
+            done    = {ip for ip, r in prior.items() if r["status"] in ("SUCCESS", "ALREADY_SET")}
+            resumed = sum(1 for t in targets if t in done)
+            targets = [t for t in targets if t not in done]
+        RESUME_PATH = None
 
     print(f"[INFO] Targets : {len(targets)} device(s)")
-    print(f"[INFO] Threads : {THREADS}")
+    if resumed:
+        print(f"[INFO] Resumed : {resumed} device(s) already done in {journal_path}")
+    limiter = get_limiter(action_label) if ADAPTIVE else None
+    if limiter:
+        print(f"[INFO] Limit   : adaptive, starting at {limiter.current} device(s) in flight")
+    else:
+        print(f"[INFO] Limit   : {CONCURRENCY} device(s) in flight")
     print(f"[INFO] Action  : {action_label}")
+    if len(SESSIONS):
+        print(f"[INFO] Reusing : {len(SESSIONS)} live session(s) from earlier actions")
     if dry_run:
         print("[INFO] Mode    : DRY RUN — no changes will be made")
+    print(f"[INFO] Journal : {journal_path}")
     print(f"[INFO] Output  : {csv_path}\n")
 
-    with ThreadPoolExecutor(max_workers=THREADS) as executor:
-        futures = {
-            executor.submit(run_commands, ip, username, password, cmds, action_label, dry_run): ip
-            for ip in targets
-        }
-        for future in as_completed(futures):
-            r      = future.result()
-            status = r["status"]
-            detail = sanitize(r["detail"])
-            results.append(r)
-            if status in ("SUCCESS", "DRY_RUN", "ALREADY_SET"):
-                success += 1
-                print(f"  [OK]      {r['ip']:20s}  {detail}")
-            elif status == "SUCCESS_REBOOT":
-                success += 1
-                print(f"  [OK*]     {r['ip']:20s}  {detail}")
-            elif status == "PARTIAL":
-                partial += 1
-                print(f"  [PARTIAL] {r['ip']:20s}  {detail}")
-            elif status in ("SKIPPED_NMC1", "NO_RESPONSE"):
-                print(f"  [SKIP]    {r['ip']:20s}  {detail}")
-            else:
-                fail += 1
-                print(f"  [FAIL]    {r['ip']:20s}  {status}: {detail}")
+    journal = ResultJournal(journal_path, action_label)
+    try:
+        _run_fleet_pass(targets, username, password, cmds, action_label, dry_run, auto_reboot,
+                        cmds_by_ip, results, journal, limiter)
+    except KeyboardInterrupt:
+        journal.close()
+        print(f"\n  Interrupted — {len(results)} device result(s) saved to {journal_path}")
+        print(f"  Re-run the same action with --resume {journal_path} to skip completed devices.")
+        raise
+    finally:
+        journal.close()
+        IDENTITY.save()
+
+    # Render CSV from the journal (includes devices completed by a resumed run)
+    rows = write_csv_from_journal(journal_path, csv_path)
+
+    # Recalculate counters after potential status updates
+    success = sum(1 for r in rows if r["status"] in ("SUCCESS", "DRY_RUN", "ALREADY_SET"))
+    partial = sum(1 for r in rows if r["status"] == "PARTIAL")
+    skipped = sum(1 for r in rows if r["status"] in ("SKIPPED_NMC1", "NO_RESPONSE"))
+    fail    = sum(1 for r in rows if r["status"] not in (
+        "SUCCESS", "DRY_RUN", "ALREADY_SET", "PARTIAL", "SKIPPED_NMC1", "NO_RESPONSE", "SUCCESS_REBOOT"
+    ))
+
+    print_latency_summary()
+    print_phase_summary(action_label)
+    print_concurrency_summary(limiter)
+
+    print(f"\n{'=' * 60}")
+    print(f"  Complete : {success} success, {partial} partial, {fail} failed, {skipped} skipped")
+    print(f"  CSV      : {csv_path}")
+    print(f"  Journal  : {journal_path}")
+    print(f"{'=' * 60}")
+
+
+def _run_fleet_pass(targets, username, password, cmds, action_label, dry_run, auto_reboot,
+                    cmds_by_ip, results, journal, limiter):
+    """Main pass, partial retry and reboot/verify — every result is journaled as it lands."""
+    def report(ip, r):
+        status = r["status"]
+        detail = sanitize(r["detail"])
+        results.append(r)
+        journal.append(r)
+        if status in ("SUCCESS", "DRY_RUN", "ALREADY_SET"):
+            print(f"  [OK]      {r['ip']:20s}  {detail}")
+        elif status == "SUCCESS_REBOOT":
+            print(f"  [OK*]     {r['ip']:20s}  {detail}")
+        elif status == "PARTIAL":
+            print(f"  [PARTIAL] {r['ip']:20s}  {detail}")
+        elif status in ("SKIPPED_NMC1", "NO_RESPONSE"):
+            print(f"  [SKIP]    {r['ip']:20s}  {detail}")
+        else:
+            print(f"  [FAIL]    {r['ip']:20s}  {status}: {detail}")
+
+    if cmds_by_ip is None:
+        worker, worker_args = run_commands, (username, password, cmds, action_label, dry_run)
+    else:
+        def worker(ip):
+            return run_commands(ip, username, password, cmds_by_ip[ip], action_label, dry_run, planned=True)
+        worker_args = ()
+
+    fleet_map(worker, targets, *worker_args, on_result=report, limiter=limiter)
 
     reboot_devices = [r["ip"] for r in results if r["status"] == "SUCCESS_REBOOT"]
 
@@ -979,25 +2068,23 @@ def execute_fleet(targets, username, password, cmds, action_label, dry_run):
         print(f"\n  Retrying {len(partial_devices)} partial device(s) in 5s...")
         time.sleep(5)
         result_map = {r["ip"]: r for r in results}
-        with ThreadPoolExecutor(max_workers=THREADS) as executor:
-            futures = {
-                executor.submit(run_commands, ip, username, password, cmds, action_label, dry_run): ip
-                for ip in partial_devices
-            }
-            for future in as_completed(futures):
-                r      = future.result()
-                old_r  = result_map[r["ip"]]
-                detail = sanitize(r["detail"])
-                if r["status"] in ("SUCCESS", "ALREADY_SET"):
-                    old_r["status"] = r["status"]
-                    old_r["detail"] = r["detail"]
-                    print(f"  [RETRY OK] {r['ip']:20s}  {detail}")
-                elif r["status"] == "PARTIAL":
-                    print(f"  [RETRY FAIL] {r['ip']:18s}  {detail}")
-                else:
-                    old_r["status"] = r["status"]
-                    old_r["detail"] = r["detail"]
-                    print(f"  [RETRY FAIL] {r['ip']:18s}  {r['status']}: {detail}")
+
+        def report_retry(ip, r):
+            old_r  = result_map[r["ip"]]
+            detail = sanitize(r["detail"])
+            if r["status"] in ("SUCCESS", "ALREADY_SET"):
+                old_r["status"] = r["status"]
+                old_r["detail"] = r["detail"]
+                print(f"  [RETRY OK] {r['ip']:20s}  {detail}")
+            elif r["status"] == "PARTIAL":
+                print(f"  [RETRY FAIL] {r['ip']:18s}  {detail}")
+            else:
+                old_r["status"] = r["status"]
+                old_r["detail"] = r["detail"]
+                print(f"  [RETRY FAIL] {r['ip']:18s}  {r['status']}: {detail}")
+            journal.append(old_r)
+
+        fleet_map(worker, partial_devices, *worker_args, on_result=report_retry, limiter=limiter)
 
     # Offer reboot + verify for devices that need it
     if reboot_devices and not dry_run:
@@ -1006,41 +2093,189 @@ def execute_fleet(targets, username, password, cmds, action_label, dry_run):
         print(f"  NOTE: Reboots the NMC management card only —")
         print(f"        UPS stays online, outlets stay live throughout.")
         print(f"  After reboot, script will verify the config was applied.")
-        confirm = input(f"\n  Reboot and verify now? [y/N]: ").strip().lower()
+        if auto_reboot is None:
+            confirm = input(f"\n  Reboot and verify now? [y/N]: ").strip().lower()
+        else:
+            confirm = "y" if auto_reboot else "n"
         if confirm == "y":
-            _reboot_and_verify_fleet(reboot_devices, username, password, action_label, results)
+            _reboot_and_verify_fleet(reboot_devices, username, password, action_label, results,
+                                     cmds if cmds_by_ip is None else cmds_by_ip, journal)
         else:
             print("  Skipped — reboot manually via menu option 10 (System > Reboot NMC card)")
 
-    # Recalculate counters after potential status updates
-    success = sum(1 for r in results if r["status"] in ("SUCCESS", "DRY_RUN", "ALREADY_SET"))
-    partial = sum(1 for r in results if r["status"] == "PARTIAL")
-    skipped = sum(1 for r in results if r["status"] in ("SKIPPED_NMC1", "NO_RESPONSE"))
-    fail    = sum(1 for r in results if r["status"] not in (
-        "SUCCESS", "DRY_RUN", "ALREADY_SET", "PARTIAL", "SKIPPED_NMC1", "NO_RESPONSE", "SUCCESS_REBOOT"
-    ))
 
-    for r in results:
-        r["detail"] = sanitize(r["detail"])
+# ── Plan / apply ──────────────────────────────────────────────────────────────
+PLAN_PATH = None   # set by --plan: execute_fleet writes a plan instead of applying
+_plans_written = set()
 
-    with open(csv_path, "w", newline="") as f:
-        writer = csv.DictWriter(
-            f, fieldnames=["ip", "status", "actions_ok", "actions_fail", "skipped", "detail", "timestamp"]
-        )
-        writer.writeheader()
-        writer.writerows(sorted(results, key=lambda x: x["ip"]))
+
+def _plan_path_for(action_label):
+    """
+    Where this action's plan goes. The first plan of a run uses --plan as
+    given; later menu actions in the same run get the action label as a
+    suffix (PLAN_ftp_disable.json) so they never overwrite an earlier plan.
+    """
+    path = PLAN_PATH
+    if path in _plans_written:
+        base, ext = os.path.splitext(PLAN_PATH)
+        slug      = re.sub(r"[^A-Za-z0-9]+", "_", action_label).strip("_").lower() or "action"
+        path      = f"{base}_{slug}{ext or '.json'}"
+        n = 2
+        while path in _plans_written:
+            path = f"{base}_{slug}_{n}{ext or '.json'}"
+            n += 1
+    _plans_written.add(path)
+    return path
+
+# Secret-bearing commands — written to plans redacted and never applied from one
+_SECRET_CMD = re.compile(r"^__user_create__|\s-(pw|cp|a[1-4]|c[1-4])\s")
+
+
+def _plan_cmd(cmd, desc):
+    if not _SECRET_CMD.search(cmd):
+        return {"cmd": cmd, "desc": desc}
+    if cmd.startswith("__user_create__"):
+        redacted = f"__user_create__{cmd[len('__user_create__'):].split('||')[0]}||[REDACTED]"
+    else:
+        redacted = sanitize(cmd)
+    return {"cmd": redacted, "desc": desc, "redacted": True}
+
+
+def plan_device(ip, username, password, cmds):
+    """Read state and compute the pending commands for one device — changes nothing."""
+    entry  = {"status": "UNKNOWN", "detail": "", "generation": None, "pending": [], "skipped": 0}
+    client = None
+    try:
+        client, shell = SESSIONS.acquire(ip, username, password)
+        snap = get_snapshot(ip).attach(shell)
+        status, detail, pending, skipped = _prepare_cmds(snap, cmds)
+        if status in ("NO_RESPONSE", "SKIPPED_NMC1"):
+            SESSIONS.discard(ip, client)
+        else:
+            SESSIONS.release(ip, client, shell, username)
+            entry["generation"] = snap.generation()
+        entry["status"]  = status or "PENDING"
+        entry["detail"]  = detail or f"{len(pending)} pending, {len(skipped)} already set"
+        entry["pending"] = [_plan_cmd(c, d) for c, d in pending]
+        entry["skipped"] = len(skipped)
+    except Exception as e:
+        entry["status"], entry["detail"] = _error_status(e)
+        SESSIONS.discard(ip, client)
+    return entry
+
+
+def plan_fleet(targets, username, password, cmds, action_label, plan_path, auto_reboot=None):
+    """
+    Read state from every target concurrently, run the state filters, print a
+    fleet-wide diff and save it as JSON for a later --apply-plan run.
+    """
+    limiter = get_limiter(action_label) if ADAPTIVE else None
+    print(f"[INFO] Targets : {len(targets)} device(s)")
+    if limiter:
+        print(f"[INFO] Limit   : adaptive, starting at {limiter.current} device(s) in flight")
+    else:
+        print(f"[INFO] Limit   : {CONCURRENCY} device(s) in flight")
+    print(f"[INFO] Action  : {action_label}")
+    print("[INFO] Mode    : PLAN — reading state only, no changes will be made")
+    print(f"[INFO] Plan    : {plan_path}\n")
+
+    devices = {}
+
+    def report(ip, entry):
+        devices[ip] = entry
+        status = entry["status"]
+        if status == "PENDING":
+            print(f"  [PLAN]    {ip:20s}  {entry['detail']}")
+        elif status == "ALREADY_SET":
+            print(f"  [OK]      {ip:20s}  Compliant")
+        elif status in ("SKIPPED_NMC1", "NO_RESPONSE"):
+            print(f"  [SKIP]    {ip:20s}  {entry['detail']}")
+        else:
+            print(f"  [FAIL]    {ip:20s}  {status}: {sanitize(entry['detail'])}")
+
+    fleet_map(plan_device, targets, username, password, cmds, on_result=report, limiter=limiter)
+    IDENTITY.save()
+
+    pending_ips = sorted(ip for ip, e in devices.items() if e["status"] == "PENDING")
+    compliant   = sum(1 for e in devices.values() if e["status"] == "ALREADY_SET")
+    skipped     = sum(1 for e in devices.values() if e["status"] in ("SKIPPED_NMC1", "NO_RESPONSE"))
+    failed      = len(devices) - len(pending_ips) - compliant - skipped
+
+    if pending_ips:
+        print(f"\n{'─' * 60}\n  Pending changes:")
+        for ip in pending_ips:
+            print(f"\n    {ip}  ({devices[ip]['generation']})")
+            for c in devices[ip]["pending"]:
+                print(f"      + {c['desc']:48s}  ->  {sanitize(c['cmd'])}")
+
+        counts = {}
+        for ip in pending_ips:
+            for c in devices[ip]["pending"]:
+                counts[c["desc"]] = counts.get(c["desc"], 0) + 1
+        print("\n  Pending by setting:")
+        for desc, n in sorted(counts.items(), key=lambda kv_: -kv_[1]):
+            print(f"    {n:5d} card(s)  {desc}")
+
+    plan = {
+        "version":     1,
+        "created":     datetime.now().isoformat(timespec="seconds"),
+        "action":      action_label,
+        "auto_reboot": auto_reboot,
+        "devices":     {ip: devices[ip] for ip in sorted(devices)},
+    }
+    with open(plan_path, "w") as f:
+        json.dump(plan, f, indent=2)
+
+    print_concurrency_summary(limiter)
 
     print(f"\n{'=' * 60}")
-    print(f"  Complete : {success} success, {partial} partial, {fail} failed, {skipped} skipped")
-    print(f"  CSV      : {csv_path}")
+    print(f"  Plan     : {len(pending_ips)} card(s) to change "
+          f"({sum(len(devices[ip]['pending']) for ip in pending_ips)} commands), "
+          f"{compliant} already compliant, {failed} failed, {skipped} skipped")
+    print(f"  Saved    : {plan_path}")
+    print(f"  Apply    : --apply-plan {plan_path}")
     print(f"{'=' * 60}")
 
 
+def load_plan(path):
+    with open(path) as f:
+        plan = json.load(f)
+    if plan.get("version") != 1 or "devices" not in plan:
+        print(f"ERROR: {path} is not an NMC2 plan file.")
+        sys.exit(1)
+    return plan
+
+
+def apply_plan(plan, username, password, dry_run):
+    """Execute exactly the devices and commands recorded in a plan — no state re-read."""
+    cmds_by_ip = {
+        ip: [(c["cmd"], c["desc"]) for c in e["pending"]]
+        for ip, e in plan["devices"].items() if e["status"] == "PENDING" and e["pending"]
+    }
+    redacted = sorted(ip for ip, e in plan["devices"].items()
+                      if ip in cmds_by_ip and any(c.get("redacted") for c in e["pending"]))
+    if redacted:
+        print(f"  ERROR: Plan has secret-bearing commands for {len(redacted)} device(s) "
+              f"(e.g. {redacted[0]}). Secrets are never stored in plans —")
+        print("  run that action interactively instead.")
+        return
+    if not cmds_by_ip:
+        print("  Plan has no pending changes — nothing to apply.")
+        return
+
+    print(f"  Applying plan from {plan['created']} ({plan['action']}) to {len(cmds_by_ip)} device(s)\n")
+    execute_fleet(sorted(cmds_by_ip), username, password, None, plan["action"], dry_run,
+                  auto_reboot=plan.get("auto_reboot"), cmds_by_ip=cmds_by_ip)
+
+
 def _confirm_and_run(targets, nmc_user, nmc_pass, cmds, label, dry_run):
     if len(targets) > 1 and not dry_run:
         if not preflight(targets[0], nmc_user, nmc_pass):
             print("\n  Preflight failed. Check credentials and SSH access.")
             return
+        if PLAN_PATH:
+            execute_fleet(targets, nmc_user, nmc_pass, cmds, label, dry_run)
+            return
         confirm = input(f"\n  Preflight passed. Apply to all {len(targets)} devices? [y/N]: ").strip().lower()
         if confirm != "y":
             print("  Aborted.")
@@ -1048,6 +2283,409 @@ def _confirm_and_run(targets, nmc_user, nmc_pass, cmds, label, dry_run):
     execute_fleet(targets, nmc_user, nmc_pass, cmds, label, dry_run)
 
 
+# ── Desired-state profile ─────────────────────────────────────────────────────
+DESIRED_LABEL = "desired_state"
+
+
+def _on_off(value):
+    """Normalise enable/disable style profile values (YAML may parse on/off as bools)."""
+    if isinstance(value, bool):
+        return "enable" if value else "disable"
+    word = str(value).strip().lower()
+    if word in ("enable", "enabled", "on", "yes", "true"):
+        return "enable"
+    if word in ("disable", "disabled", "off", "no", "false"):
+        return "disable"
+    raise ValueError(f"expected enable/disable, got {value!r}")
+
+
+def load_desired_profile(path):
+    """Load a desired-state profile from YAML (needs PyYAML) or JSON."""
+    with open(path) as f:
+        if path.lower().endswith(".json"):
+            return json.load(f)
+        if yaml is None:
+            print("ERROR: PyYAML not installed. Run: pip install pyyaml (or use a .json profile)")
+            sys.exit(1)
+        return yaml.safe_load(f) or {}
+
+
+def build_desired_profile(profile, nmc_user):
+    """
+    Build one command list covering every area in a desired-state profile.
+    Example profile:
+
+        web:     {http: disable, https: enable, hsts: enable, min_protocol: TLS1.2}
+        cipher:  {dh: disable, aes: enable, ecdhe: enable, sha1: enable, sha2: enable}
+        console: {telnet: disable, ssh: enable}
+        ftp:     disable
+        snmpv1:  disable
+        snmpv3:  {state: enable, disable_profiles: [2, 3, 4]}
+        radius:  radiusLocal              # local | radiusLocal | radius
+        ipv6:    disable
+        ntp:     {state: enable, primary: 10.0.0.1, secondary: 10.0.0.2}
+        dns:     {primary: 10.0.0.53, secondary: 10.0.1.53, domain: example.com}
+        smtp:    {server: relay.example.com, port: 25, from_hostname_domain: example.com,
+                  encryption: ifavail, auth: disable}
+        users:   {session_timeout: 30, lockout_attempts: 3, lockout_duration: 5,
+                  subaccounts: {device: disable, readonly: disable}}
+        reboot:  true                     # reboot + verify cards that need it
+
+    Secrets (passwords, SNMPv3 passphrases) are deliberately not supported in
+    profiles — use the interactive menu for those.
+    """
+    cmds = []
+    web = profile.get("web") or {}
+    if "http" in web:
+        cmds.append((f"web -h {_on_off(web['http'])}", f"{_on_off(web['http']).capitalize()} HTTP"))
+    if "https" in web:
+        cmds.append((f"web -s {_on_off(web['https'])}", f"{_on_off(web['https']).capitalize()} HTTPS"))
+    if "hsts" in web:
+        cmds.append((f"web -hs {_on_off(web['hsts'])}", f"{_on_off(web['hsts']).capitalize()} HSTS"))
+    if web.get("min_protocol"):
+        tls = str(web["min_protocol"])
+        if tls not in ("SSL3.0", "TLS1.0", "TLS1.1", "TLS1.2"):
+            raise ValueError(f"web.min_protocol: invalid TLS version {tls!r}")
+        cmds.append((f"web -mp {tls}", f"Set minimum TLS version to {tls}"))
+
+    cipher_names = {"dh": "DH key exchange", "rsaau": "RSA authentication", "aes": "AES cipher",
+                    "ecdhe": "ECDHE key exchange", "sha1": "SHA1", "sha2": "SHA256"}
+    for key, value in (profile.get("cipher") or {}).items():
+        if key not in cipher_names:
+            raise ValueError(f"cipher.{key}: unknown cipher setting")
+        state = _on_off(value)
+        cmds.append((f"cipher -{key} {state}", f"{state.capitalize()} {cipher_names[key]}"))
+
+    console = profile.get("console") or {}
+    if "telnet" in console:
+        cmds.append((f"console -t {_on_off(console['telnet'])}", f"{_on_off(console['telnet']).capitalize()} Telnet"))
+    if "ssh" in console:
+        cmds.append((f"console -s {_on_off(console['ssh'])}", f"{_on_off(console['ssh']).capitalize()} SSH"))
+
+    if "ftp" in profile:
+        cmds.append((f"ftp -S {_on_off(profile['ftp'])}", f"{_on_off(profile['ftp']).capitalize()} FTP"))
+    if "snmpv1" in profile:
+        cmds.append((f"snmp -S {_on_off(profile['snmpv1'])}", f"{_on_off(profile['snmpv1']).capitalize()} SNMPv1"))
+
+    snmpv3 = profile.get("snmpv3") or {}
+    if "state" in snmpv3:
+        cmds.append((f"snmpv3 -S {_on_off(snmpv3['state'])}", f"{_on_off(snmpv3['state']).capitalize()} SNMPv3 globally"))
+    for n in snmpv3.get("disable_profiles") or []:
+        cmds += build_snmpv3_disable_profile({"profile": int(n)})
+
+    if profile.get("radius"):
+        mode = {"local": "local", "radiuslocal": "radiusLocal", "radius": "radius"}.get(str(profile["radius"]).lower())
+        if not mode:
+            raise ValueError(f"radius: expected local | radiusLocal | radius, got {profile['radius']!r}")
+        cmds.append((f"radius -a {mode}", f"Set auth: {mode}"))
+
+    if "ipv6" in profile:
+        cmds.append((f"tcpip6 -S {_on_off(profile['ipv6'])}", f"{_on_off(profile['ipv6']).capitalize()} IPv6"))
+
+    ntp = profile.get("ntp") or {}
+    if "state" in ntp:
+        cmds.append((f"ntp -e {_on_off(ntp['state'])}", f"{_on_off(ntp['state']).capitalize()} NTP"))
+    if ntp.get("primary"):
+        cmds.append((f"ntp -p {ntp['primary']}", "Set primary NTP server"))
+    if ntp.get("secondary"):
+        cmds.append((f"ntp -s {ntp['secondary']}", "Set secondary NTP server"))
+
+    dns = profile.get("dns") or {}
+    cmds += build_dns({"dns_primary": dns.get("primary"), "dns_secondary": dns.get("secondary"),
+                       "dns_domain": dns.get("domain")})
+
+    smtp = profile.get("smtp") or {}
+    if smtp.get("server"):
+        cmds.append((f"smtp -s {smtp['server']}", f"Set SMTP server to {smtp['server']}"))
+    if smtp.get("port"):
+        cmds.append((f"smtp -p {smtp['port']}", f"Set SMTP port to {smtp['port']}"))
+    if smtp.get("from"):
+        cmds.append((f"smtp -f {smtp['from']}", f"Set from address to {smtp['from']}"))
+    elif smtp.get("from_hostname_domain"):
+        domain = smtp["from_hostname_domain"]
+        cmds.append((f"__hostname_from__{domain}", f"Set from address to <hostname>@{domain}"))
+    if smtp.get("encryption"):
+        enc = str(smtp["encryption"]).lower()
+        if enc not in ("none", "ifavail", "always", "implicit"):
+            raise ValueError(f"smtp.encryption: invalid option {enc!r}")
+        cmds.append((f"smtp -e {enc}", f"Set encryption to {enc}"))
+    if "auth" in smtp:
+        cmds.append((f"smtp -a {_on_off(smtp['auth'])}", f"{_on_off(smtp['auth']).capitalize()} SMTP authentication"))
+
+    users = profile.get("users") or {}
+    if users.get("session_timeout"):
+        cmds += build_user_timeout({"nmc_user": nmc_user, "session_timeout": users["session_timeout"]})
+    if users.get("lockout_attempts"):
+        cmds.append((f"userdflt -la {users['lockout_attempts']}",
+                     f"Lock account after {users['lockout_attempts']} failed attempts"))
+    if users.get("lockout_duration"):
+        cmds.append((f"userdflt -lp {users['lockout_duration']}",
+                     f"Lockout duration: {users['lockout_duration']} min"))
+    for acct, value in (users.get("subaccounts") or {}).items():
+        cmds += build_user_subaccounts({"subaccounts": [acct], "subaccount_action": _on_off(value)})
+
+    return cmds
+
+
+def run_desired_profile(targets, nmc_user, nmc_pass, profile_path, dry_run):
+    """
+    Non-interactive desired-state run: one combined diff per card against a
+    single state snapshot, one session per card, at most one reboot per card.
+    """
+    profile = load_desired_profile(profile_path)
+    try:
+        cmds = build_desired_profile(profile, nmc_user)
+    except (ValueError, TypeError, AttributeError) as e:
+        print(f"ERROR: Invalid profile {profile_path}: {e}")
+        sys.exit(1)
+    if not cmds:
+        print("  Profile has no settings — nothing to run.")
+        return
+
+    preview_cmds(cmds)
+    if len(targets) > 1 and not dry_run:
+        if not preflight(targets[0], nmc_user, nmc_pass):
+            print("\n  Preflight failed. Check credentials and SSH access.")
+            return
+    execute_fleet(targets, nmc_user, nmc_pass, cmds, DESIRED_LABEL, dry_run,
+                  auto_reboot=bool(profile.get("reboot", False)))
+
+
+# ── Inventory ─────────────────────────────────────────────────────────────────
+INVENTORY_MAX_DELTAS = 30   # deltas after a full snapshot before the next full one
+_SECRET_KEY          = re.compile(r"community|secret|pass|phrase|key")
+
+
+def _inventory_value(setting, value):
+    """Normalise a value; secrets are stored as a short hash (still comparable)."""
+    value = " ".join(str(value).split())
+    if value and _SECRET_KEY.search(setting.rsplit(".", 1)[-1]):
+        return "sha256:" + hashlib.sha256(value.encode()).hexdigest()[:12]
+    return value
+
+
+def _flatten_state(snap):
+    """Every parsed section as {'section.key': value}; snmpv3 profiles as 'snmpv3.profile N.key'."""
+    flat = {}
+    for section in SNAPSHOT_SECTIONS:
+        for key, val in snap.section(section).items():
+            if key == "profiles":
+                for index, profile in val.items():
+                    for pkey, pval in profile.items():
+                        setting = f"{section}.profile {index}.{pkey}"
+                        flat[setting] = _inventory_value(setting, pval)
+            else:
+                flat[f"{section}.{key}"] = _inventory_value(f"{section}.{key}", val)
+    return flat
+
+
+def inventory_device(ip, username, password):
+    """Fresh full read of one card. Returns (status, settings dict or error detail)."""
+    client = None
+    try:
+        client, shell = SESSIONS.acquire(ip, username, password)
+        snap = get_snapshot(ip).attach(shell)
+        snap.invalidate()
+        if snap.generation() is None:
+            SESSIONS.discard(ip, client)
+            return "NO_RESPONSE", "Device connected but returned no output — may be mid-reboot"
+        snap.load_all()
+        flat = _flatten_state(snap)
+        SESSIONS.release(ip, client, shell, username)
+        return "OK", flat
+    except Exception as e:
+        SESSIONS.discard(ip, client)
+        return _error_status(e)
+
+
+class InventoryStore:
+    """
+    Fleet configuration history in one JSON file. A full snapshot stores one
+    dictionary-encoded column per setting (distinct values + a code per
+    device); later snapshots store only the cells that changed. The file also
+    keeps an index of the latest state by setting -> value -> IPs, so drift
+    queries are a lookup, not a replay or an SSH session.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            data = {"version": 1, "snapshots": [], "index": {}, "seen": {}}
+        self.snapshots = data["snapshots"]
+        self.index     = data["index"]
+        self.seen      = data["seen"]
+
+    def current(self):
+        """Replay full snapshot + deltas into {ip: {setting: value}}."""
+        state = {}
+        for snap in self.snapshots:
+            if snap["type"] == "full":
+                state = {ip: {} for ip in snap["devices"]}
+                for setting, col in snap["columns"].items():
+                    for ip, code in zip(snap["devices"], col["codes"]):
+                        if code is not None:
+                            state[ip][setting] = col["values"][code]
+            else:
+                for setting, cells in snap["changes"].items():
+                    for ip, value in cells.items():
+                        if value is None:
+                            state.get(ip, {}).pop(setting, None)
+                        else:
+                            state.setdefault(ip, {})[setting] = value
+        return state
+
+    def add(self, states, unreachable):
+        """
+        Record a new snapshot. states: {ip: settings} for cards read now;
+        unreachable cards keep their last known values. Returns the number of
+        changed cells (all cells for a full snapshot).
+        """
+        taken = datetime.now().isoformat(timespec="seconds")
+        state = self.current()
+        since_full = next((i for i, s in enumerate(reversed(self.snapshots)) if s["type"] == "full"), None)
+
+        if since_full is None or since_full >= INVENTORY_MAX_DELTAS:
+            merged  = {**state, **states}
+            devices = sorted(merged)
+            columns = {}
+            for setting in sorted({k for s in merged.values() for k in s}):
+                values = sorted({s[setting] for s in merged.values() if setting in s})
+                code   = {v: i for i, v in enumerate(values)}
+                columns[setting] = {"values": values,
+                                    "codes":  [code.get(merged[ip].get(setting)) for ip in devices]}
+            self.snapshots.append({"type": "full", "taken": taken, "devices": devices,
+                                   "columns": columns, "unreachable": sorted(unreachable)})
+            changed = sum(len(s) for s in states.values())
+        else:
+            changes = {}
+            for ip, settings in states.items():
+                before = state.get(ip, {})
+                for setting in settings.keys() | before.keys():
+                    if settings.get(setting) != before.get(setting):
+                        changes.setdefault(setting, {})[ip] = settings.get(setting)
+            self.snapshots.append({"type": "delta", "taken": taken, "changes": changes,
+                                   "unreachable": sorted(unreachable)})
+            changed = sum(len(c) for c in changes.values())
+
+        for ip in states:
+            self.seen[ip] = taken
+        self._reindex({**state, **states})
+        return changed
+
+    def _reindex(self, state):
+        index = {}
+        for ip, settings in state.items():
+            for setting, value in settings.items():
+                index.setdefault(setting, {}).setdefault(value, []).append(ip)
+        for values in index.values():
+            for ips in values.values():
+                ips.sort()
+        self.index = index
+
+    def save(self):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"version": 1, "snapshots": self.snapshots, "index": self.index, "seen": self.seen},
+                      f, separators=(",", ":"))
+        os.replace(tmp, self.path)
+
+    def settings(self, name):
+        """Settings matching name exactly, else every setting ending with it."""
+        name = name.strip().lower()
+        if name in self.index:
+            return [name]
+        return sorted(s for s in self.index if s.endswith(name))
+
+    def query(self, expr):
+        """
+        'setting=value' / 'setting!=value' -> {setting: {value: [ips]}} of matching
+        cards; a bare 'setting' returns every value.
+        """
+        m = re.fullmatch(r"\s*([^!=]+?)\s*(!=|=)\s*(.*?)\s*", expr)
+        name, op, want = (m.group(1), m.group(2), m.group(3).lower()) if m else (expr, None, None)
+        found = {}
+        for setting in self.settings(name):
+            values = self.index[setting]
+            if op is not None:
+                target = _inventory_value(setting, want)
+                values = {v: ips for v, ips in values.items() if (v == target) == (op == "=")}
+            if values:
+                found[setting] = values
+        return found
+
+    def drift(self):
+        """Changes recorded by the latest delta snapshot: {setting: {ip: value}}."""
+        if self.snapshots and self.snapshots[-1]["type"] == "delta":
+            return self.snapshots[-1]["changes"]
+        return {}
+
+
+def run_inventory(targets, username, password, store_path):
+    """Read every card's full state concurrently and add a snapshot to the store."""
+    store = InventoryStore(store_path)
+    print(f"[INFO] Targets : {len(targets)} device(s)")
+    print(f"[INFO] Mode    : INVENTORY — reading state only, no changes will be made")
+    print(f"[INFO] Store   : {store_path} ({len(store.snapshots)} earlier snapshot(s))\n")
+
+    states, unreachable = {}, []
+
+    def report(ip, outcome):
+        status, payload = outcome
+        if status == "OK":
+            states[ip] = payload
+            print(f"  [READ]    {ip:20s}  {len(payload)} settings")
+        else:
+            unreachable.append(ip)
+            print(f"  [FAIL]    {ip:20s}  {status}: {sanitize(payload)}")
+
+    fleet_map(inventory_device, targets, username, password, on_result=report,
+              limiter=get_limiter("inventory") if ADAPTIVE else None)
+    IDENTITY.save()
+
+    changed = store.add(states, unreachable)
+    store.save()
+    kind = store.snapshots[-1]["type"]
+    print(f"\n{'=' * 60}")
+    print(f"  Inventory : {len(states)} read, {len(unreachable)} unreachable (last known state kept)")
+    print(f"  Snapshot  : {kind}, {changed} setting value(s) {'stored' if kind == 'full' else 'changed'}")
+    print(f"  Store     : {store_path} ({os.path.getsize(store_path) / 1024:.0f} KiB, "
+          f"{len(store.snapshots)} snapshot(s))")
+    print(f"  Query     : --inventory {store_path} --query 'ftp.ftp=enabled'")
+    print(f"{'=' * 60}")
+
+
+def print_inventory_query(store_path, expr):
+    """Answer a drift query from the stored index — no SSH."""
+    store = InventoryStore(store_path)
+    if not store.snapshots:
+        print(f"ERROR: {store_path} has no snapshots yet — run --inventory with targets first.")
+        sys.exit(1)
+    print(f"\n  Inventory {store_path} — latest snapshot {store.snapshots[-1]['taken']}")
+
+    if expr.strip().lower() == "drift":
+        changes = store.drift()
+        print(f"  Changed since the previous snapshot: {sum(len(c) for c in changes.values())} value(s)")
+        for setting, cells in sorted(changes.items()):
+            for ip, value in sorted(cells.items()):
+                print(f"    {ip:20s} {setting:40s} -> {value if value is not None else '(removed)'}")
+        return
+
+    found = store.query(expr)
+    if not found:
+        print(f"  No cards match {expr!r}")
+        return
+    for setting, values in sorted(found.items()):
+        total = sum(len(ips) for ips in values.values())
+        print(f"\n  {setting} — {total} card(s)")
+        for value, ips in sorted(values.items(), key=lambda kv_: -len(kv_[1])):
+            print(f"    {len(ips):5d}  {value or '(empty)'}")
+            for ip in ips:
+                print(f"             {ip:20s} (read {store.seen.get(ip, '?')})")
+
+
 # ── Menu action functions ─────────────────────────────────────────────────────
 def action_web(targets, nmc_user, nmc_pass, dry_run):
     print("\n  HTTP / HTTPS Options:")
@@ -1789,40 +3427,109 @@ def main():
     parser.add_argument("-s", "--single", help="Single target IP")
     parser.add_argument("--dry-run", action="store_true",
                         help="Show what would be done without making changes")
-    parser.add_argument("--threads", type=int, default=20,
-                        help="Number of concurrent threads (default: 20, use 5-10 for SMTP)")
+    parser.add_argument("--profile", metavar="DESIRED.yaml",
+                        help="Apply a desired-state profile non-interactively (no menu)")
+    parser.add_argument("--plan", metavar="PLAN.json",
+                        help="Read real state concurrently and save a fleet-wide diff instead of applying "
+                             "(further actions in the same run save to PLAN_<action>.json)")
+    parser.add_argument("--apply-plan", metavar="PLAN.json",
+                        help="Apply the devices and commands in a saved plan without re-reading state")
+    parser.add_argument("--inventory", metavar="STORE.json",
+                        help="Snapshot every card's full state into STORE.json (or query it with --query)")
+    parser.add_argument("--query", metavar="EXPR",
+                        help="Query an --inventory store without connecting: 'setting=value', "
+                             "'setting!=value', 'setting' or 'drift'")
+    parser.add_argument("--resume", metavar="JOURNAL.jsonl",
+                        help="Resume an interrupted run — skip devices journaled as SUCCESS/ALREADY_SET")
+    parser.add_argument("--refresh-identity", action="store_true",
+                        help=f"Ignore cached card identity ({IDENTITY_FILE}) and re-read it from every card")
+    parser.add_argument("--pipeline", action="store_true",
+                        help=f"Send short commands in batches of up to {PASTE_CHUNK} bytes per transmission")
+    parser.add_argument("--concurrency", "--threads", dest="concurrency", type=int, default=20,
+                        help="Starting devices in flight (default: 20) — adapts up/down with device health")
+    parser.add_argument("--concurrency-for", metavar="LABEL=N", action="append", default=[],
+                        help="Starting limit for actions whose label contains LABEL (default: smtp=8)")
+    parser.add_argument("--fixed-concurrency", action="store_true",
+                        help="Keep --concurrency fixed instead of adapting it")
     args = parser.parse_args()
 
-    if args.single:
+    if args.query:
+        if not args.inventory:
+            print("ERROR: --query needs --inventory <store.json>.")
+            sys.exit(1)
+        print_inventory_query(args.inventory, args.query)
+        return
+
+    plan = None
+    if args.apply_plan:
+        plan    = load_plan(args.apply_plan)
+        targets = sorted(plan["devices"])
+    elif args.single:
         targets = [args.single]
     elif args.file:
         with open(args.file) as f:
             targets = [l.strip() for l in f if l.strip() and not l.startswith("#")]
     else:
-        print("ERROR: No targets specified. Use -f <targets.txt> or -s <ip>.")
+        print("ERROR: No targets specified. Use -f <targets.txt>, -s <ip> or --apply-plan <plan.json>.")
         sys.exit(1)
 
     print("\n" + "=" * 60)
     print("  NMC2 Management Tool")
     print("=" * 60)
-    global THREADS
-    THREADS = args.threads
+    global CONCURRENCY, PLAN_PATH, RESUME_PATH, ADAPTIVE, PIPELINE
+    CONCURRENCY = args.concurrency
+    PIPELINE    = args.pipeline
+    IDENTITY.refresh = args.refresh_identity
+    ADAPTIVE    = not args.fixed_concurrency
+    for spec in args.concurrency_for:
+        key, _, n = spec.partition("=")
+        if not n.isdigit() or int(n) < 1:
+            print(f"ERROR: --concurrency-for expects LABEL=N, got {spec!r}")
+            sys.exit(1)
+        LABEL_CONCURRENCY[key] = int(n)
+    PLAN_PATH   = args.plan
+    RESUME_PATH = args.resume
 
     print(f"  Targets : {len(targets)} device(s)")
     if args.dry_run:
         print("  Mode    : DRY RUN — no changes will be made")
-    if args.threads != 20:
-        print(f"  Threads : {args.threads}")
+    if args.plan:
+        print(f"  Mode    : PLAN — state is read, diff saved to {args.plan}, nothing applied")
+    if args.inventory:
+        print(f"  Mode    : INVENTORY — full state saved to {args.inventory}, nothing applied")
+    if args.pipeline:
+        print(f"  Sends   : pipelined (up to {PASTE_CHUNK} bytes per transmission)")
+    if args.fixed_concurrency:
+        print(f"  Limit   : {args.concurrency} device(s) in flight (fixed)")
+    elif args.concurrency != 20:
+        print(f"  Limit   : starting at {args.concurrency} device(s) in flight (adaptive)")
     print()
 
     nmc_user = input("  NMC username: ").strip()
     nmc_pass = getpass.getpass("  Current password: ")
 
+    if plan:
+        apply_plan(plan, nmc_user, nmc_pass, args.dry_run)
+        SESSIONS.close_all()
+        return
+
+    if args.inventory:
+        run_inventory(targets, nmc_user, nmc_pass, args.inventory)
+        SESSIONS.close_all()
+        return
+
+    if args.profile:
+        run_desired_profile(targets, nmc_user, nmc_pass, args.profile, args.dry_run)
+        SESSIONS.close_all()
+        return
+
     while True:
         print_menu()
         choice = input("\n  Select: ").strip().lower()
+        SESSIONS.evict_idle()
 
         if choice == "q":
+            SESSIONS.close_all()
             print("\n  Goodbye.\n")
             break
         elif choice in MENU_OPTIONS:
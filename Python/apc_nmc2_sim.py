@@ -0,0 +1,574 @@
+#!/usr/bin/env python3
+"""
+NMC2/NMC3 Simulator + Benchmark
+Local SSH simulator for APC NMC2 (sumx / sy) and NMC3 (su) cards, and a
+benchmark that runs apc_nmc2.execute_fleet against N simulated cards.
+
+Each simulated card listens on its own loopback address (127.1.x.y) so the
+tool sees distinct IPs. The simulator emulates the apc> prompt, E000/E001/
+E002/E101/E102 codes, 'about' per app module, web / cipher / smtp / user -l /
+system state (writes change it), and reboot — the card stops listening for
+--reboot-time seconds.
+
+Usage:
+    python3 apc_nmc2_sim.py serve -n 50 [--latency 0.2] [--rtt 0.1] [--banner-delay 0.5] [--max-sessions 2]
+    python3 apc_nmc2_sim.py bench -n 50 [--action web] [--concurrency 20] [--pipeline] [--repeat 2]
+"""
+
+import argparse
+import multiprocessing
+import os
+import queue
+import random
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+import logging
+logging.getLogger("paramiko").setLevel(logging.CRITICAL)
+
+try:
+    import paramiko
+except ImportError:
+    print("ERROR: paramiko not installed. Run: pip install paramiko")
+    sys.exit(1)
+
+SIM_PORT     = 2222
+SIM_USER     = "apc"
+SIM_PASS     = "apc"
+APP_MODULES  = ("sumx", "sy", "su")   # sumx / sy = NMC2, su = NMC3
+REBOOT_TIME  = 20                     # seconds a rebooting card refuses connections
+
+# Writes that report E002 (reboot required) — cipher changes apply on restart
+REBOOT_REQUIRED = ("cipher", "web -mp")
+
+# verb -> flag -> state key, for writes that change what the read shows
+WRITE_FLAGS = {
+    "web":    {"-h": "Http", "-s": "Https", "-hs": "Hsts", "-mp": "Minimum Protocol", "-cs": "Cipher Suite"},
+    "cipher": {"-dh": "DH", "-rsaau": "RSA Authentication", "-aes": "AES", "-ecdhe": "ECDHE",
+               "-sha1": "SHA", "-sha2": "SHA256", "-cs": "Cipher Suite"},
+    "smtp":   {"-s": "Server", "-p": "Port", "-f": "From", "-e": "Encryption", "-a": "Auth"},
+    "system": {"-n": "Name", "-c": "Contact", "-l": "Location"},
+}
+
+# Read-only sections with fixed content (verb -> "Key: value" lines)
+STATIC_SECTIONS = {
+    "console": {"Telnet": "disabled", "SSH": "enabled", "Telnet Port": "23", "SSH Port": "22"},
+    "ftp":     {"Ftp": "enabled", "Ftp Port": "21"},
+    "snmp":    {"SNMPv1": "disabled"},
+    "snmpv3":  {"SNMPv3": "disabled"},
+    "radius":  {"Access": "Local Only"},
+    "tcpip6":  {"IPv6": "enabled", "Auto Config": "enabled"},
+    "ntp":     {"NTP status": "disabled", "Primary NTP Server": "0.0.0.0"},
+    "dns":     {"Override Manual DNS": "disabled", "Primary DNS Server": "0.0.0.0"},
+}
+
+
+def _on_off(value):
+    return {"enable": "enabled", "disable": "disabled"}.get(value.lower(), value)
+
+
+# ── Simulated card ────────────────────────────────────────────────────────────
+class SimCard:
+    """State and command handling for one simulated NMC."""
+
+    def __init__(self, ip, app, index):
+        self.ip    = ip
+        self.app   = app
+        self.lock  = threading.Lock()
+        self.state = {
+            "web":    {"Http": "enabled", "Https": "enabled", "Hsts": "disabled",
+                       "Http Port": "80", "Https Port": "443", "Minimum Protocol": "TLS1.1"},
+            "cipher": {"DH": "enabled", "RSA Authentication": "enabled", "AES": "enabled",
+                       "ECDHE": "disabled", "SHA": "enabled", "SHA256": "disabled"},
+            "smtp":   {"From": f"nmc-{index}@example.com", "Server": "0.0.0.0", "Port": "25",
+                       "Auth": "disabled", "Encryption": "none"},
+            "system": {"Name": f"nmc-{index}", "Contact": "Unknown", "Location": "Unknown"},
+        }
+        self.users = {SIM_USER: "Enabled", "device": "Enabled", "readonly": "Disabled"}
+
+    def about(self):
+        nmc3 = self.app == "su"
+        return (
+            "Hardware Factory\r\n---------------\r\n"
+            f"Model Number:           {'AP9641' if nmc3 else 'AP9631'}\r\n"
+            f"Serial Number:          ZA{abs(hash(self.ip)) % 10**10:010d}\r\n"
+            "Hardware Revision:      05\r\n\r\n"
+            "Application Module\r\n---------------\r\n"
+            f"Name:                   \t{self.app}\r\n"
+            f"Version:                v{'2.5.0.8' if nmc3 else '7.1.4'}\r\n\r\n"
+            "APC OS(AOS)\r\n---------------\r\n"
+            "Name:                   \taos\r\n"
+            f"Version:                v{'2.5.0.6' if nmc3 else '7.1.2'}\r\n"
+        )
+
+    def handle(self, line):
+        """Return (code, body) for one command line."""
+        words = line.split()
+        if not words:
+            return None, ""
+        verb, args = words[0].lower(), words[1:]
+        with self.lock:
+            if verb == "about" and not args:
+                return "E000: Success", self.about()
+            if verb == "user":
+                return self._user(args)
+            if verb in ("ups",):
+                return "E001: Successfully Issued", ""
+            if verb in STATIC_SECTIONS:
+                if args:
+                    return "E000: Success", ""
+                return "E000: Success", _render(STATIC_SECTIONS[verb], verb)
+            if verb in self.state:
+                if not args:
+                    return "E000: Success", _render(self.state[verb], verb)
+                return self._write(verb, args, line)
+        return "E101: Command Not Found", ""
+
+    def _write(self, verb, args, line):
+        flags = WRITE_FLAGS[verb]
+        i = 0
+        while i < len(args):
+            key = flags.get(args[i])
+            if key is None or i + 1 >= len(args):
+                return "E102: Parameter Error", ""
+            # smtp -f and system -n/-c/-l take the rest of the line
+            value = " ".join(args[i + 1:]) if key in ("From", "Contact", "Location") else args[i + 1]
+            self.state[verb][key] = _on_off(value)
+            i += 2 if key not in ("From", "Contact", "Location") else len(args)
+        if line.lower().startswith(REBOOT_REQUIRED):
+            return "E002: Success, Reboot required for change to take effect", ""
+        return "E000: Success", ""
+
+    def _user(self, args):
+        if args == ["-l"]:
+            rows = "".join(f"{name:16s}{status:10s}Administrator\r\n" for name, status in self.users.items())
+            return "E000: Success", "User Name       Status    User Type\r\n" + rows
+        if "-n" in args and args.index("-n") + 1 < len(args):
+            name = args[args.index("-n") + 1]
+            self.users.setdefault(name, "Enabled")
+            if "-e" in args and args.index("-e") + 1 < len(args):
+                self.users[name] = _on_off(args[args.index("-e") + 1]).capitalize()
+            return "E000: Success", ""
+        if args[:1] == ["-del"] and len(args) > 1:
+            self.users.pop(args[1], None)
+            return "E000: Success", ""
+        if args[:1] in (["-st"], ["-lo"]) or "userdflt" in args:
+            return "E000: Success", ""
+        return "E102: Parameter Error", ""
+
+
+def _render(values, verb):
+    if verb == "cipher":
+        # NMC prints cipher settings as a column table
+        return "".join(f"{k:24s}{v}\r\n" for k, v in values.items())
+    return "".join(f"{k}:{' ' * max(1, 22 - len(k))}{v}\r\n" for k, v in values.items())
+
+
+# ── SSH server ────────────────────────────────────────────────────────────────
+class _ShellServer(paramiko.ServerInterface):
+    def __init__(self):
+        self.shell_ready = threading.Event()
+
+    def check_auth_password(self, username, password):
+        if username == SIM_USER and password == SIM_PASS:
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def get_allowed_auths(self, username):
+        return "password"
+
+    def check_channel_request(self, kind, chanid):
+        if kind == "session":
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_pty_request(self, *args):
+        return True
+
+    def check_channel_shell_request(self, channel):
+        self.shell_ready.set()
+        return True
+
+
+class _Wire:
+    """Outbound side of a session: delivers each send rtt seconds later, in order."""
+
+    def __init__(self, chan, rtt):
+        self.chan  = chan
+        self.rtt   = rtt
+        self.queue = queue.Queue()
+        self.pump  = threading.Thread(target=self._pump, daemon=True)
+        if rtt:
+            self.pump.start()
+
+    def send(self, text):
+        if not self.rtt:
+            self.chan.send(text)
+        else:
+            self.queue.put((time.monotonic() + self.rtt, text))
+
+    def _pump(self):
+        while True:
+            due, text = self.queue.get()
+            if text is None:
+                return
+            time.sleep(max(0.0, due - time.monotonic()))
+            try:
+                self.chan.send(text)
+            except Exception:
+                return
+
+    def flush(self):
+        if self.rtt:
+            self.queue.put((0.0, None))
+            self.pump.join(self.rtt + 5)
+
+
+class SimListener:
+    """Accept loop for one card. Enforces the session cap and reboot downtime."""
+
+    def __init__(self, card, host_key, port, latency, banner_delay, max_sessions, reboot_time, rtt=0.0):
+        self.card         = card
+        self.host_key     = host_key
+        self.port         = port
+        self.latency      = latency
+        self.rtt          = rtt
+        self.banner_delay = banner_delay
+        self.max_sessions = max_sessions
+        self.reboot_time  = reboot_time
+        self.active       = 0
+        self.lock         = threading.Lock()
+        self.sock         = None
+
+    def start(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((self.card.ip, self.port))
+        self.sock.listen(64)
+        threading.Thread(target=self._accept_loop, args=(self.sock,), daemon=True).start()
+
+    def reboot(self):
+        """Stop listening (connections are refused) and come back after reboot_time."""
+        sock, self.sock = self.sock, None
+        if sock:
+            sock.close()
+
+        def come_back():
+            time.sleep(self.reboot_time)
+            self.start()
+        threading.Thread(target=come_back, daemon=True).start()
+
+    def _accept_loop(self, sock):
+        while True:
+            try:
+                conn, _ = sock.accept()
+            except OSError:
+                return  # listener closed (reboot)
+            with self.lock:
+                full = self.active >= self.max_sessions
+                if not full:
+                    self.active += 1
+            if full:
+                conn.close()  # NMC drops sessions over its limit before the banner
+                continue
+            threading.Thread(target=self._session, args=(conn,), daemon=True).start()
+
+    def _session(self, conn):
+        transport = None
+        try:
+            if self.banner_delay:
+                time.sleep(self.banner_delay)
+            transport = paramiko.Transport(conn)
+            transport.add_server_key(self.host_key)
+            server = _ShellServer()
+            transport.start_server(server=server)
+            chan = transport.accept(20)
+            if chan is None or not server.shell_ready.wait(10):
+                return
+            chan.send("\r\nSchneider Electric            Network Management Card AOS\r\n"
+                      f"Name      : {self.card.state['system']['Name']}\r\n\r\napc>")
+            self._shell(chan)
+        except Exception:
+            pass
+        finally:
+            if transport:
+                transport.close()
+            conn.close()
+            with self.lock:
+                self.active -= 1
+
+    def _shell(self, chan):
+        wire = _Wire(chan, self.rtt)
+        try:
+            self._cli(chan, wire)
+        finally:
+            wire.flush()
+
+    def _cli(self, chan, wire):
+        buf = ""
+        reboot_pending = False
+        while True:
+            data = chan.recv(1024)
+            if not data:
+                return
+            text = data.decode("utf-8", errors="replace")
+            wire.send(text)  # echo, as the card does
+            buf += text
+            while "\n" in buf or "\r" in buf:
+                cut  = min(i for i in (buf.find("\n"), buf.find("\r")) if i >= 0)
+                line, buf = buf[:cut].strip(), buf[cut + 1:]
+                if self.latency:
+                    time.sleep(self.latency * random.uniform(0.5, 1.5))
+                if reboot_pending:
+                    reboot_pending = False
+                    if line == "YES":
+                        wire.send("\r\nE000: Success\r\nRebooting...\r\n")
+                        wire.flush()
+                        time.sleep(0.1)
+                        self.reboot()
+                        return
+                    wire.send("\r\nCancelled\r\napc>")
+                    continue
+                if line.lower() == "reboot":
+                    reboot_pending = True
+                    wire.send("\r\nEnter 'YES' to continue or <ENTER> to cancel : ")
+                    continue
+                if line.lower() in ("exit", "quit", "bye"):
+                    return
+                code, body = self.card.handle(line)
+                reply = f"\r\n{code}\r\n{body}" if code else "\r\n"
+                wire.send(reply + "apc>")
+
+
+def sim_ips(count):
+    return [f"127.1.{i // 250}.{i % 250 + 1}" for i in range(count)]
+
+
+def serve(count, port, latency, banner_delay, max_sessions, reboot_time, rtt=0.0, ready=None):
+    """Start count simulated cards and block forever."""
+    host_key = paramiko.ECDSAKey.generate()
+    for i, ip in enumerate(sim_ips(count)):
+        card = SimCard(ip, APP_MODULES[i % len(APP_MODULES)], i + 1)
+        SimListener(card, host_key, port, latency, banner_delay, max_sessions, reboot_time, rtt).start()
+    if ready is not None:
+        ready.set()
+    else:
+        print(f"[SIM] {count} card(s) on 127.1.x.y:{port} — user {SIM_USER} / {SIM_PASS}. Ctrl+C to stop.")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+
+
+# ── Benchmark ─────────────────────────────────────────────────────────────────
+BENCH_ACTIONS = {
+    "web": ("web_harden_all_safe", [
+        ("web -h disable",       "Disable HTTP (unencrypted web access off)"),
+        ("web -s enable",        "Enable HTTPS (encrypted web access on)"),
+        ("web -mp TLS1.2",       "Set minimum TLS version to TLS1.2"),
+        ("cipher -dh disable",   "Disable DH key exchange"),
+        ("cipher -aes enable",   "Enable AES cipher"),
+        ("cipher -ecdhe enable", "Enable ECDHE key exchange"),
+        ("cipher -sha1 enable",  "Enable SHA1"),
+        ("cipher -sha2 enable",  "Enable SHA256"),
+    ]),
+    "smtp": ("smtp_set_from_hostname", [
+        ("__hostname_from__example.com", "Set from address to <hostname>@example.com"),
+        ("smtp -s 10.0.0.25",            "Set SMTP server to 10.0.0.25"),
+    ]),
+    "users": ("user_subaccounts_disable", [
+        ("user -n device -e disable",   "Disable device account"),
+        ("user -n readonly -e disable", "Disable readonly account"),
+    ]),
+    "reboot": ("reboot_nmc", [
+        ("reboot__confirm", "Reboot NMC management card"),
+    ]),
+}
+
+
+class _Stats:
+    """Thread-safe accumulators for the benchmark."""
+
+    def __init__(self):
+        self.lock    = threading.Lock()
+        self.totals  = {}
+        self.devices = []
+
+    def add(self, key, seconds):
+        with self.lock:
+            self.totals[key] = self.totals.get(key, 0.0) + seconds
+
+    def device(self, seconds):
+        with self.lock:
+            self.devices.append(seconds)
+
+    def take(self):
+        """Return (totals, devices) collected so far and start over."""
+        with self.lock:
+            taken = self.totals, self.devices
+            self.totals, self.devices = {}, []
+        return taken
+
+
+class _SleepMeter:
+    """Stands in for apc_nmc2's time module so its sleeps are counted."""
+
+    def __init__(self, clock, stats):
+        self._clock = clock
+        self._stats = stats
+
+    def sleep(self, seconds):
+        start = time.perf_counter()
+        self._clock.sleep(seconds)
+        self._stats.add("sleep", time.perf_counter() - start)
+
+    def __getattr__(self, name):
+        return getattr(self._clock, name)
+
+
+def _instrument(nmc, stats):
+    """Wrap apc_nmc2's connect, channel reads, sleeps and per-device worker."""
+    connect, read_until, run_commands = nmc.connect, nmc._read_until, nmc.run_commands
+
+    def timed_connect(*args):
+        start = time.perf_counter()
+        try:
+            return connect(*args)
+        finally:
+            stats.add("connect", time.perf_counter() - start)
+
+    def timed_read(shell, done, timeout):
+        output, elapsed = read_until(shell, done, timeout)
+        stats.add("io", elapsed)
+        return output, elapsed
+
+    def timed_run(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return run_commands(*args, **kwargs)
+        finally:
+            stats.device(time.perf_counter() - start)
+
+    nmc.connect, nmc._read_until, nmc.run_commands = timed_connect, timed_read, timed_run
+    nmc.time = _SleepMeter(time, stats)
+
+
+def _pct(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def _wait_listening(ip, port, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection((ip, port), timeout=1).close()
+            return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def bench(args):
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import apc_nmc2 as nmc
+
+    ready = multiprocessing.Event()
+    sim   = multiprocessing.Process(
+        target=serve, daemon=True,
+        args=(args.count, args.port, args.latency, args.banner_delay,
+              args.max_sessions, args.reboot_time, args.rtt, ready))
+    sim.start()
+    ips = sim_ips(args.count)
+    if not ready.wait(60) or not _wait_listening(ips[-1], args.port):
+        print("ERROR: simulator did not start")
+        sys.exit(1)
+
+    nmc.SSH_PORT    = args.port
+    nmc.CONCURRENCY = args.concurrency
+    nmc.ADAPTIVE    = not args.fixed_concurrency
+    nmc.PIPELINE    = args.pipeline
+    # Simulated cards get new host keys each run — keep their identities out of the real cache
+    nmc.IDENTITY    = nmc.IdentityCache(os.path.join(tempfile.mkdtemp(), nmc.IDENTITY_FILE))
+    label, cmds     = BENCH_ACTIONS[args.action]
+    script_dir      = os.path.dirname(os.path.abspath(nmc.__file__))
+    before          = set(os.listdir(script_dir))
+
+    stats = _Stats()
+    _instrument(nmc, stats)
+    runs  = []
+    try:
+        for n in range(1, args.repeat + 1):
+            print(f"\n{'#' * 60}\n  Bench run {n}/{args.repeat} — {args.count} card(s), action {args.action}\n{'#' * 60}")
+            start = time.perf_counter()
+            nmc.execute_fleet(ips, SIM_USER, SIM_PASS, cmds, label, dry_run=False,
+                              auto_reboot=args.reboot_verify)
+            runs.append((time.perf_counter() - start, *stats.take()))
+    finally:
+        nmc.SESSIONS.close_all()
+        sim.terminate()
+        if not args.keep_reports:
+            for name in set(os.listdir(script_dir)) - before:
+                if name.startswith(f"nmc2_{label}_"):
+                    os.remove(os.path.join(script_dir, name))
+
+    print(f"\n{'=' * 60}")
+    print(f"  Benchmark — {args.count} card(s), action {args.action}, latency {args.latency}s, rtt {args.rtt}s, "
+          f"banner delay {args.banner_delay}s, {args.max_sessions} session(s)/card")
+    print(f"    {'run':>3s} {'wall':>7s} {'dev/s':>7s} {'p50':>7s} {'p95':>7s} {'max':>7s} "
+          f"{'sleep':>8s} {'io wait':>8s} {'connect':>8s} {'other':>8s}")
+    for n, (wall, t, devices) in enumerate(runs, 1):
+        d     = devices or [0.0]
+        busy  = sum(d)
+        other = max(0.0, busy - t.get("sleep", 0) - t.get("io", 0) - t.get("connect", 0))
+        print(f"    {n:3d} {wall:6.1f}s {len(devices) / wall:7.1f} {_pct(d, 50):6.2f}s {_pct(d, 95):6.2f}s "
+              f"{max(d):6.2f}s {t.get('sleep', 0):7.1f}s {t.get('io', 0):7.1f}s "
+              f"{t.get('connect', 0):7.1f}s {other:7.1f}s")
+    print("  sleep / io wait / connect are summed across devices (device-seconds); io wait is")
+    print("  time blocked on channel reads, connect is TCP + SSH handshake + first prompt.")
+    print(f"{'=' * 60}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="APC NMC2/NMC3 SSH simulator and apc_nmc2 benchmark")
+    sub    = parser.add_subparsers(dest="mode", required=True)
+    for name in ("serve", "bench"):
+        p = sub.add_parser(name)
+        p.add_argument("-n", "--count", type=int, default=20, help="Simulated cards (default: 20)")
+        p.add_argument("--port", type=int, default=SIM_PORT, help=f"SSH port (default: {SIM_PORT})")
+        p.add_argument("--latency", type=float, default=0.1,
+                       help="Mean per-command response latency in seconds (default: 0.1)")
+        p.add_argument("--rtt", type=float, default=0.0,
+                       help="Network round trip added to every reply in seconds (default: 0)")
+        p.add_argument("--banner-delay", type=float, default=0.0,
+                       help="Seconds before the SSH banner is sent (default: 0)")
+        p.add_argument("--max-sessions", type=int, default=2,
+                       help="Concurrent SSH sessions per card before new ones are dropped (default: 2)")
+        p.add_argument("--reboot-time", type=float, default=REBOOT_TIME,
+                       help=f"Seconds a card refuses connections after reboot (default: {REBOOT_TIME})")
+    b = sub.choices["bench"]
+    b.add_argument("--action", choices=sorted(BENCH_ACTIONS), default="web",
+                   help="Command set to run (default: web)")
+    b.add_argument("--concurrency", type=int, default=20, help="Starting devices in flight (default: 20)")
+    b.add_argument("--fixed-concurrency", action="store_true", help="Disable adaptive concurrency")
+    b.add_argument("--pipeline", action="store_true", help="Use apc_nmc2's pipelined sends")
+    b.add_argument("--repeat", type=int, default=1,
+                   help="Runs against the same cards — later runs hit ALREADY_SET and pooled sessions")
+    b.add_argument("--reboot-verify", action="store_true",
+                   help="Reboot cards that report E002 and verify them (default: skip the reboot)")
+    b.add_argument("--keep-reports", action="store_true", help="Keep the CSV/JSONL reports the runs write")
+    args = parser.parse_args()
+
+    if args.mode == "serve":
+        serve(args.count, args.port, args.latency, args.banner_delay, args.max_sessions, args.reboot_time,
+              args.rtt)
+    else:
+        bench(args)
+
+
+if __name__ == "__main__":
+    main()
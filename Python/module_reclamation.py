@@ -33,6 +33,8 @@ except ImportError:
     print("ERROR: netmiko is required.  Run:  pip install netmiko")
     sys.exit(1)
 
+from ssh_preflight import AUTH_CHECK_LIMIT, UNREACHABLE, AuthFailed, preflight, sweep
+
 
 # ---------------------------------------------------------------------------
 # Module PID database
@@ -291,13 +293,7 @@ def check_optic(optic: dict, intf_status: dict) -> dict:
 # SSH data collection
 # ---------------------------------------------------------------------------
 
-def collect(host: str, username: str, password: str,
-            timeout: int) -> dict:
-    """
-    SSH to a single device and collect inventory + interface data.
-    All status messages are returned in the result dict so the caller
-    can print them in order (thread-safe buffered output).
-    """
+def connect(host: str, username: str, password: str, timeout: int):
     device = {
         "device_type":          "cisco_ios",
         "host":                 host,
@@ -306,8 +302,21 @@ def collect(host: str, username: str, password: str,
         "timeout":              timeout,
         "global_delay_factor":  2,
     }
+    return ConnectHandler(**device)
+
+
+def collect(host: str, username: str, password: str,
+            timeout: int, conn=None) -> dict:
+    """
+    SSH to a single device and collect inventory + interface data.
+    All status messages are returned in the result dict so the caller
+    can print them in order (thread-safe buffered output).
+    conn is an already-open session to use instead of connecting.
+    """
     try:
-        with ConnectHandler(**device) as conn:
+        if conn is None:
+            conn = connect(host, username, password, timeout)
+        with conn:
             hostname   = conn.find_prompt().rstrip("#>").strip()
             raw_inv    = conn.send_command("show inventory",          read_timeout=60)
             raw_status = conn.send_command("show ip interface brief", read_timeout=60)
@@ -589,35 +598,41 @@ def main():
             print(output, end="")
         all_results.append(result)
 
-    # ── Credential check — test first reachable host before full run ──────
-    # If the first host times out, try the next one until we get a definitive
-    # auth success or failure. Abort immediately on auth failure.
-    auth_verified = False
-    preflight_result = None
-    preflight_host = None
-
-    for candidate in hosts[:5]:  # try up to first 5 hosts
-        print(f"  Verifying credentials against {candidate}...", end="", flush=True)
-        test = collect(candidate, username, password, args.timeout)
-        if test["error"] == "Authentication failed":
-            print(f"\n\n  ERROR: Authentication failed on {candidate}."
-                  "\n  Please re-run with the correct credentials.\n")
-            sys.exit(1)
-        elif test["error"]:
-            print(f" unreachable ({test['error']}), trying next...")
-            continue
-        else:
-            print(" OK\n")
-            auth_verified = True
-            preflight_result = test
-            preflight_host = candidate
-            break
-
-    if not auth_verified:
-        print("\n  ERROR: Could not reach any of the first 5 hosts.")
+    # ── Reachability pre-sweep — TCP/22 on every host at once ──────────────
+    # Unreachable hosts go straight into the results (and the CSV) instead
+    # of each tying up a worker for a full SSH timeout.
+    print(f"  Probing TCP/22 on {len(hosts)} host(s)...")
+    hosts, unreachable = sweep(hosts)
+    for host in unreachable:
+        counter[0] += 1
+        print(f"[{counter[0]}/{total}] {host}\n  [{host}] ERROR: {UNREACHABLE}")
+        all_results.append({"host": host, "error": UNREACHABLE})
+
+    if not hosts:
+        print("\n  ERROR: No hosts answered on TCP/22.\n")
+        write_csv(all_results, csv_path)
+        sys.exit(1)
+
+    # ── Credential check — probe the first hosts concurrently on TCP/22 ────
+    # Authenticate against the first one whose port answers; its session is
+    # reused for that host's collection. Abort immediately on auth failure.
+    print(f"  Verifying credentials (probing up to {AUTH_CHECK_LIMIT} hosts)...", end="", flush=True)
+    try:
+        preflight_host, conn = preflight(
+            hosts, lambda h: connect(h, username, password, args.timeout))
+    except AuthFailed as e:
+        print(f"\n\n  ERROR: Authentication failed on {e.host}."
+              "\n  Please re-run with the correct credentials.\n")
+        sys.exit(1)
+
+    if not preflight_host:
+        print(f"\n  ERROR: Could not reach any of the first {AUTH_CHECK_LIMIT} hosts.")
         print("  Check connectivity or your switches.txt list and try again.\n")
         sys.exit(1)
 
+    print(f" OK ({preflight_host})\n")
+    preflight_result = collect(preflight_host, username, password, args.timeout, conn)
+
     # If preflight succeeded, reuse that result and skip re-SSHing that host
     remaining = [h for h in hosts if h != preflight_host] if preflight_host else hosts
     if preflight_result:
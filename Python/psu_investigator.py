@@ -35,6 +35,8 @@ logging.getLogger("paramiko").setLevel(logging.CRITICAL)
 from netmiko import ConnectHandler
 from netmiko.exceptions import NetmikoAuthenticationException, NetmikoTimeoutException
 
+from ssh_preflight import UNREACHABLE, AuthFailed, preflight, sweep
+
 # ─────────────────────────────────────────────────────────────────────────────
 # Constants
 # ─────────────────────────────────────────────────────────────────────────────
@@ -977,17 +979,24 @@ def _build_result(base: dict, hostname: str, model: str, psu_data: dict,
     return base
 
 
-def check_device(host: str, username: str, password: str) -> list:
-    """Returns a list of result dicts — usually one, two for multi-chassis C9606R."""
+def connect(host: str, username: str, password: str):
+    return ConnectHandler(
+        device_type="cisco_ios",
+        host=host,
+        username=username,
+        password=password,
+        timeout=SSH_TIMEOUT,
+    )
+
+
+def check_device(host: str, username: str, password: str, conn=None) -> list:
+    """
+    Returns a list of result dicts — usually one, two for multi-chassis C9606R.
+    conn is an already-open session to reuse (the credential preflight's).
+    """
     base = _make_base(host)
     try:
-        conn = ConnectHandler(
-            device_type="cisco_ios",
-            host=host,
-            username=username,
-            password=password,
-            timeout=SSH_TIMEOUT,
-        )
+        conn = conn or connect(host, username, password)
         conn.enable()
 
         ver_out    = conn.send_command("show version",           read_timeout=30)
@@ -1176,36 +1185,26 @@ def write_csv(results: list[dict], path: str) -> None:
 # ─────────────────────────────────────────────────────────────────────────────
 # Credential validation
 # ─────────────────────────────────────────────────────────────────────────────
-def validate_credentials(targets: list[str], username: str, password: str) -> None:
+def validate_credentials(targets: list[str], username: str, password: str) -> tuple:
     """
-    Try up to AUTH_CHECK_LIMIT targets in order.
-    - First successful auth → continue.
-    - Auth failure on any reachable switch → exit immediately.
-    - All attempted targets unreachable → warn and continue.
+    Probe up to AUTH_CHECK_LIMIT targets concurrently on TCP/22.
+    - First reachable switch authenticates → continue, returning (host, session)
+      so the main run reuses the session.
+    - Auth failure → exit immediately.
+    - All probed targets unreachable → warn and continue with (None, None).
     """
-    print(f"\n  Verifying credentials (checking up to {AUTH_CHECK_LIMIT} switches)...")
-    attempted = 0
-    for host in targets[:AUTH_CHECK_LIMIT]:
-        attempted += 1
-        try:
-            conn = ConnectHandler(
-                device_type="cisco_ios",
-                host=host,
-                username=username,
-                password=password,
-                timeout=SSH_TIMEOUT,
-            )
-            conn.disconnect()
-            print(f"  [✓] Credentials OK (verified against {host})\n")
-            return
-        except NetmikoAuthenticationException:
-            print(f"  [✗] Authentication failed against {host} — bad username/password.")
-            sys.exit(1)
-        except Exception:
-            print(f"  [!] {host} unreachable, trying next...")
-            continue
+    print(f"\n  Verifying credentials (probing up to {AUTH_CHECK_LIMIT} switches)...")
+    try:
+        host, conn = preflight(targets, lambda h: connect(h, username, password), AUTH_CHECK_LIMIT)
+    except AuthFailed as e:
+        print(f"  [✗] Authentication failed against {e.host} — bad username/password.")
+        sys.exit(1)
 
-    print(f"  [!] None of the first {attempted} switches responded — proceeding anyway.\n")
+    if host:
+        print(f"  [✓] Credentials OK (verified against {host})\n")
+    else:
+        print(f"  [!] None of the first {min(len(targets), AUTH_CHECK_LIMIT)} switches responded — proceeding anyway.\n")
+    return host, conn
 
 
 # ─────────────────────────────────────────────────────────────────────────────
@@ -1234,7 +1233,12 @@ def main() -> None:
             sys.exit(1)
 
     print(f"\n  PSU Investigator")
-    print(f"  Targets : {len(targets)} switch(es)")
+
+    # Reachability pre-sweep — dead switches are reported now and never
+    # take a worker thread through a full SSH timeout.
+    print(f"  Probing TCP/22 on {len(targets)} switch(es)...")
+    targets, unreachable = sweep(targets)
+    print(f"  Targets : {len(targets)} switch(es)" + (f" ({len(unreachable)} unreachable)" if unreachable else ""))
     print(f"  Threads : {args.threads}")
 
     username = input("\n  Username: ").strip()
@@ -1242,17 +1246,25 @@ def main() -> None:
 
     # Always validate credentials against the first reachable switch before
     # launching the thread pool — regardless of whether -f or -s was used.
-    validate_credentials(targets, username, password)
+    preflight_host, preflight_conn = validate_credentials(targets, username, password)
+    sessions = {preflight_host: preflight_conn} if preflight_host else {}
 
     all_results: list[dict] = []
     counter     = [0]
-    total       = len(targets)
+    total       = len(targets) + len(unreachable)
+
+    for host in unreachable:
+        base = _make_base(host)
+        base["error"] = UNREACHABLE
+        counter[0] += 1
+        safe_print(format_result(base, counter[0], total))
+        all_results.append(base)
 
     print(f"[→] Checking {total} device(s)...\n")
 
     with ThreadPoolExecutor(max_workers=args.threads) as executor:
         future_map = {
-            executor.submit(check_device, host, username, password): host
+            executor.submit(check_device, host, username, password, sessions.pop(host, None)): host
             for host in targets
         }
         for future in as_completed(future_map):
@@ -0,0 +1,169 @@
+"""
+ssh_preflight.py — shared startup checks for the Netmiko-based tools
+
+Imported by the Netmiko tools in this folder (and Rogue_Switch_Hunter one
+level down) — keep it next to them. Not meant to be run directly.
+
+  probe_tcp  Non-blocking TCP connects to many hosts at once; yields each
+             host as soon as its port answers, refuses, or times out.
+  sweep      Pre-sweep of a whole inventory: splits it into reachable and
+             unreachable hosts within roughly one probe timeout, so dead
+             switches never reach the SSH worker pools.
+  preflight  Credential check: probes the first few targets concurrently,
+             authenticates against the first open one that accepts SSH, and
+             hands the live session back so the main run can reuse it.
+"""
+
+import errno
+import selectors
+import socket
+import time
+from typing import Callable, Iterator, Optional
+
+from netmiko.exceptions import NetmikoAuthenticationException
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Constants
+# ─────────────────────────────────────────────────────────────────────────────
+SSH_PORT          = 22
+PROBE_TIMEOUT     = 3.0    # seconds a TCP connect may take before the host counts as down
+AUTH_CHECK_LIMIT  = 5      # preflight probes this many targets
+MAX_OPEN_SOCKETS  = 4096   # in-flight connect cap; also bounded by the process fd limit
+FD_HEADROOM       = 128    # descriptors left free for logs, CSVs and SSH sessions
+UNREACHABLE       = "TCP/22 unreachable (pre-sweep)"
+CONNECT_PENDING   = {0, errno.EINPROGRESS, errno.EWOULDBLOCK, getattr(errno, "WSAEWOULDBLOCK", errno.EWOULDBLOCK)}
+
+
+class AuthFailed(Exception):
+    """Raised by preflight when a reachable switch rejects the credentials."""
+
+    def __init__(self, host: str):
+        super().__init__(f"Authentication failed on {host}")
+        self.host = host
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# TCP probe
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _start_connect(host: str, port: int) -> Optional[socket.socket]:
+    """Begin a non-blocking connect. None if the name doesn't resolve or the connect fails outright."""
+    try:
+        family, socktype, proto, _, addr = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)[0]
+        sock = socket.socket(family, socktype, proto)
+    except OSError:
+        return None
+    sock.setblocking(False)
+    if sock.connect_ex(addr) not in CONNECT_PENDING:
+        sock.close()
+        return None
+    return sock
+
+
+def _socket_budget() -> int:
+    """
+    How many connects may be in flight. Raises the soft fd limit towards the
+    hard one where the platform allows it (no resource module on Windows).
+    """
+    try:
+        import resource
+    except ImportError:
+        return 512
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    want = MAX_OPEN_SOCKETS + FD_HEADROOM
+    if soft != resource.RLIM_INFINITY and soft < want:
+        target = want if hard == resource.RLIM_INFINITY else min(want, hard)
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+            soft = target
+        except (ValueError, OSError):
+            pass
+    if soft == resource.RLIM_INFINITY:
+        return MAX_OPEN_SOCKETS
+    return max(16, min(MAX_OPEN_SOCKETS, soft - FD_HEADROOM))
+
+
+def probe_tcp(hosts: list[str], port: int = SSH_PORT,
+              timeout: float = PROBE_TIMEOUT) -> Iterator[tuple[str, bool]]:
+    """
+    Yield (host, is_open) for every host, in the order the answers arrive.
+    Connects are in flight together (up to the socket budget), each with its
+    own timeout, so a list of dead hosts costs one timeout window rather than
+    one per host. Stopping the iteration early closes the rest.
+    """
+    budget   = _socket_budget()
+    sel      = selectors.DefaultSelector()
+    queue    = list(reversed(hosts))
+    inflight: dict[socket.socket, tuple[str, float]] = {}
+
+    try:
+        while queue or inflight:
+            while queue and len(inflight) < budget:
+                host = queue.pop()
+                sock = _start_connect(host, port)
+                if sock is None:
+                    yield host, False
+                    continue
+                inflight[sock] = (host, time.monotonic() + timeout)
+                sel.register(sock, selectors.EVENT_WRITE)
+            if not inflight:
+                continue
+
+            wait_for = max(0.0, min(deadline for _, deadline in inflight.values()) - time.monotonic())
+            for key, _ in sel.select(wait_for):
+                sock = key.fileobj
+                host, _ = inflight.pop(sock)
+                sel.unregister(sock)
+                is_open = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR) == 0
+                sock.close()
+                yield host, is_open
+
+            now = time.monotonic()
+            for sock, (host, deadline) in list(inflight.items()):
+                if deadline <= now:
+                    del inflight[sock]
+                    sel.unregister(sock)
+                    sock.close()
+                    yield host, False
+    finally:
+        for sock in inflight:
+            sock.close()
+        sel.close()
+
+
+def sweep(hosts: list[str], port: int = SSH_PORT,
+          timeout: float = PROBE_TIMEOUT) -> tuple[list[str], list[str]]:
+    """
+    Probe every host's SSH port in parallel.
+    Returns (reachable, unreachable), both in inventory order.
+    """
+    answered = {host for host, is_open in probe_tcp(hosts, port, timeout) if is_open}
+    return ([h for h in hosts if h in answered],
+            [h for h in hosts if h not in answered])
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Credential preflight
+# ─────────────────────────────────────────────────────────────────────────────
+
+def preflight(hosts: list[str], connect: Callable[[str], object],
+              limit: int = AUTH_CHECK_LIMIT) -> tuple[Optional[str], object]:
+    """
+    Probe TCP/22 on the first `limit` hosts concurrently, then call
+    connect(host) on the open ones in the order they answered, falling
+    through to the next if the SSH session itself fails. The probe finishes
+    first: pausing it for an SSH attempt would let every other in-flight
+    connect run past its deadline and count as down.
+    Returns (host, session) — the caller owns the session and should reuse
+    it for that host — or (None, None) if none of them could be reached.
+    Raises AuthFailed on the first credential rejection.
+    """
+    open_hosts = [host for host, is_open in probe_tcp(hosts[:limit]) if is_open]
+    for host in open_hosts:
+        try:
+            return host, connect(host)
+        except NetmikoAuthenticationException:
+            raise AuthFailed(host) from None
+        except Exception:
+            continue
+    return None, None
@@ -31,6 +31,8 @@ except ImportError:
     print("[ERROR] netmiko not installed. Run: pip install netmiko")
     sys.exit(1)
 
+from ssh_preflight import sweep
+
 
 # ---------------------------------------------------------------------------
 # Data structures
@@ -173,16 +175,8 @@ def parse_poe_inline(output: str, switch_num: int) -> tuple[float, float]:
 # Device interrogation
 # ---------------------------------------------------------------------------
 
-def interrogate_device(ip: str, username: str, password: str,
-                        ssh_port: int = 22) -> FeasibilityResult:
-    log = []
-    def lprint(msg): log.append(msg)
-    def flush_log():
-        with _print_lock:
-            for line in log:
-                print(line)
-
-    result = FeasibilityResult(
+def empty_result(ip: str) -> FeasibilityResult:
+    return FeasibilityResult(
         target_ip=ip,
         hostname="",
         is_stack=False,
@@ -204,6 +198,18 @@ def interrogate_device(ip: str, username: str, password: str,
         notes="",
     )
 
+
+def interrogate_device(ip: str, username: str, password: str,
+                        ssh_port: int = 22) -> FeasibilityResult:
+    log = []
+    def lprint(msg): log.append(msg)
+    def flush_log():
+        with _print_lock:
+            for line in log:
+                print(line)
+
+    result = empty_result(ip)
+
     device = {
         "device_type": "cisco_ios",
         "host": ip,
@@ -471,6 +477,18 @@ def main():
         print("[ERROR] No targets provided.")
         sys.exit(1)
 
+    # Reachability pre-sweep — unreachable switches go straight into the
+    # report instead of each burning a worker on a 30s SSH timeout.
+    print(f"[→] Probing TCP/{args.port} on {len(targets)} device(s)...")
+    targets, unreachable = sweep(targets, args.port)
+    results = []
+    for ip in unreachable:
+        result = empty_result(ip)
+        result.tier = "ERROR"
+        result.error = f"TCP/{args.port} unreachable (pre-sweep)"
+        print(f"  [✗] {ip}: unreachable")
+        results.append(result)
+
     username = args.username or input("SSH Username: ").strip()
     password = getpass.getpass("SSH Password: ")
 
@@ -504,8 +522,6 @@ def main():
 
     print(f"[→] Assessing {len(targets)} device(s)...\n")
 
-    results = []
-
     from concurrent.futures import ThreadPoolExecutor, as_completed
     with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
         futures = {